@@ -1,9 +1,47 @@
 import os
 from celery import Celery
+from celery.signals import celeryd_init
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Django_CookBook.settings")
 
+# Профили воркеров по очередям (маршруты задач — CELERY_TASK_ROUTES):
+#   CELERY_WORKER_PROFILE=heavy celery -A Django_CookBook worker
+# Параметры командной строки (-Q, -c, --prefetch-multiplier) важнее профиля
+WORKER_PROFILES = {
+    # Ожидание SMTP: много процессов и небольшой запас сообщений
+    "email": {
+        "queues": ["email"],
+        "worker_concurrency": 8,
+        "worker_prefetch_multiplier": 4,
+    },
+    # Короткие задачи по расписанию; без запаса, чтобы долгая задача
+    # не задерживала уже полученные
+    "maintenance": {
+        "queues": ["maintenance", "default"],
+        "worker_concurrency": 2,
+        "worker_prefetch_multiplier": 1,
+    },
+    # Пересборки по всему каталогу: по одной, процесс перезапускается,
+    # чтобы вернуть память
+    "heavy": {
+        "queues": ["heavy"],
+        "worker_concurrency": 1,
+        "worker_prefetch_multiplier": 1,
+        "worker_max_tasks_per_child": 10,
+    },
+}
+
 app = Celery("app")
 
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+profile = WORKER_PROFILES.get(os.getenv("CELERY_WORKER_PROFILE", ""), {})
+# Настройки воркера читаются при разборе командной строки — до сигналов
+app.conf.update({key: value for key, value in profile.items() if key != "queues"})
+
+
+@celeryd_init.connect
+def select_profile_queues(sender=None, instance=None, options=None, **kwargs):
+    if profile and not (options or {}).get("queues"):
+        instance.app.amqp.queues.select(profile["queues"])
@@ -0,0 +1,7 @@
+from storages.backends.s3 import S3Storage
+
+
+class MediaStorage(S3Storage):
+    """Медиафайлы в Yandex Object Storage (ключи и бакет — из settings)"""
+
+    file_overwrite = False
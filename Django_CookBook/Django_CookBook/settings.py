@@ -2,9 +2,13 @@ from pathlib import Path
 import os
 from django.conf.global_settings import AUTH_USER_MODEL, STATIC_ROOT
 from dotenv import load_dotenv
+from kombu import Queue
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Переменные из .env — один раз, до первого чтения окружения
+load_dotenv()
+
 
 SECRET_KEY = "django-insecure-foo8s1=)0xr&ji4ui9-%^=(3mk!f(f(s(m@qid-s&a$f^pwh2r"
 
@@ -25,20 +29,22 @@ INSTALLED_APPS = [
     "django.contrib.sites",
     "app",
     "django_ckeditor_5",
-    "django_cleanup.apps.CleanupConfig",  # Для удаления файлов из media/
     "storages",
     "widget_tweaks",  # Стилизация форм
     # 'app.apps.RecipesConfig',  # Сигналы
 ]
 
 MIDDLEWARE = [
+    "app.metrics.MetricsMiddleware",  # Первым: время ответа целиком
     "django.middleware.security.SecurityMiddleware",
+    "app.db_router.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "app.profiling.ProfilingMiddleware",  # После аутентификации: флаг персонала
 ]
 
 ROOT_URLCONF = "Django_CookBook.urls"
@@ -69,6 +75,22 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения (см. app/db_router.py): пути к файлам через
+# запятую в DATABASE_REPLICAS. Локально реплика — копия основного файла,
+# ее обновляет python manage.py sync_replicas
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+    filter(None, map(str.strip, os.getenv("DATABASE_REPLICAS", "").split(","))), 1
+):
+    DATABASES[f"replica{number}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / name,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+DATABASE_ROUTERS = ["app.db_router.PrimaryReplicaRouter"]
+REPLICA_PIN_SECONDS = 10  # Чтение из основной базы после записи клиента
+
 # Коды верификации и данные формы хранятся в кэше Redis
 # Кэш Redis (db=1)
 CACHES = {
@@ -76,13 +98,15 @@ CACHES = {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": "redis://127.0.0.1:6379/1",
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # Клиент django_redis со счетчиками попаданий (app/metrics.py)
+            "CLIENT_CLASS": "app.metrics.MeteredRedisClient",
         },
     }
 }
 
 # Настройки Celery для асинхронной обработки задач
-# Redis используется в качестве брокера сообщений и бэкенда для хранения результатов
+# Redis используется в качестве брокера сообщений (и бэкенда результатов,
+# если задача их сохраняет)
 # Для кэша и Celery используются разные БД с разными id
 # Celery (отдельная база db=0)
 CELERY_BROKER_URL = "redis://localhost:6379/0"
@@ -93,6 +117,94 @@ CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 
+# Очереди по типу нагрузки; воркеры запускаются с профилем очереди,
+# см. WORKER_PROFILES в Django_CookBook/celery.py:
+# email — письма (ожидание SMTP), maintenance — короткие задачи по
+# расписанию, heavy — пересборки по всему каталогу
+CELERY_TASK_DEFAULT_QUEUE = "default"
+# Воркер без -Q и профиля слушает все очереди
+CELERY_TASK_QUEUES = [
+    Queue(name) for name in ("default", "email", "maintenance", "heavy")
+]
+CELERY_TASK_ROUTES = {
+    "app.tasks.send_daily_digests": {"queue": "email"},
+    "app.tasks.rebuild_*": {"queue": "heavy"},
+    "app.tasks.extract_recipe_ingredients": {"queue": "heavy"},
+    "app.tasks.flush_recipe_views": {"queue": "maintenance"},
+    "app.tasks.recompute_bayesian_ratings": {"queue": "maintenance"},
+    "app.tasks.drain_media_deletions": {"queue": "maintenance"},
+    "app.tasks.purge_deactivated_accounts": {"queue": "maintenance"},
+    "app.tasks.delete_account_data": {"queue": "maintenance"},
+    "app.tasks.reconcile_notifications": {"queue": "maintenance"},
+}
+# Результаты задач никто не читает — в бэкенд они не записываются
+CELERY_TASK_IGNORE_RESULT = True
+# Идемпотентные задачи подтверждаются после выполнения: при падении
+# воркера задача вернется в очередь. Рассылка и перенос счетчиков
+# подтверждаются при получении — повтор отправил бы часть писем или
+# учел просмотры дважды (недосланные сводки дошлет следующий запуск)
+CELERY_TASK_ANNOTATIONS = {
+    name: {"acks_late": True, "reject_on_worker_lost": True}
+    for name in (
+        "app.tasks.rebuild_trending",
+        "app.tasks.rebuild_similar_recipes",
+        "app.tasks.rebuild_autocomplete",
+        "app.tasks.extract_recipe_ingredients",
+        "app.tasks.recompute_bayesian_ratings",
+        "app.tasks.drain_media_deletions",
+        "app.tasks.purge_deactivated_accounts",
+        "app.tasks.delete_account_data",
+        "app.tasks.reconcile_notifications",
+    )
+}
+
+# Периодические задачи (celery -A Django_CookBook beat)
+# Счетчики просмотров рецептов переносятся из Redis в БД, а очередь
+# удаления файлов разбирается раз в минуту,
+# пороги уведомлений авторов сверяются раз в 5 минут,
+# сводки авторам за прошедший день досылаются раз в час,
+# ленты трендов, взвешенные рейтинги и индекс подсказок поиска
+# пересчитываются раз в час,
+# похожие рецепты — раз в сутки
+CELERY_BEAT_SCHEDULE = {
+    "flush-recipe-views": {
+        "task": "app.tasks.flush_recipe_views",
+        "schedule": 60.0,
+    },
+    "rebuild-trending": {
+        "task": "app.tasks.rebuild_trending",
+        "schedule": 3600.0,
+    },
+    "recompute-bayesian-ratings": {
+        "task": "app.tasks.recompute_bayesian_ratings",
+        "schedule": 3600.0,
+    },
+    "rebuild-autocomplete": {
+        "task": "app.tasks.rebuild_autocomplete",
+        "schedule": 3600.0,
+    },
+    "rebuild-similar-recipes": {
+        "task": "app.tasks.rebuild_similar_recipes",
+        "schedule": 24 * 3600.0,
+    },
+    "drain-media-deletions": {
+        "task": "app.tasks.drain_media_deletions",
+        "schedule": 60.0,
+    },
+    "purge-deactivated-accounts": {
+        "task": "app.tasks.purge_deactivated_accounts",
+        "schedule": 3600.0,
+    },
+    "reconcile-notifications": {
+        "task": "app.tasks.reconcile_notifications",
+        "schedule": 300.0,
+    },
+    "send-daily-digests": {
+        "task": "app.tasks.send_daily_digests",
+        "schedule": 3600.0,
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -126,15 +238,58 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 
-DEFAULT_FILE_STORAGE = "Django_CookBook.s3_storage.MediaStorage"
+# Загрузки проверяются на лету: прием обрывается после MAX_UPLOAD_SIZE байт,
+# формат и размеры изображения определяются по заголовку (см. app/uploads.py)
+FILE_UPLOAD_HANDLERS = [
+    "app.uploads.ImageUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+MAX_UPLOAD_SIZE = 1024 * 1024  # 1 МБ, как и проверка в формах
+MAX_IMAGE_PIXELS = 25_000_000
+
+# Адреса обратных прокси (nginx): для запросов от них IP клиента берется
+# из X-Forwarded-For (ограничение частоты, уникальные просмотры, /metrics)
+TRUSTED_PROXIES = ["127.0.0.1", "::1"]
+
+# Метрики Prometheus (/metrics, см. app/metrics.py) доступны с этих адресов
+# и персоналу. Под Gunicorn перед запуском задается общий для воркеров
+# каталог PROMETHEUS_MULTIPROC_DIR
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
+# Профилирование (см. app/profiling.py): доля случайных запросов
+# и задачи Celery, профилируемые при каждом запуске
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILED_TASKS = list(
+    filter(None, map(str.strip, os.getenv("PROFILED_TASKS", "").split(",")))
+)
+
+# Бюджет запуска процесса до готовности URL, секунд
+# (python manage.py startup_report --check, см. app/startup.py)
+STARTUP_BUDGET = 1.0
 
 AWS_S3_ENDPOINT_URL = "https://storage.yandexcloud.net"
 
-load_dotenv()
 AWS_S3_ACCESS_KEY_ID = os.getenv("AWS_S3_ACCESS_KEY_ID")
 AWS_S3_SECRET_ACCESS_KEY = os.getenv("AWS_S3_SECRET_ACCESS_KEY")
+AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_STORAGE_BUCKET_NAME")
 AWS_QUERYSTRING_AUTH = False
 
+# Файлы с одинаковым содержимым хранятся один раз (см. app/storage.py),
+# сами файлы лежат в MEDIA_BACKEND_STORAGE
+STORAGES = {
+    "default": {"BACKEND": "app.storage.DeduplicatedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+CKEDITOR_5_FILE_STORAGE = "app.storage.DeduplicatedStorage"  # STORAGES не читает
+# Без ключей S3 (разработка) файлы лежат в MEDIA_ROOT
+MEDIA_BACKEND_STORAGE = (
+    "Django_CookBook.s3_storage.MediaStorage"
+    if AWS_S3_ACCESS_KEY_ID
+    else "django.core.files.storage.FileSystemStorage"
+)
+MEDIA_PERCEPTUAL_HASH = True  # Отмечать почти одинаковые изображения
+
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -149,8 +304,6 @@ LOGIN_URL = "/login/"
 LOGIN_REDIRECT_URL = "/"  # После входа переход на главную страницу
 
 
-load_dotenv()
-
 # Для разработки - вывод писем на консоль
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
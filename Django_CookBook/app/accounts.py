@@ -0,0 +1,152 @@
+import logging
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Count
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from . import (
+    autocomplete,
+    conditional,
+    fuzzy,
+    ingredients,
+    media,
+    ranking,
+    user_state,
+)
+from .facets import bump_generation
+from .models import Favorite, Recipe, RecipeRating, SearchTrigram, User
+
+logger = logging.getLogger(__name__)
+
+# Удаление аккаунта в два шага: запрос только деактивирует пользователя
+# (вход закрыт сразу), а данные удаляет задача Celery порциями по
+# CHUNK_SIZE строк — каждая порция в своей короткой транзакции.
+# Строки удаляются одним DELETE без сбора объектов и сигналов, поэтому
+# побочные эффекты сигналов (агрегаты оценок, индексы поиска, версии
+# страниц) выполняются здесь пачкой, а файлы изображений попадают
+# в очередь удаления в той же транзакции, что и строки (см. app/media.py)
+CHUNK_SIZE = 200
+STALE_AFTER = timedelta(hours=1)  # Деактивированные, но не удаленные — повтор
+
+
+def deactivate(user):
+    """Мгновенная часть удаления: пользователь не может войти,
+    задача удаления ставится в очередь после фиксации транзакции"""
+    from .tasks import delete_account_data
+
+    User.objects.filter(pk=user.pk).update(
+        is_active=False, deactivated_at=timezone.now()
+    )
+    transaction.on_commit(lambda: delete_account_data.delay(user.pk))
+
+
+def _delete_rows(queryset):
+    """DELETE одним запросом: без загрузки объектов, каскада и сигналов"""
+    return queryset._raw_delete(queryset.db)
+
+
+def _chunks(queryset, chunk_size):
+    """Пачки pk, пока в выборке что-то остается"""
+    while True:
+        ids = list(queryset.values_list("pk", flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+
+
+def _delete_ratings(user, chunk_size):
+    """Оценки пользователя с пересчетом агрегатов оцененных рецептов"""
+    for ids in _chunks(RecipeRating.objects.filter(user=user), chunk_size):
+        with transaction.atomic():
+            ratings = RecipeRating.objects.filter(pk__in=ids)
+            deltas = {}
+            for recipe_id, rating, count in (
+                ratings.values("recipe_id", "rating")
+                .annotate(count=Count("pk"))
+                .values_list("recipe_id", "rating", "count")
+                .order_by()
+            ):
+                deltas.setdefault(recipe_id, {})[rating] = -count
+            _delete_rows(ratings)
+            ranking.apply_rating_changes(deltas)
+        conditional.bump(*map(conditional.recipe_scope, deltas))
+
+
+def _delete_favorites(user, chunk_size):
+    # Вклад сохранений в тренды уйдет при ближайшей пересборке лент
+    for ids in _chunks(Favorite.objects.filter(user=user), chunk_size):
+        _delete_rows(Favorite.objects.filter(pk__in=ids))
+
+
+def _delete_recipes(user, chunk_size):
+    """Рецепты пользователя вместе со всеми зависимыми строками"""
+    dependents = [
+        relation
+        for relation in Recipe._meta.related_objects
+        if relation.on_delete is models.CASCADE
+    ]
+    for ids in _chunks(Recipe.objects.filter(author=user), chunk_size):
+        with transaction.atomic():
+            recipes = Recipe.objects.filter(pk__in=ids)
+            media.enqueue(recipes.values_list("picture", flat=True))
+            for relation in dependents:
+                _delete_rows(
+                    relation.related_model._base_manager.filter(
+                        **{f"{relation.field.name}__in": ids}
+                    )
+                )
+            if not fuzzy.uses_pg_trgm():
+                _delete_rows(
+                    SearchTrigram.objects.filter(
+                        kind=SearchTrigram.DISH, object_id__in=ids
+                    )
+                )
+            _delete_rows(recipes)
+
+        for pk in ids:
+            autocomplete.remove_member(f"r:{pk}")
+        # Удаленные рецепты пропадают и из блоков "похожие" других рецептов
+        conditional.bump(conditional.SIMILAR, *map(conditional.recipe_scope, ids))
+
+
+def delete_account_data(user_id, chunk_size=CHUNK_SIZE):
+    """Фоновое удаление деактивированного аккаунта. Идемпотентно: после
+    сбоя повторный запуск продолжит с оставшихся строк.
+    Возвращает False, если удалять нечего"""
+    user = User.objects.filter(
+        pk=user_id, is_active=False, deactivated_at__isnull=False
+    ).first()
+    if user is None:
+        return False
+
+    _delete_ratings(user, chunk_size)
+    _delete_favorites(user, chunk_size)
+    _delete_recipes(user, chunk_size)
+
+    try:
+        get_redis_connection("default").delete(*user_state._keys(user.pk))
+    except RedisError as e:
+        logger.warning(f"Не удалось удалить состояние пользователя {user.pk}: {e}")
+
+    # Зависимых строк не осталось: каскад и сигналы пользователя дешевые,
+    # аватар ставит в очередь удаления сигнал
+    user.delete()
+
+    bump_generation()
+    ingredients.bump_version()
+    conditional.bump(conditional.CATALOG, conditional.author_scope(user_id))
+    logger.info(f"Аккаунт {user_id} удален")
+    return True
+
+
+def stale_deactivated_ids():
+    """Аккаунты, задача удаления которых, видимо, потерялась"""
+    return list(
+        User.objects.filter(
+            is_active=False,
+            deactivated_at__lt=timezone.now() - STALE_AFTER,
+        ).values_list("pk", flat=True)
+    )
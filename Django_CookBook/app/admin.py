@@ -1,20 +1,98 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Recipe, RecipeRating, Category
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+    When,
+)
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
+from .models import User, Recipe, RecipeRating, Category, Ingredient, MediaBlob
 
+ESTIMATE_FROM = 100_000  # Меньшие таблицы считаются точно
 
-class RecipeRatingInline(admin.TabularInline):
-    model = RecipeRating
-    extra = 1
+
+class EstimatedCountPaginator(Paginator):
+    """Для списка без фильтров на PostgreSQL число строк берется из
+    статистики планировщика (pg_class.reltuples) вместо COUNT(*)"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == "postgresql" and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATE_FROM:
+                return row[0]
+        return super().count
+
+
+class FastAdminMixin:
+    """Списки больших таблиц: без полного COUNT(*) при фильтрах
+    и с оценкой числа строк без них"""
+
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+
+@admin.register(RecipeRating)
+class RecipeRatingAdmin(FastAdminMixin, admin.ModelAdmin):
+    list_display = ("id", "recipe", "user", "rating", "updated_at")
+    list_filter = ("rating",)
+    list_select_related = ("recipe", "user")
+    raw_id_fields = ("recipe", "user")
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(FastAdminMixin, BaseUserAdmin):
     model = User
-    list_display = ("email", "nickname", "is_staff", "is_superuser")
+    list_display = (
+        "email",
+        "nickname",
+        "recipe_count",
+        "is_active",
+        "is_staff",
+        "is_superuser",
+    )
     ordering = ("email",)
     search_fields = ("email", "nickname")
 
+    def get_queryset(self, request):
+        # Подзапрос выполняется только для строк текущей страницы
+        recipes = (
+            Recipe.objects.filter(author=OuterRef("pk"))
+            .order_by()
+            .values("author")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                recipe_count=Subquery(recipes, output_field=IntegerField()),
+            )
+        )
+
+    @admin.display(description="Рецептов", ordering="recipe_count")
+    def recipe_count(self, obj):
+        return obj.recipe_count or 0
+
     # Настройка невозможности редактирования/удаления
     def has_add_permission(self, request):
         return False
@@ -26,26 +104,71 @@ class UserAdmin(BaseUserAdmin):
         return False
 
 
+class RecipeChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        # Полный текст шагов в списке не нужен — есть text_preview
+        return super().get_queryset(request, exclude_parameters).defer("text")
+
+
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(FastAdminMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "dish_name",
-        "text",
+        "text_preview",
         "author",
         "category",
         "created_at",
         "average_rating",
     )
     list_filter = ("category", "created_at")
+    list_select_related = ("author", "category")
     search_fields = ("dish_name", "description", "author__email")
-    readonly_fields = ("created_at", "updated_at")
-    inlines = [RecipeRatingInline]
+    autocomplete_fields = ("author",)
+    readonly_fields = ("created_at", "updated_at", "rating_summary")
+
+    def get_changelist(self, request, **kwargs):
+        return RecipeChangeList
+
+    def get_queryset(self, request):
+        # Средний рейтинг из хранимых агрегатов — без запроса на строку
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                avg_rating=Case(
+                    When(rating_count=0, then=Value(0.0)),
+                    default=F("rating_sum") * 1.0 / F("rating_count"),
+                    output_field=FloatField(),
+                )
+            )
+        )
 
+    @admin.display(description="Средний рейтинг", ordering="avg_rating")
     def average_rating(self, obj):
-        return obj.average_rating()
+        return round(obj.avg_rating, 1)
 
-    average_rating.short_description = "Средний рейтинг"
+    @admin.display(description="Оценки")
+    def rating_summary(self, obj):
+        """Гистограмма из хранимых счетчиков вместо инлайна со всеми оценками"""
+        if obj.pk is None:
+            return "—"
+        bars = format_html_join(
+            "",
+            '<div>{} ★ <span style="display:inline-block; width:{}px; height:8px;'
+            ' background:#79aec8"></span> {}</div>',
+            (
+                (stars, 2 * percent, count)
+                for stars, count, percent in obj.rating_histogram()
+            ),
+        )
+        url = reverse("admin:app_reciperating_changelist")
+        return bars + format_html(
+            '<a href="{}?recipe__id__exact={}">Все оценки ({})</a>',
+            url,
+            obj.pk,
+            obj.rating_count,
+        )
 
 
 @admin.register(Category)
@@ -53,3 +176,18 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ("id", "category")
     search_fields = ("category",)
     ordering = ("category",)
+
+
+@admin.register(Ingredient)
+class IngredientAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "aliases")
+    search_fields = ("name", "aliases")
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ("name", "size", "similar_to", "created_at")
+    list_filter = (("similar_to", admin.EmptyFieldListFilter),)
+    list_select_related = ("similar_to",)
+    search_fields = ("name", "digest")
+    readonly_fields = ("name", "digest", "size", "phash", "similar_to", "created_at")
@@ -0,0 +1,401 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from functools import wraps
+from operator import itemgetter
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db.models import Count, Q, Sum
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from .conditional import CATALOG, SIMILAR, author_scope, conditional_page, recipe_scope
+from .models import Recipe, RecipeIngredient, SimilarRecipe, User
+from .ranking import RATINGS
+from .stats import track_view
+from .views import best_recipes, search_recipes
+
+# JSON API только для чтения (мобильный клиент): списки рецептов (поиск,
+# лучшие, категория, автор), рецепт и профиль пользователя.
+# Ответ собирается из проекции .values() без создания объектов моделей,
+# в SELECT попадают только колонки запрошенных полей (?fields=id,dish_name).
+# Средняя оценка, гистограмма и просмотры — хранимые агрегаты рецепта.
+# Списки листаются курсором (keyset): курсор хранит значения сортировки
+# последней строки, следующая страница — условие WHERE по ним вместо
+# OFFSET, поэтому глубокие страницы не дороже первой.
+# Условный GET — как у HTML-страниц (app/conditional.py)
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SIMILAR_LIMIT = 4  # Как на странице рецепта
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def json_response(data, status=200):
+    # Кириллица без \u-экранирования — ответ почти вдвое короче
+    return JsonResponse(data, status=status, json_dumps_params={"ensure_ascii": False})
+
+
+def api_view(view):
+    """GET-представление API: ошибки запроса — JSON с кодом ApiError.status"""
+
+    @require_GET
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as e:
+            return json_response({"error": str(e)}, status=e.status)
+
+    return wrapper
+
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+def _column(name):
+    """Поле, которое отдается колонкой как есть"""
+    return (name,), itemgetter(name)
+
+
+# Поле ответа: (колонки проекции, значение из строки)
+RECIPE_FIELDS = {
+    "id": _column("id"),
+    "dish_name": _column("dish_name"),
+    "description": _column("description"),
+    "picture": (("picture",), lambda row: _media_url(row["picture"])),
+    "category": (
+        ("category_id", "category__category"),
+        lambda row: {"id": row["category_id"], "name": row["category__category"]},
+    ),
+    "author": (
+        ("author_id", "author__nickname"),
+        lambda row: {"id": row["author_id"], "nickname": row["author__nickname"]},
+    ),
+    "created_at": _column("created_at"),
+    "updated_at": _column("updated_at"),
+    "rating": (
+        ("rating_sum", "rating_count"),
+        lambda row: (
+            round(row["rating_sum"] / row["rating_count"], 1)
+            if row["rating_count"]
+            else 0.0
+        ),
+    ),
+    "rating_count": _column("rating_count"),
+    "bayesian_rating": _column("bayesian_rating"),
+    "histogram": (
+        tuple(f"rating_{stars}" for stars in RATINGS),
+        lambda row: {str(stars): row[f"rating_{stars}"] for stars in RATINGS},
+    ),
+    "url": (("id",), lambda row: reverse("recipe_detail", args=[row["id"]])),
+}
+RECIPE_LIST_DEFAULT = (
+    "id",
+    "dish_name",
+    "description",
+    "picture",
+    "category",
+    "author",
+    "created_at",
+    "rating",
+    "rating_count",
+)
+
+RECIPE_DETAIL_FIELDS = {
+    **RECIPE_FIELDS,
+    "text": _column("text"),
+    "views": (("stats__views",), lambda row: row["stats__views"] or 0),
+}
+
+
+def _ingredients(pk):
+    return [
+        {"id": row["ingredient_id"], "name": row["ingredient__name"]}
+        for row in RecipeIngredient.objects.filter(recipe_id=pk)
+        .order_by("ingredient__name")
+        .values("ingredient_id", "ingredient__name")
+    ]
+
+
+def _similar(pk):
+    return [
+        {
+            "id": row["similar_id"],
+            "dish_name": row["similar__dish_name"],
+            "picture": _media_url(row["similar__picture"]),
+        }
+        for row in SimilarRecipe.objects.filter(recipe_id=pk)
+        .order_by("rank")
+        .values("similar_id", "similar__dish_name", "similar__picture")[:SIMILAR_LIMIT]
+    ]
+
+
+# Связанные списки рецепта — отдельным запросом, только если запрошены
+RECIPE_RELATIONS = {"ingredients": _ingredients, "similar": _similar}
+
+USER_FIELDS = {
+    "id": _column("id"),
+    "nickname": _column("nickname"),
+    "bio": _column("bio"),
+    "avatar": (("avatar",), lambda row: _media_url(row["avatar"])),
+    "date_joined": _column("date_joined"),
+    "recipe_count": _column("recipe_count"),
+    "rating_count": (("ratings_received",), lambda row: row["ratings_received"] or 0),
+    "rating": (
+        ("ratings_received", "ratings_sum"),
+        lambda row: (
+            round(row["ratings_sum"] / row["ratings_received"], 1)
+            if row["ratings_received"]
+            else 0.0
+        ),
+    ),
+}
+# Агрегаты по рецептам автора — из хранимых сумм, без чтения оценок
+USER_ANNOTATIONS = {
+    "recipe_count": Count("recipe"),
+    "ratings_received": Sum("recipe__rating_count"),
+    "ratings_sum": Sum("recipe__rating_sum"),
+}
+
+
+def requested_fields(request, fields, default):
+    """Имена полей из ?fields= (разреженный набор) или поля по умолчанию"""
+    raw = request.GET.get("fields", "")
+    names = [name for name in dict.fromkeys(map(str.strip, raw.split(","))) if name]
+    if not names:
+        return list(default)
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise ApiError(f"Неизвестные поля: {', '.join(unknown)}")
+    return names
+
+
+def project(queryset, fields, names, extra=(), annotations=None):
+    """Строки queryset.values() только с колонками запрошенных полей"""
+    columns = dict.fromkeys(
+        column for name in names for column in fields[name][0]
+    ) | dict.fromkeys(extra)
+    if annotations:
+        queryset = queryset.annotate(
+            **{
+                column: expression
+                for column, expression in annotations.items()
+                if column in columns
+            }
+        )
+    return queryset.values(*columns)
+
+
+def serialize(row, fields, names):
+    return {name: fields[name][1](row) for name in names}
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()  # С микросекундами: курсор должен быть точным
+    raise TypeError(f"{type(value).__name__} не сериализуется в курсор")
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=_default, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _ordering_field(queryset, column):
+    """Поле модели или аннотации, по которому идет сортировка"""
+    if column in queryset.query.annotations:
+        return queryset.query.annotations[column].output_field
+    return queryset.model._meta.get_field(column)
+
+
+def decode_cursor(cursor, queryset, columns):
+    """Значения курсора, приведенные к типам колонок сортировки columns:
+    подделанный курсор — ошибка 400, а не исключение в запросе"""
+    fields = [_ordering_field(queryset, column) for column in columns]
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ApiError("Некорректный курсор")
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ApiError("Некорректный курсор")
+    try:
+        values = [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValidationError, TypeError, ValueError):
+        raise ApiError("Некорректный курсор")
+    if None in values:
+        raise ApiError("Некорректный курсор")
+    return values
+
+
+def after(ordering, values):
+    """Условие "строка после курсора" для сортировки ordering:
+    (a < va) или (a = va и b < vb) или ..."""
+    condition = Q()
+    for i, field in enumerate(ordering):
+        column = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        step = Q(**{f"{column}__{lookup}": values[i]})
+        for previous, value in zip(ordering[:i], values):
+            step &= Q(**{previous.lstrip("-"): value})
+        condition |= step
+    return condition
+
+
+def page_size(request):
+    raw = request.GET.get("limit")
+    if raw is None:
+        return PAGE_SIZE
+    if not raw.isdigit() or not 1 <= int(raw) <= MAX_PAGE_SIZE:
+        raise ApiError(f"limit — число от 1 до {MAX_PAGE_SIZE}")
+    return int(raw)
+
+
+def paginate(request, queryset, ordering, fields, default):
+    """Страница списка: {"results": [...], "next": курсор или null}.
+    ordering должна однозначно упорядочивать строки (в конце — id)"""
+    names = requested_fields(request, fields, default)
+    limit = page_size(request)
+    columns = [field.lstrip("-") for field in ordering]
+
+    queryset = queryset.order_by(*ordering)
+    cursor = request.GET.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor, queryset, columns)
+        queryset = queryset.filter(after(ordering, values))
+
+    rows = list(project(queryset, fields, names, extra=columns)[: limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][column] for column in columns])
+    return {
+        "results": [serialize(row, fields, names) for row in rows],
+        "next": next_cursor,
+    }
+
+
+def _int_param(request, name):
+    raw = request.GET.get(name)
+    if raw is None or raw == "":
+        return None
+    if not raw.isdigit():
+        raise ApiError(f"{name} — id")
+    return int(raw)
+
+
+def _filter(request, queryset):
+    """Фильтры по категории и автору"""
+    category_id = _int_param(request, "category")
+    if category_id is not None:
+        queryset = queryset.filter(category_id=category_id)
+    author_id = _int_param(request, "author")
+    if author_id is not None:
+        queryset = queryset.filter(author_id=author_id)
+    return queryset
+
+
+@api_view
+def recipe_list(request):
+    """Поиск рецептов (параметры — как у страницы поиска), а также рецепты
+    категории (?category=) и автора (?author=); новые сначала"""
+
+    def render():
+        queryset, fuzzy = search_recipes(
+            request.GET.get("q", "").strip(),
+            request.GET.get("fuzzy") == "1",
+            sorted(
+                {int(pk) for pk in request.GET.getlist("ingredient") if pk.isdigit()}
+            ),
+            request.GET.get("match") == "any",
+            _int_param(request, "category"),
+        )
+        # Нечеткий поиск упорядочен по близости к запросу
+        ordering = ("relevance", "id") if fuzzy else ("-created_at", "-id")
+        data = paginate(
+            request,
+            _filter(request, queryset),
+            ordering,
+            RECIPE_FIELDS,
+            RECIPE_LIST_DEFAULT,
+        )
+        data["fuzzy"] = fuzzy
+        return json_response(data)
+
+    return conditional_page(request, [CATALOG], render)
+
+
+@api_view
+def best_list(request):
+    """Лучшие рецепты по взвешенному рейтингу, как на странице /best/"""
+
+    def render():
+        return json_response(
+            paginate(
+                request,
+                _filter(request, best_recipes()),
+                ("-bayesian_rating", "-created_at", "-id"),
+                RECIPE_FIELDS,
+                RECIPE_LIST_DEFAULT,
+            )
+        )
+
+    return conditional_page(request, [CATALOG], render)
+
+
+@api_view
+def recipe_detail(request, pk):
+    """Рецепт со связанными списками (ингредиенты, похожие рецепты)"""
+
+    def render():
+        fields = {**RECIPE_DETAIL_FIELDS, **dict.fromkeys(RECIPE_RELATIONS)}
+        names = requested_fields(request, fields, fields)
+        columns = [name for name in names if name not in RECIPE_RELATIONS]
+        row = (
+            project(Recipe.objects.filter(pk=pk), RECIPE_DETAIL_FIELDS, columns)
+            .order_by()
+            .first()
+        )
+        if row is None:
+            raise ApiError("Рецепт не найден", status=404)
+        data = serialize(row, RECIPE_DETAIL_FIELDS, columns)
+        for name in names:
+            if name in RECIPE_RELATIONS:
+                data[name] = RECIPE_RELATIONS[name](pk)
+        return json_response(data)
+
+    response = conditional_page(request, [recipe_scope(pk), SIMILAR], render)
+    if response.status_code in (200, 304):
+        track_view(request, pk)  # Как и просмотр страницы рецепта
+    return response
+
+
+@api_view
+def user_detail(request, pk):
+    """Публичный профиль; рецепты автора — /api/recipes/?author=<id>"""
+
+    def render():
+        names = requested_fields(request, USER_FIELDS, USER_FIELDS)
+        row = (
+            project(
+                User.objects.filter(pk=pk, is_active=True),
+                USER_FIELDS,
+                names,
+                annotations=USER_ANNOTATIONS,
+            )
+            .order_by()
+            .first()
+        )
+        if row is None:
+            raise ApiError("Пользователь не найден", status=404)
+        return json_response(serialize(row, USER_FIELDS, names))
+
+    return conditional_page(request, [author_scope(pk), CATALOG], render)
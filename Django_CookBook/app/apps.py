@@ -7,3 +7,9 @@ class RecipesConfig(AppConfig):
 
     def ready(self):
         import app.signals
+        import app.db_router  # Выбор базы в задачах Celery (сигналы)
+        import app.task_metrics  # Метрики задач Celery (сигналы)
+        import app.profiling  # Профили задач Celery (сигналы)
+        from app.fuzzy import register_lookups
+
+        register_lookups()  # Оператор pg_trgm %> (только PostgreSQL)
@@ -0,0 +1,204 @@
+import logging
+import re
+import uuid
+
+from django.db.models import Count, IntegerField
+from django.db.models.functions import Coalesce
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .models import Category, Recipe, User
+
+logger = logging.getLogger(__name__)
+
+# Подсказки при вводе поискового запроса.
+# Для каждого префикса (до MAX_PREFIX символов) каждого слова названия блюда,
+# никнейма автора и категории хранится sorted set: элемент — "r:<id>",
+# "u:<id>" или "c:<id>", score — популярность. Подсказка — один ZREVRANGE
+# по ключу префикса, без обращения к БД.
+# Индекс версионирован: пересборка пишет новую версию и переключает указатель
+MAX_PREFIX = 15
+LIMIT = 10
+
+VERSION_KEY = "autocomplete:version"
+PREFIX_KEY = "autocomplete:{}:p:{}"
+LABELS_KEY = "autocomplete:{}:labels"
+MEMBER_KEYS = "autocomplete:{}:keys:{}"  # Префиксы элемента, для удаления
+
+# Версия и выборка читаются одним скриптом — один round-trip на подсказку
+_LOOKUP_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+local members = redis.call(
+    'ZREVRANGE', 'autocomplete:' .. version .. ':p:' .. ARGV[1], 0, ARGV[2] - 1
+)
+if #members == 0 then
+    return {}
+end
+local labels = redis.call('HMGET', 'autocomplete:' .. version .. ':labels', unpack(members))
+local result = {}
+for i = 1, #members do
+    result[2 * i - 1] = members[i]
+    result[2 * i] = labels[i]
+end
+return result
+"""
+_lookup = None
+
+
+def normalize(text):
+    """Нижний регистр, ё → е, без знаков препинания и лишних пробелов"""
+    text = re.sub(r"[^\w\s]", " ", text.lower().replace("ё", "е"))
+    return " ".join(text.split())
+
+
+def prefixes(label):
+    """Префиксы, начинающиеся с каждого слова подписи:
+    "Салат Цезарь" → "с", "са", ..., "салат ц", ..., "ц", "це", ..."""
+    words = normalize(label).split()
+    result = set()
+    for i in range(len(words)):
+        tail = " ".join(words[i:])
+        for length in range(1, min(len(tail), MAX_PREFIX) + 1):
+            result.add(tail[:length])
+    return result
+
+
+def _version(redis, version_key=VERSION_KEY):
+    return (redis.get(version_key) or b"0").decode()
+
+
+def _add(pipe, version, member, label, popularity):
+    keys = [PREFIX_KEY.format(version, prefix) for prefix in prefixes(label)]
+    for key in keys:
+        pipe.zadd(key, {member: popularity})
+    pipe.hset(LABELS_KEY.format(version), member, label)
+    member_keys = MEMBER_KEYS.format(version, member)
+    pipe.delete(member_keys)
+    if keys:
+        pipe.sadd(member_keys, *keys)
+
+
+def _remove(redis, version, member):
+    member_keys = MEMBER_KEYS.format(version, member)
+    pipe = redis.pipeline(transaction=False)
+    for key in redis.smembers(member_keys):
+        pipe.zrem(key, member)
+    pipe.hdel(LABELS_KEY.format(version), member)
+    pipe.delete(member_keys)
+    pipe.execute()
+
+
+def index_member(member, label, popularity=None):
+    """Добавление (или переиндексация) одного элемента при его изменении;
+    без popularity сохраняется текущая популярность элемента"""
+    try:
+        redis = get_redis_connection("default")
+        version = _version(redis)
+        if popularity is None:
+            key = redis.srandmember(MEMBER_KEYS.format(version, member))
+            popularity = (redis.zscore(key, member) if key else None) or 0
+        _remove(redis, version, member)
+        pipe = redis.pipeline(transaction=False)
+        _add(pipe, version, member, label, popularity)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Не удалось обновить подсказки для {member}: {e}")
+
+
+def remove_member(member):
+    try:
+        redis = get_redis_connection("default")
+        _remove(redis, _version(redis), member)
+    except RedisError as e:
+        logger.warning(f"Не удалось удалить подсказки для {member}: {e}")
+
+
+def build_index(entries, version=None, batch=1000, version_key=VERSION_KEY):
+    """Запись индекса в новую версию и переключение на нее.
+    entries — итерируемое (member, label, popularity). Возвращает версию"""
+    redis = get_redis_connection("default")
+    old_version = _version(redis, version_key)
+    version = version or uuid.uuid4().hex[:8]
+
+    pipe = redis.pipeline(transaction=False)
+    for i, (member, label, popularity) in enumerate(entries, start=1):
+        _add(pipe, version, member, label, popularity)
+        if i % batch == 0:
+            pipe.execute()
+    pipe.execute()
+
+    redis.set(version_key, version)
+    drop_version(old_version)
+    return version
+
+
+def drop_version(version):
+    """Удаление ключей версии индекса (SCAN, без блокировки Redis)"""
+    redis = get_redis_connection("default")
+    pipe = redis.pipeline(transaction=False)
+    for i, key in enumerate(
+        redis.scan_iter(f"autocomplete:{version}:*", count=1000), start=1
+    ):
+        pipe.unlink(key)
+        if i % 1000 == 0:
+            pipe.execute()
+    pipe.execute()
+
+
+def catalogue_entries():
+    """Все элементы индекса с популярностью:
+    рецепт — просмотры + 10 × сохранения, автор — сумма по его рецептам,
+    категория — число рецептов"""
+    recipes = Recipe.objects.annotate(
+        popularity=Coalesce("stats__views", 0, output_field=IntegerField())
+        + 10 * Count("favorite")
+    ).values_list("pk", "dish_name", "author_id", "popularity")
+
+    authors = {}
+    for pk, dish_name, author_id, popularity in recipes.iterator(chunk_size=5000):
+        authors[author_id] = authors.get(author_id, 0) + popularity
+        yield f"r:{pk}", dish_name, popularity
+
+    for pk, nickname in User.objects.filter(is_active=True).values_list(
+        "pk", "nickname"
+    ):
+        yield f"u:{pk}", nickname, authors.get(pk, 0)
+
+    for pk, name, count in Category.objects.annotate(n=Count("recipe")).values_list(
+        "pk", "category", "n"
+    ):
+        yield f"c:{pk}", name, count
+
+
+def rebuild_index():
+    return build_index(catalogue_entries())
+
+
+def suggest(query, limit=LIMIT, version_key=VERSION_KEY):
+    """Подсказки для введенного текста: список (member, label)
+    по убыванию популярности"""
+    query = normalize(query)
+    if not query:
+        return []
+
+    global _lookup
+    try:
+        redis = get_redis_connection("default")
+        if _lookup is None:
+            _lookup = redis.register_script(_LOOKUP_SCRIPT)
+        # Для длинных запросов берется запас и фильтруется по полному тексту
+        extra = limit * 5 if len(query) > MAX_PREFIX else limit
+        flat = _lookup(keys=[version_key], args=[query[:MAX_PREFIX], extra])
+    except RedisError as e:
+        logger.warning(f"Подсказки недоступны: {e}")
+        return []
+
+    results = []
+    for member, label in zip(flat[::2], flat[1::2]):
+        if label is None:
+            continue  # Элемент удаляется прямо сейчас
+        label = label.decode()
+        if len(query) > MAX_PREFIX and query not in normalize(label):
+            continue
+        results.append((member.decode(), label))
+    return results[:limit]
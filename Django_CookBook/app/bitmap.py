@@ -0,0 +1,153 @@
+from functools import reduce
+
+import numpy as np
+
+# Сжатое битовое множество id в духе Roaring bitmap.
+# Id делятся по старшим 16 битам на контейнеры; в контейнере младшие 16 бит
+# хранятся либо отсортированным массивом uint16 (до ARRAY_LIMIT элементов,
+# 2 байта на id), либо битовой картой на 65536 бит (8 КБ, 1024 слова uint64).
+# Пересечения и объединения идут по контейнерам векторными операциями NumPy
+ARRAY_LIMIT = 4096
+WORDS = 1024
+
+
+def _is_bitmap(container):
+    return container.dtype == np.uint64
+
+
+def _to_bitmap(lows):
+    words = np.zeros(WORDS, dtype=np.uint64)
+    lows = lows.astype(np.uint64)
+    np.bitwise_or.at(words, lows >> 6, np.uint64(1) << (lows & np.uint64(63)))
+    return words
+
+
+def _to_array(words):
+    bits = np.unpackbits(words.astype("<u8").view(np.uint8), bitorder="little")
+    return np.flatnonzero(bits).astype(np.uint16)
+
+
+def _contains(words, lows):
+    lows = lows.astype(np.uint64)
+    return ((words[lows >> 6] >> (lows & np.uint64(63))) & np.uint64(1)).astype(bool)
+
+
+def _cardinality(container):
+    if _is_bitmap(container):
+        return int(np.bitwise_count(container).sum())
+    return len(container)
+
+
+def _compact(container):
+    """Выбор представления по числу элементов; None — пустой контейнер"""
+    size = _cardinality(container)
+    if not size:
+        return None
+    if _is_bitmap(container):
+        return container if size > ARRAY_LIMIT else _to_array(container)
+    return _to_bitmap(container) if size > ARRAY_LIMIT else container
+
+
+def _and(a, b):
+    if _is_bitmap(a) and _is_bitmap(b):
+        return _compact(a & b)
+    if _is_bitmap(a):
+        a, b = b, a
+    if _is_bitmap(b):
+        return _compact(a[_contains(b, a)])
+    return _compact(np.intersect1d(a, b, assume_unique=True))
+
+
+def _or(a, b):
+    if _is_bitmap(a) and _is_bitmap(b):
+        return a | b
+    if _is_bitmap(a):
+        a, b = b, a
+    if _is_bitmap(b):
+        return b | _to_bitmap(a)
+    return _compact(np.union1d(a, b))
+
+
+class RoaringBitmap:
+    """Неизменяемое множество неотрицательных 32-битных id"""
+
+    __slots__ = ("containers",)
+
+    def __init__(self, containers=None):
+        self.containers = containers or {}  # старшие 16 бит → контейнер
+
+    @classmethod
+    def from_ids(cls, ids):
+        ids = np.unique(np.asarray(ids, dtype=np.uint32))
+        highs = ids >> 16
+        keys, starts = np.unique(highs, return_index=True)
+        containers = {}
+        for key, chunk in zip(keys.tolist(), np.split(ids, starts[1:])):
+            containers[key] = _compact((chunk & 0xFFFF).astype(np.uint16))
+        return cls(containers)
+
+    def __len__(self):
+        return sum(_cardinality(c) for c in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    def __contains__(self, value):
+        container = self.containers.get(value >> 16)
+        if container is None:
+            return False
+        low = np.array([value & 0xFFFF], dtype=np.uint16)
+        if _is_bitmap(container):
+            return bool(_contains(container, low)[0])
+        i = np.searchsorted(container, low[0])
+        return i < len(container) and container[i] == low[0]
+
+    def __and__(self, other):
+        containers = {}
+        for key in self.containers.keys() & other.containers.keys():
+            container = _and(self.containers[key], other.containers[key])
+            if container is not None:
+                containers[key] = container
+        return RoaringBitmap(containers)
+
+    def __or__(self, other):
+        containers = dict(self.containers)
+        for key, container in other.containers.items():
+            mine = containers.get(key)
+            containers[key] = container if mine is None else _or(mine, container)
+        return RoaringBitmap(containers)
+
+    def __eq__(self, other):
+        return np.array_equal(self.to_array(), other.to_array())
+
+    def __iter__(self):
+        return iter(self.to_array().tolist())
+
+    def to_array(self):
+        """Все id по возрастанию (uint32)"""
+        parts = []
+        for key in sorted(self.containers):
+            container = self.containers[key]
+            lows = _to_array(container) if _is_bitmap(container) else container
+            parts.append((np.uint32(key) << 16) | lows.astype(np.uint32))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.uint32)
+
+    def nbytes(self):
+        return sum(c.nbytes for c in self.containers.values())
+
+    @staticmethod
+    def intersection(bitmaps):
+        """Пересечение, начиная с самых маленьких множеств"""
+        bitmaps = sorted(bitmaps, key=len)
+        if not bitmaps:
+            return RoaringBitmap()
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            if not result:
+                break
+            result = result & bitmap
+        return result
+
+    @staticmethod
+    def union(bitmaps):
+        return reduce(lambda a, b: a | b, bitmaps, RoaringBitmap())
@@ -0,0 +1,117 @@
+import hashlib
+import time
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+# Условные GET-запросы (ETag / Last-Modified) для страниц рецепта, профиля
+# и списков. Каждая страница зависит от нескольких "областей" (рецепт,
+# автор, каталог, состояние зрителя); у области в кэше хранится время
+# последнего изменения, которое сдвигают сигналы и периодические задачи.
+# Проверка — один get_many в кэш, без запросов к БД и рендеринга.
+# Время служит и версией: после вытеснения ключа область получает новое
+# время, поэтому старый ETag не совпадет случайно. Ключи живут
+# VERSION_TIMEOUT: области несуществующих id из URL и API не копятся
+VERSION_KEY = "etag:{}"
+VERSION_TIMEOUT = 7 * 24 * 3600
+
+CATALOG = "catalog"  # Любые рецепты, оценки, сохранения, категории
+CATEGORIES = "categories"  # Список категорий в сайдбарах
+TRENDING = "trending"  # Лента трендов (просмотры, пересборка)
+SIMILAR = "similar"  # Таблица похожих рецептов
+
+
+def recipe_scope(recipe_id):
+    return f"recipe:{recipe_id}"
+
+
+def author_scope(user_id):
+    return f"author:{user_id}"
+
+
+def viewer_scope(user_id):
+    """Состояние зрителя: его оценки, сохранения и данные в навбаре"""
+    return f"viewer:{user_id}"
+
+
+def bump(*scopes):
+    now = time.time()
+    cache.set_many(
+        {VERSION_KEY.format(scope): now for scope in scopes}, timeout=VERSION_TIMEOUT
+    )
+
+
+def versions(scopes):
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in found}
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, timeout=VERSION_TIMEOUT)
+        found.update(cache.get_many(list(missing)))
+    return [found.get(key, missing.get(key)) for key in keys]
+
+
+def validators(request, scopes, *extra):
+    """ETag и Last-Modified страницы. В ETag входят версии областей,
+    зритель (аноним или id) и extra — все, что еще меняет страницу"""
+    if request.user.is_authenticated:
+        scopes = [*scopes, viewer_scope(request.user.pk)]
+        viewer = f"u{request.user.pk}"
+    else:
+        viewer = "anon"
+    stamps = versions(scopes)
+    digest = hashlib.md5(
+        "|".join(map(str, [*stamps, viewer, *extra])).encode()
+    ).hexdigest()
+    return f'W/"{digest}"', max(stamps)
+
+
+def not_modified(request, etag, last_modified):
+    """Ответ 304, если у клиента актуальная версия; иначе None.
+    Непоказанные flash-сообщения требуют полного рендеринга"""
+    if request.method not in ("GET", "HEAD") or len(messages.get_messages(request)):
+        return None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified)
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code not in (200, 304):
+        return response
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+    # Страница зависит от зрителя: хранится только в браузере
+    # и перепроверяется при каждом обращении
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_page(request, scopes, render, *extra):
+    """Рендеринг страницы только при изменении ее областей"""
+    etag, last_modified = validators(request, scopes, *extra)
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = set_validators(render(), etag, last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """Условный GET для представлений-классов: get_etag_scopes()
+    возвращает области, от которых зависит страница"""
+
+    def get_etag_scopes(self):
+        return [CATALOG]
+
+    def get(self, request, *args, **kwargs):
+        return conditional_page(
+            request,
+            self.get_etag_scopes(),
+            lambda: super(ConditionalGetMixin, self).get(request, *args, **kwargs),
+        )
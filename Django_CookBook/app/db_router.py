@@ -0,0 +1,116 @@
+import random
+from contextvars import ContextVar
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Чтение с реплик, запись — в основную базу (реплики — settings.DATABASE_REPLICAS).
+# Реплики используются только там, где это разрешено явно: в безопасных
+# запросах GET/HEAD/OPTIONS (ReplicaMiddleware) и в задачах Celery из REPLICA_TASKS;
+# management-команды, shell и остальные задачи читают из основной базы.
+# После первой записи запрос до конца читает из основной базы, а клиент
+# получает cookie PIN_COOKIE: следующие PIN_SECONDS секунд его запросы
+# тоже идут в основную — своя оценка или сохранение видны сразу после
+# редиректа, пока реплика догоняет. Чтение внутри транзакции — всегда из
+# основной базы (select_for_update, проверка перед записью).
+# Сессии и пользователь за request.user всегда читаются из основной базы:
+# иначе сразу после входа (сессия только что записана) реплика вернет
+# анонимного пользователя
+PIN_COOKIE = "db_pin"
+PIN_SECONDS = 10  # Переопределяется в settings.REPLICA_PIN_SECONDS
+# Пересборки читают весь каталог и терпят отставание реплики; уведомления
+# проверяют только что записанные данные — им нужна основная база
+REPLICA_TASKS = {
+    "app.tasks.rebuild_trending",
+    "app.tasks.rebuild_similar_recipes",
+    "app.tasks.rebuild_autocomplete",
+}
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PRIMARY_APPS = {"sessions", "auth"}
+
+# Состояние текущего запроса или задачи: {"replica": можно ли читать
+# с реплики, "wrote": была ли запись}; None — только основная база
+_state = ContextVar("db_routing", default=None)
+_task_tokens = {}
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        aliases = replicas()
+        if not aliases or state is None or not state["replica"]:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if (
+            model._meta.app_label in PRIMARY_APPS
+            or model._meta.label == settings.AUTH_USER_MODEL
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Дальше запрос читает свои записи из основной базы
+            state["replica"] = False
+            state["wrote"] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True  # Реплики — копии основной базы
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема приходит на реплики вместе с данными
+        return False if db in replicas() else None
+
+
+class ReplicaMiddleware:
+    """Чтение с реплик для безопасных запросов без недавних записей"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = {
+            "replica": request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES,
+            "wrote": False,
+        }
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if replicas() and (state["wrote"] or request.method not in SAFE_METHODS):
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=getattr(settings, "REPLICA_PIN_SECONDS", PIN_SECONDS),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+@task_prerun.connect
+def route_task(task_id=None, task=None, **kwargs):
+    _task_tokens[task_id] = _state.set(
+        {"replica": task.name in REPLICA_TASKS, "wrote": False}
+    )
+
+
+@task_postrun.connect
+def reset_task_routing(task_id=None, **kwargs):
+    token = _task_tokens.pop(task_id, None)
+    if token is not None:
+        _state.reset(token)  # Eager-задача внутри запроса вернет его состояние
@@ -0,0 +1,159 @@
+import logging
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Avg, Count, Exists, OuterRef, Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .metrics import count_emails
+from .models import DigestEvent, Favorite, RecipeRating, User
+
+logger = logging.getLogger(__name__)
+
+# Ежедневная сводка автору вместо письма на каждое событие: новые
+# сохранения и оценки его рецептов за день и достигнутые пороги
+# (DigestEvent, см. app/notifications.py). Сохранения и оценки отдельно
+# не копятся — они читаются из своих таблиц за окно сводки.
+# Авторы с активностью за день читаются потоком (iterator) и
+# обрабатываются пачками по BATCH_SIZE: на пачку — три запроса
+# с группировкой и одно SMTP-соединение, память не растет с числом
+# пользователей. User.digest_date отмечает отправленные сводки, поэтому
+# повторный запуск за тот же день досылает только оставшиеся
+BATCH_SIZE = 500
+FROM_EMAIL = "noreply@recipesite.com"
+SUBJECT = "Ваши рецепты за {:%d.%m.%Y}"
+KINDS = dict(DigestEvent.KIND_CHOICES)
+
+
+def digest_window(day):
+    """Начало и конец дня day в текущем часовом поясе"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def _authors(day, start, end, batch_size):
+    """(id, email, никнейм) авторов с активностью за день и без сводки за него"""
+    activity = (
+        Exists(
+            Favorite.objects.filter(
+                recipe__author=OuterRef("pk"), created_at__gte=start, created_at__lt=end
+            )
+        )
+        | Exists(
+            RecipeRating.objects.filter(
+                recipe__author=OuterRef("pk"), updated_at__gte=start, updated_at__lt=end
+            )
+        )
+        | Exists(DigestEvent.objects.filter(author=OuterRef("pk"), created_at__lt=end))
+    )
+    return (
+        User.objects.filter(activity, is_active=True)
+        .filter(Q(digest_date__isnull=True) | Q(digest_date__lt=day))
+        .order_by("pk")
+        .values_list("pk", "email", "nickname")
+        .iterator(chunk_size=batch_size)
+    )
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def collect(author_ids, start, end):
+    """Активность авторов за окно: {автор: {рецепт: {...}}} и id
+    включенных событий"""
+    activity = {}
+
+    def entry(author_id, recipe_id, dish_name):
+        return activity.setdefault(author_id, {}).setdefault(
+            recipe_id,
+            {"dish_name": dish_name, "saves": 0, "ratings": 0, "milestones": []},
+        )
+
+    for row in (
+        Favorite.objects.filter(
+            recipe__author_id__in=author_ids, created_at__gte=start, created_at__lt=end
+        )
+        .values("recipe__author_id", "recipe_id", "recipe__dish_name")
+        .annotate(count=Count("pk"))
+        .order_by()
+    ):
+        entry(row["recipe__author_id"], row["recipe_id"], row["recipe__dish_name"])[
+            "saves"
+        ] = row["count"]
+
+    for row in (
+        RecipeRating.objects.filter(
+            recipe__author_id__in=author_ids, updated_at__gte=start, updated_at__lt=end
+        )
+        .values("recipe__author_id", "recipe_id", "recipe__dish_name")
+        .annotate(count=Count("pk"), average=Avg("rating"))
+        .order_by()
+    ):
+        recipe = entry(
+            row["recipe__author_id"], row["recipe_id"], row["recipe__dish_name"]
+        )
+        recipe["ratings"] = row["count"]
+        recipe["average"] = round(row["average"], 1)
+
+    # События прошлых дней (если сводка не уходила) тоже попадают в письмо
+    event_ids = []
+    for row in DigestEvent.objects.filter(
+        author_id__in=author_ids, created_at__lt=end
+    ).values("pk", "author_id", "recipe_id", "recipe__dish_name", "kind"):
+        entry(row["author_id"], row["recipe_id"], row["recipe__dish_name"])[
+            "milestones"
+        ].append(KINDS[row["kind"]])
+        event_ids.append(row["pk"])
+
+    return activity, event_ids
+
+
+def _send_batch(authors, day, start, end, domain):
+    activity, event_ids = collect([pk for pk, _, _ in authors], start, end)
+    messages, sent_to = [], []
+    for pk, email, nickname in authors:
+        if pk not in activity:
+            continue
+        recipes = sorted(
+            (
+                {
+                    **recipe,
+                    "url": f"https://{domain}{reverse('recipe_detail', args=[recipe_id])}",
+                }
+                for recipe_id, recipe in activity[pk].items()
+            ),
+            key=lambda recipe: (-len(recipe["milestones"]), -recipe["saves"]),
+        )
+        body = render_to_string(
+            "emails/digest.txt", {"nickname": nickname, "day": day, "recipes": recipes}
+        )
+        messages.append(EmailMessage(SUBJECT.format(day), body, FROM_EMAIL, [email]))
+        sent_to.append(pk)
+
+    if messages:
+        # Одно соединение с SMTP-сервером на пачку писем
+        with count_emails("digest", len(messages)), get_connection() as connection:
+            connection.send_messages(messages)
+    User.objects.filter(pk__in=sent_to).update(digest_date=day)
+    DigestEvent.objects.filter(pk__in=event_ids).delete()
+    return len(messages)
+
+
+def send_digests(day=None, batch_size=BATCH_SIZE):
+    """Сводки за day (по умолчанию — вчера). Возвращает число писем"""
+    day = day or timezone.localdate() - timedelta(days=1)
+    start, end = digest_window(day)
+    domain = Site.objects.get_current().domain
+    sent = 0
+    for authors in _batches(_authors(day, start, end, batch_size), batch_size):
+        sent += _send_batch(authors, day, start, end, domain)
+    if sent:
+        logger.info(f"Сводки за {day}: отправлено {sent}")
+    return sent
@@ -0,0 +1,48 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Category
+
+# Счетчики рецептов по категориям для сайдбаров (фасеты).
+# Считаются одним GROUP BY по текущей выборке и кэшируются по нормализованному
+# запросу; любое изменение рецептов, избранного или категорий сдвигает
+# "поколение" кэша, и старые фасеты перестают читаться
+FACETS_TIMEOUT = 60  # Рейтинги поколение не сдвигают: /best/ обновится по TTL
+GENERATION_KEY = "facets:generation"
+
+
+def bump_generation():
+    """Инвалидация всех фасетов"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, timeout=None)
+
+
+def category_facets(queryset, *key_parts, counts=None):
+    """Список категорий с количеством рецептов выборки в каждой:
+    [{"id", "category", "count"}, ...]. key_parts — все, от чего зависит
+    выборка (страница, запрос, пользователь), без выбранной категории.
+    counts — функция, возвращающая {id категории: число} вместо GROUP BY
+    по queryset (поиск по ингредиентам считает по множеству id)"""
+    generation = cache.get_or_set(GENERATION_KEY, 1, timeout=None)
+    digest = hashlib.md5("|".join(map(str, key_parts)).encode()).hexdigest()
+    key = f"facets:{generation}:{digest}"
+
+    facets = cache.get(key)
+    if facets is None:
+        counts = (
+            counts()
+            if counts is not None
+            else dict(
+                queryset.order_by().values_list("category_id").annotate(n=Count("pk"))
+            )
+        )
+        facets = [
+            {"id": pk, "category": name, "count": counts.get(pk, 0)}
+            for pk, name in Category.objects.values_list("pk", "category")
+        ]
+        cache.set(key, facets, timeout=FACETS_TIMEOUT)
+    return facets
@@ -5,12 +5,24 @@ from django.core.exceptions import ValidationError
 from django_ckeditor_5.widgets import CKEditor5Widget
 
 
+class UploadImageField(forms.ImageField):
+    """Поле изображения, показывающее причину отказа обработчика загрузки
+    (см. app/uploads.py) вместо ошибки о пустом файле"""
+
+    def to_python(self, data):
+        upload_error = getattr(data, "upload_error", None)
+        if upload_error:
+            raise ValidationError(upload_error)
+        return super().to_python(data)
+
+
 class RecipeForm(forms.ModelForm):
     """Форма создания рецепта"""
 
     class Meta:
         model = Recipe
         fields = ["dish_name", "category", "picture", "description", "text"]
+        field_classes = {"picture": UploadImageField}
         widgets = {
             "dish_name": forms.TextInput(
                 attrs={
@@ -87,7 +99,7 @@ class SignUpForm(forms.ModelForm):
         ),
     )
 
-    avatar = forms.ImageField(required=False)
+    avatar = UploadImageField(required=False)
 
     class Meta:
         model = User
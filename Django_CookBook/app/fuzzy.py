@@ -0,0 +1,173 @@
+import math
+import re
+
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import Recipe, SearchTrigram, User
+
+# Нечеткий поиск по названию блюда и никнейму автора на триграммах,
+# как word_similarity в pg_trgm: близость — доля триграмм запроса,
+# найденных в названии (|Q ∩ T| / |Q|), поэтому опечатка в одном слове
+# многословного названия не тонет в остальных словах. При равной близости
+# выше стоят названия, целиком похожие на запрос (|Q ∩ T| / |Q ∪ T|).
+# На SQLite триграммы хранятся в таблице SearchTrigram; кандидаты отбираются
+# по индексу триграмм с порогом на число общих, точная близость считается
+# только для них. На PostgreSQL используется pg_trgm с GIN-индексом
+THRESHOLD = 0.5
+CANDIDATES = 200
+LIMIT = 100
+
+
+def uses_pg_trgm():
+    return connection.vendor == "postgresql"
+
+
+def register_lookups():
+    """Лукап trigram_word_similar (оператор %>) для CharField;
+    регистрируется один раз при запуске (AppConfig.ready)"""
+    if uses_pg_trgm():
+        from django.contrib.postgres.lookups import TrigramWordSimilar
+        from django.db.models import CharField
+
+        CharField.register_lookup(TrigramWordSimilar)
+
+
+def trigrams(text):
+    """Триграммы слов текста с дополнением пробелами (как в pg_trgm)"""
+    words = re.findall(r"\w+", text.lower().replace("ё", "е"))
+    result = set()
+    for word in words:
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(query, text):
+    """(доля триграмм запроса в тексте, близость по Жаккару) — ключ сортировки"""
+    shared = len(query & text)
+    union = len(query | text)
+    return (shared / len(query) if query else 0.0, shared / union if union else 0.0)
+
+
+def index_object(kind, object_id, text):
+    """Переиндексация одного названия или никнейма"""
+    with transaction.atomic():
+        SearchTrigram.objects.filter(kind=kind, object_id=object_id).delete()
+        SearchTrigram.objects.bulk_create(
+            [
+                SearchTrigram(trigram=trigram, kind=kind, object_id=object_id)
+                for trigram in trigrams(text)
+            ]
+        )
+
+
+def unindex_object(kind, object_id):
+    SearchTrigram.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild_index(batch_size=5000):
+    """Полная пересборка таблицы триграмм. Возвращает число записей"""
+    sources = [
+        (SearchTrigram.DISH, Recipe.objects.values_list("pk", "dish_name")),
+        (SearchTrigram.AUTHOR, User.objects.values_list("pk", "nickname")),
+    ]
+    total = 0
+    with transaction.atomic():
+        SearchTrigram.objects.all().delete()
+        for kind, rows in sources:
+            batch = []
+            for object_id, text in rows.iterator(chunk_size=batch_size):
+                batch.extend(
+                    SearchTrigram(trigram=trigram, kind=kind, object_id=object_id)
+                    for trigram in trigrams(text)
+                )
+                if len(batch) >= batch_size:
+                    SearchTrigram.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            SearchTrigram.objects.bulk_create(batch)
+            total += len(batch)
+    return total
+
+
+def _pg_trgm_ranked(query, threshold, limit):
+    """Рецепты по убыванию близости через pg_trgm (оператор %> использует
+    GIN-индексы из миграции)"""
+    from django.contrib.postgres.search import TrigramSimilarity, TrigramWordSimilarity
+    from django.db.models import Q
+    from django.db.models.functions import Greatest
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('pg_trgm.word_similarity_threshold', %s, false)",
+            [str(threshold)],
+        )
+
+    return list(
+        Recipe.objects.filter(
+            Q(dish_name__trigram_word_similar=query)
+            | Q(author__nickname__trigram_word_similar=query)
+        )
+        .annotate(
+            word_similarity=Greatest(
+                TrigramWordSimilarity(query, "dish_name"),
+                TrigramWordSimilarity(query, "author__nickname"),
+            ),
+            similarity=Greatest(
+                TrigramSimilarity("dish_name", query),
+                TrigramSimilarity("author__nickname", query),
+            ),
+        )
+        .order_by("-word_similarity", "-similarity")
+        .values_list("pk", flat=True)[:limit]
+    )
+
+
+def fuzzy_recipe_ids(query, threshold=THRESHOLD, limit=LIMIT):
+    """Id рецептов, похожих на запрос по названию или никнейму автора,
+    по убыванию близости"""
+    if uses_pg_trgm():
+        return _pg_trgm_ranked(query, threshold, limit)
+
+    query_trigrams = trigrams(query)
+    if not query_trigrams:
+        return []
+
+    # Близость ≥ threshold — это ровно не меньше threshold × |Q| общих
+    # триграмм, поэтому отсечение по индексу ничего не теряет
+    min_shared = max(1, math.ceil(threshold * len(query_trigrams)))
+    candidates = (
+        SearchTrigram.objects.filter(trigram__in=query_trigrams)
+        .values_list("kind", "object_id")
+        .annotate(shared=Count("id"))
+        .filter(shared__gte=min_shared)
+        .order_by("-shared")[:CANDIDATES]
+    )
+    dish_ids = [pk for kind, pk, _ in candidates if kind == SearchTrigram.DISH]
+    author_ids = [pk for kind, pk, _ in candidates if kind == SearchTrigram.AUTHOR]
+
+    scores = {}
+    for pk, dish_name in Recipe.objects.filter(pk__in=dish_ids).values_list(
+        "pk", "dish_name"
+    ):
+        scores[pk] = similarity(query_trigrams, trigrams(dish_name))
+
+    author_scores = {
+        pk: similarity(query_trigrams, trigrams(nickname))
+        for pk, nickname in User.objects.filter(pk__in=author_ids).values_list(
+            "pk", "nickname"
+        )
+    }
+    author_scores = {pk: s for pk, s in author_scores.items() if s[0] >= threshold}
+    for pk, author_id in Recipe.objects.filter(author_id__in=author_scores).values_list(
+        "pk", "author_id"
+    )[:CANDIDATES]:
+        scores[pk] = max(scores.get(pk, (0.0, 0.0)), author_scores[author_id])
+
+    ranked = sorted(
+        (pk for pk, score in scores.items() if score[0] >= threshold),
+        key=lambda pk: scores[pk],
+        reverse=True,
+    )
+    return ranked[:limit]
@@ -0,0 +1,245 @@
+import re
+import time
+from html.parser import HTMLParser
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .autocomplete import normalize
+from .models import Ingredient, Recipe, RecipeIngredient
+
+# Ингредиенты извлекаются из HTML шагов приготовления: берутся пункты
+# списков (<li>), а если списков нет — весь текст, и сверяются со словарем
+# Ingredient. Основа слова из словаря совпадает с формами слова
+# ("сыр" → "сыра", "сыром"), основа со звездочкой — с любым продолжением
+# ("яичн*" → "яичный"). Для поиска по ингредиентам в памяти процесса
+# держится инвертированный индекс ингредиент → сжатое множество id рецептов;
+# при изменениях сдвигается версия в кэше, и индекс перестраивается
+ENDINGS = "а|я|о|у|ю|ом|ем|ой|ей|е|и|ы|ов|ев|ам|ям|ами|ями|ах|ях|ь|ью"
+VERSION_KEY = "ingredients:version"
+# Совпадений в одном pk__in: SQLite принимает не больше 32766 параметров
+MATCH_LIMIT = 1000
+
+_index = {"version": None, "bitmaps": {}}
+
+
+class _ListItems(HTMLParser):
+    """Текст пунктов списков и весь текст документа"""
+
+    def __init__(self):
+        super().__init__()
+        self.items, self.text = [], []
+        self._depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "li":
+            self._depth += 1
+            self.items.append("")
+
+    def handle_endtag(self, tag):
+        if tag == "li" and self._depth:
+            self._depth -= 1
+
+    def handle_data(self, data):
+        if self._depth:
+            self.items[-1] += data
+        self.text.append(data)
+
+
+def _alias_pattern(alias):
+    words = []
+    for word in alias.split():
+        stem = normalize(word.rstrip("*"))
+        if word.endswith("*"):
+            words.append(re.escape(stem) + r"\w*")
+        else:
+            words.append(re.escape(stem) + f"(?:{ENDINGS})?")
+    return r"\s+".join(words)
+
+
+def compile_dictionary(rows):
+    """Словарь для извлечения: rows — пары (id ингредиента, основы через запятую)"""
+    dictionary = []
+    for pk, aliases in rows:
+        patterns = [_alias_pattern(a) for a in aliases.split(",") if a.strip()]
+        if patterns:
+            dictionary.append(
+                (pk, re.compile(rf"(?<!\w)(?:{'|'.join(patterns)})(?!\w)"))
+            )
+    return dictionary
+
+
+def load_dictionary():
+    return compile_dictionary(Ingredient.objects.values_list("pk", "aliases"))
+
+
+def extract_ingredients(html, dictionary):
+    """Множество id ингредиентов, упомянутых в шагах рецепта"""
+    parser = _ListItems()
+    parser.feed(html or "")
+    parser.close()
+    lines = [normalize(item) for item in parser.items]
+    if not any(lines):
+        lines = [normalize(" ".join(parser.text))]
+    return {
+        pk for pk, pattern in dictionary if any(pattern.search(line) for line in lines)
+    }
+
+
+def _initial_version():
+    # После сброса кэша счетчик начинается не с 1: иначе он совпадет с
+    # версией индекса, который процесс построил до сброса
+    return time.time_ns()
+
+
+def bump_version():
+    """Инвалидация индексов во всех процессах"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _initial_version(), timeout=None)
+
+
+def update_recipe_ingredients(recipe, dictionary=None):
+    """Пересчет ингредиентов рецепта при сохранении.
+    Возвращает True, если набор изменился"""
+    found = extract_ingredients(recipe.text, dictionary or load_dictionary())
+    current = set(
+        RecipeIngredient.objects.filter(recipe=recipe).values_list(
+            "ingredient_id", flat=True
+        )
+    )
+    if found == current:
+        return False
+
+    with transaction.atomic():
+        RecipeIngredient.objects.filter(
+            recipe=recipe, ingredient_id__in=current - found
+        ).delete()
+        RecipeIngredient.objects.bulk_create(
+            [
+                RecipeIngredient(recipe=recipe, ingredient_id=pk)
+                for pk in found - current
+            ],
+            ignore_conflicts=True,
+        )
+    bump_version()
+    return True
+
+
+def extract_all(batch_size=500):
+    """Повторное извлечение для всего каталога (после изменения словаря).
+    Возвращает число рецептов, у которых изменился набор"""
+    dictionary = load_dictionary()
+    changed = 0
+    for recipe in Recipe.objects.only("pk", "text").iterator(chunk_size=batch_size):
+        changed += update_recipe_ingredients(recipe, dictionary)
+    return changed
+
+
+def build_index():
+    """Инвертированный индекс из таблицы связей: id ингредиента → RoaringBitmap"""
+    # NumPy импортируется при первой сборке индекса, а не при запуске
+    # процесса (модуль загружается вместе с сигналами)
+    import numpy as np
+
+    from .bitmap import RoaringBitmap
+
+    pairs = np.fromiter(
+        (
+            value
+            for row in RecipeIngredient.objects.order_by()
+            .values_list("ingredient_id", "recipe_id")
+            .iterator(chunk_size=10000)
+            for value in row
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    if not len(pairs):
+        return {}
+
+    pairs = pairs[np.argsort(pairs[:, 0], kind="stable")]
+    keys, starts = np.unique(pairs[:, 0], return_index=True)
+    return {
+        key: RoaringBitmap.from_ids(recipe_ids)
+        for key, recipe_ids in zip(keys.tolist(), np.split(pairs[:, 1], starts[1:]))
+    }
+
+
+def get_index():
+    # Версия читается до построения: изменения во время сборки
+    # приведут к повторной сборке на следующем запросе
+    version = cache.get_or_set(VERSION_KEY, _initial_version, timeout=None)
+    if _index["version"] != version:
+        _index["bitmaps"] = build_index()
+        _index["version"] = version
+    return _index["bitmaps"]
+
+
+def match_recipes(ingredient_ids, match_all=True):
+    """Id рецептов со всеми (или хотя бы одним) из ингредиентов"""
+    from .bitmap import RoaringBitmap
+
+    index = get_index()
+    bitmaps = [index.get(pk, RoaringBitmap()) for pk in ingredient_ids]
+    if match_all:
+        return RoaringBitmap.intersection(bitmaps)
+    return RoaringBitmap.union(bitmaps)
+
+
+def within(ids, queryset):
+    """Id множества, которые входят в queryset (текстовый поиск, категория);
+    из БД читаются только id выборки в диапазоне id множества"""
+    import numpy as np
+
+    from .bitmap import RoaringBitmap
+
+    array = ids.to_array()
+    if not len(array):
+        return ids
+    rows = (
+        queryset.filter(pk__range=(int(array[0]), int(array[-1])))
+        .order_by()
+        .values_list("pk", flat=True)
+    )
+    return ids & RoaringBitmap.from_ids(
+        np.fromiter(rows.iterator(chunk_size=10000), dtype=np.int64)
+    )
+
+
+def category_counts(ids):
+    """{id категории: число рецептов} для всего множества, без ограничения
+    MATCH_LIMIT; из БД читаются пары (id, категория) в диапазоне множества"""
+    import numpy as np
+
+    array = ids.to_array()
+    if not len(array):
+        return {}
+    rows = Recipe.objects.filter(pk__range=(int(array[0]), int(array[-1]))).values_list(
+        "pk", "category_id"
+    )
+    pairs = np.fromiter(
+        (value for row in rows.iterator(chunk_size=10000) for value in row),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    categories, counts = np.unique(
+        pairs[np.isin(pairs[:, 0], array), 1], return_counts=True
+    )
+    return dict(zip(categories.tolist(), counts.tolist()))
+
+
+def newest(ids):
+    """Не больше MATCH_LIMIT id с конца множества (самые новые рецепты) —
+    список для pk__in ограниченной длины"""
+    return ids.to_array()[::-1][:MATCH_LIMIT].tolist()
+
+
+def ingredient_counts():
+    """Ингредиенты, которые встречаются в рецептах, с числом рецептов:
+    [{"id", "name", "count"}, ...] — без запросов к таблице связей"""
+    index = get_index()
+    return [
+        {"id": pk, "name": name, "count": len(index[pk])}
+        for pk, name in Ingredient.objects.values_list("pk", "name")
+        if pk in index
+    ]
@@ -0,0 +1,70 @@
+import json
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from app import api
+from app.views import BestRecipes, SearchRecipe
+
+PAGE_SIZE = 10  # Как на HTML-страницах
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк JSON API против рендеринга страниц search.html и best.html "
+        "на текущем каталоге: время запроса и рецептов в секунду"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--query", default="", help="Поисковый запрос (q)")
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        params = {"q": options["query"]} if options["query"] else {}
+        pairs = [
+            ("search.html", SearchRecipe.as_view(), "/search/", {}),
+            ("api/recipes", api.recipe_list, "/api/recipes/", {"limit": PAGE_SIZE}),
+            ("best.html", BestRecipes.as_view(), "/best/", {}),
+            (
+                "api/recipes/best",
+                api.best_list,
+                "/api/recipes/best/",
+                {"limit": PAGE_SIZE},
+            ),
+        ]
+        for label, view, path, extra in pairs:
+
+            def call():
+                # Без If-None-Match: каждый запрос рендерится полностью
+                request = factory.get(path, {**params, **extra})
+                request.user = AnonymousUser()
+                request.session = {}
+                response = view(request)
+                if hasattr(response, "render"):
+                    response.render()
+                return response
+
+            response = call()  # Прогрев: кэши фасетов, шаблонов, индексов
+            recipes = (
+                len(response.context_data["recipes"])
+                if hasattr(response, "context_data")
+                else len(json.loads(response.content)["results"])
+            )
+            timings = []
+            for _ in range(options["requests"]):
+                started = time.perf_counter()
+                call()
+                timings.append((time.perf_counter() - started) * 1000)
+
+            timings.sort()
+            p50 = timings[len(timings) // 2]
+            p99 = timings[int(len(timings) * 0.99)]
+            total = sum(timings) / 1000
+            self.stdout.write(
+                f"{label:<18} {recipes} рецептов, {len(response.content) / 1024:.1f} КБ: "
+                f"p50 {p50:.2f} мс, p99 {p99:.2f} мс, "
+                f"{recipes * len(timings) / total:.0f} рецептов/с"
+            )
@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from app.autocomplete import build_index, drop_version, normalize, suggest
+
+WORDS = (
+    "салат суп пирог торт паста соус рагу плов борщ блины омлет запеканка "
+    "курица говядина свинина лосось тунец креветки грибы сыр томаты картофель "
+    "шоколадный ванильный острый домашний летний быстрый французский итальянский "
+    "цезарь болоньезе карбонара наполеон тирамису чизкейк шарлотка киш брускетта"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк подсказок поиска: индекс на синтетическом каталоге "
+        "и задержка запросов по случайным префиксам"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=2_000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        version_key = "autocomplete:benchmark:version"
+
+        labels = [
+            " ".join(rng.sample(WORDS, rng.randint(2, 4))).capitalize()
+            for _ in range(options["recipes"])
+        ]
+        entries = (
+            (f"r:{i}", label, int(rng.paretovariate(1.2)))
+            for i, label in enumerate(labels)
+        )
+
+        started = time.perf_counter()
+        version = build_index(entries, version="benchmark", version_key=version_key)
+        self.stdout.write(f"Индекс: {time.perf_counter() - started:.1f} сек")
+
+        timings = []
+        for _ in range(options["queries"]):
+            label = normalize(rng.choice(labels))
+            query = label[: rng.randint(1, min(len(label), 12))]
+            started = time.perf_counter()
+            suggest(query, version_key=version_key)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p99 = timings[int(len(timings) * 0.99)]
+        self.stdout.write(
+            f"{options['recipes']} рецептов, {len(timings)} запросов: "
+            f"p50 {p50:.2f} мс, p99 {p99:.2f} мс, max {timings[-1]:.2f} мс"
+        )
+
+        drop_version(version)
+        get_redis_connection("default").delete(version_key)
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from app import ratelimit
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк ограничения частоты: задержка одной проверки token bucket "
+        "в Redis и в памяти процесса"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=10_000)
+        parser.add_argument("--clients", type=int, default=1_000)
+        parser.add_argument("--rate", default="30/m")
+
+    def measure(self, check_bucket, options):
+        capacity, period = ratelimit.parse_rate(options["rate"])
+        timings = []
+        for i in range(options["checks"]):
+            key = ratelimit.KEY.format("benchmark", f"a{i % options['clients']}")
+            started = time.perf_counter()
+            check_bucket(key, capacity, capacity / period)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        timings.sort()
+        return (
+            timings[len(timings) // 2],
+            timings[int(len(timings) * 0.99)],
+            timings[-1],
+        )
+
+    def report(self, title, stats):
+        p50, p99, worst = stats
+        self.stdout.write(
+            f"{title}: p50 {p50:.0f} мкс, p99 {p99:.0f} мкс, max {worst:.0f} мкс"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['checks']} проверок, {options['clients']} клиентов, "
+            f"лимит {options['rate']}"
+        )
+        self.report("Redis (Lua)", self.measure(ratelimit._check_redis, options))
+        # Резервный режим на случай недоступности Redis
+        self.report("Память процесса", self.measure(ratelimit._check_local, options))
+
+        redis = get_redis_connection("default")
+        keys = list(redis.scan_iter(ratelimit.KEY.format("benchmark", "*")))
+        if keys:
+            redis.delete(*keys)
+        ratelimit._local_buckets.clear()
@@ -0,0 +1,50 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from app.recommendations import TOP_K, compute_similar
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк расчета похожих рецептов на синтетических данных: "
+        "время пересборки в зависимости от числа взаимодействий"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[10_000, 100_000, 1_000_000],
+            help="Число взаимодействий",
+        )
+        parser.add_argument("--recipes", type=int, default=5_000)
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        n_recipes, n_users = options["recipes"], options["users"]
+
+        # Популярность рецептов и активность пользователей — степенной закон
+        recipe_p = 1.0 / np.arange(1, n_recipes + 1) ** 0.8
+        recipe_p /= recipe_p.sum()
+        user_p = 1.0 / np.arange(1, n_users + 1) ** 0.6
+        user_p /= user_p.sum()
+
+        self.stdout.write(f"{'взаимодействий':>15} {'рецептов':>9} {'сек':>8}")
+        for size in options["sizes"]:
+            users = rng.choice(n_users, size=size, p=user_p)
+            items = rng.choice(n_recipes, size=size, p=recipe_p)
+            weights = rng.integers(1, 6, size=size) / 5.0
+
+            started = time.perf_counter()
+            recipe_ids, _, _ = compute_similar(
+                users, items, weights, top_k=TOP_K, workers=options["workers"]
+            )
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(f"{size:>15} {len(recipe_ids):>9} {elapsed:>8.2f}")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from app.storage import DeduplicatedStorage, deduplicate_existing
+
+
+class Command(BaseCommand):
+    help = (
+        "Перевод загруженных раньше изображений на имена по содержимому: "
+        "одинаковые файлы остаются в хранилище в одном экземпляре"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только вывести новые имена файлов",
+        )
+
+    def handle(self, *args, **options):
+        renamed = deduplicate_existing(
+            DeduplicatedStorage(), dry_run=options["dry_run"]
+        )
+        for old, new in renamed.items():
+            self.stdout.write(f"{old} → {new}")
+        unique = len(set(renamed.values()))
+        self.stdout.write(
+            self.style.SUCCESS(f"Файлов: {len(renamed)}, уникальных: {unique}")
+        )
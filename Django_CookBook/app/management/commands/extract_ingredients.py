@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.ingredients import extract_all
+
+
+class Command(BaseCommand):
+    help = "Повторное извлечение ингредиентов из шагов всех рецептов"
+
+    def handle(self, *args, **options):
+        changed = extract_all()
+        self.stdout.write(self.style.SUCCESS(f"Обновлено рецептов: {changed}"))
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import Resolver404, resolve
+
+from app.models import User
+from app.profiling import Profiler, format_report, save
+
+
+class Command(BaseCommand):
+    help = (
+        "Профиль страницы без сервера: запрос через весь стек middleware, "
+        "самые горячие функции и SQL-запросы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь с параметрами, например /search/?q=суп")
+        parser.add_argument("--user", help="Email пользователя, от имени которого")
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--top", type=int, default=20)
+        parser.add_argument(
+            "--save", action="store_true", help="Сохранить профиль (show_profiles)"
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            match = resolve(path.split("?", 1)[0])
+        except Resolver404:
+            raise CommandError(f"Маршрут не найден: {path}")
+
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        if options["user"]:
+            try:
+                client.force_login(User.objects.get(email=options["user"]))
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь не найден: {options['user']}")
+
+        response = client.get(path)  # Прогрев: кэши шаблонов, фасетов, индексов
+        if response.status_code >= 400:
+            self.stderr.write(f"Ответ {response.status_code}")
+
+        profiler = Profiler("url", match.view_name)
+        profiler.start()
+        try:
+            for _ in range(options["repeat"]):
+                client.get(path)
+        finally:
+            report = profiler.stop()
+        report.update(path=path, repeat=options["repeat"])
+        if options["save"]:
+            save(report)
+
+        for line in format_report(report, options["top"]):
+            self.stdout.write(line)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.autocomplete import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Пересборка префиксного индекса подсказок поиска в Redis"
+
+    def handle(self, *args, **options):
+        version = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Индекс подсказок собран: {version}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.recommendations import TOP_K, rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    help = "Пересчет похожих рецептов (SimilarRecipe) по сохранениям и оценкам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=TOP_K)
+        parser.add_argument(
+            "--workers", type=int, default=1, help="Число процессов для расчета"
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_similar_recipes(
+            top_k=options["top_k"], workers=options["workers"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Сохранено пар: {count}"))
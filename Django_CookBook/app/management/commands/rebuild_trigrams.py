@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app.fuzzy import rebuild_index, uses_pg_trgm
+
+
+class Command(BaseCommand):
+    help = "Пересборка таблицы триграмм для нечеткого поиска (не нужна на PostgreSQL)"
+
+    def handle(self, *args, **options):
+        if uses_pg_trgm():
+            self.stdout.write("PostgreSQL: используется pg_trgm, пересборка не нужна")
+            return
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Сохранено триграмм: {count}"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.profiling import format_report, recent
+
+
+class Command(BaseCommand):
+    help = (
+        "Сохраненные профили запросов и задач: список или отчет по id "
+        "(--stacks — свернутые стеки для flame graph)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("id", nargs="?", help="Id профиля (X-Profile-Id)")
+        parser.add_argument("--top", type=int, default=20)
+        parser.add_argument("--stacks", action="store_true")
+
+    def handle(self, *args, **options):
+        profiles = recent()
+        if not options["id"]:
+            for report in profiles:
+                self.stdout.write(
+                    f"{report['id']}  {report['started_at'][:19]}  "
+                    f"{report['kind']} {report['name']}: "
+                    f"{report['seconds'] * 1000:.1f} мс, "
+                    f"SQL {report['query_count']}"
+                )
+            return
+
+        report = next((p for p in profiles if p["id"] == options["id"]), None)
+        if report is None:
+            raise CommandError(f"Профиль не найден: {options['id']}")
+        if options["stacks"]:
+            for stack, count in report["stacks"].items():
+                self.stdout.write(f"{stack} {count}")
+            return
+        for line in format_report(report, options["top"]):
+            self.stdout.write(line)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.startup import import_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Время запуска процесса до готовности URL: самые дорогие пакеты "
+        "и кто их импортирует; --check — ошибка при превышении бюджета"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--check", action="store_true")
+
+    def handle(self, *args, **options):
+        try:
+            report = import_report()
+        except RuntimeError as e:
+            raise CommandError(f"Процесс не запустился: {e}")
+
+        self.stdout.write(
+            f"Запуск: {report['seconds']:.2f} с (бюджет {report['budget']:.2f} с), "
+            f"из них импорт {report['import_seconds']:.2f} с"
+        )
+        for package, seconds, chain in report["packages"][: options["top"]]:
+            importers = " ← ".join(chain[:3])
+            self.stdout.write(
+                f"{seconds * 1000:>8.1f} мс  {package}"
+                + (f"  ← {importers}" if importers else "")
+            )
+
+        if options["check"] and report["seconds"] > report["budget"]:
+            raise CommandError(
+                f"Запуск дольше бюджета: {report['seconds']:.2f} с "
+                f"> {report['budget']:.2f} с"
+            )
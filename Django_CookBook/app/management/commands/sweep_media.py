@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from app.media import ORPHAN_GRACE, drain, find_orphans, sweep_orphans
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаление файлов хранилища, на которые не ссылается ни один рецепт "
+        "или пользователь, и разбор очереди удаления"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только вывести найденные файлы",
+        )
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=ORPHAN_GRACE.total_seconds() / 3600,
+            help="Не трогать файлы моложе указанного числа часов",
+        )
+
+    def handle(self, *args, **options):
+        grace = timedelta(hours=options["grace_hours"])
+        if options["dry_run"]:
+            for name in find_orphans(grace=grace):
+                self.stdout.write(name)
+            return
+
+        deleted = drain()
+        found, removed = sweep_orphans(grace=grace)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Из очереди удалено: {deleted}; "
+                f"брошенных файлов найдено: {found}, удалено: {removed}"
+            )
+        )
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирование основной базы SQLite в файлы реплик "
+        "(локальная проверка чтения с реплик, см. app/db_router.py)"
+    )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("Реплики не настроены (DATABASE_REPLICAS)")
+        if primary["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("Реплики другой СУБД обновляет сама СУБД")
+
+        source = sqlite3.connect(primary["NAME"])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                target = sqlite3.connect(settings.DATABASES[alias]["NAME"])
+                try:
+                    source.backup(target)  # Согласованная копия без остановки
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f"{alias} обновлена"))
+        finally:
+            source.close()
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from kombu.exceptions import OperationalError
+
+from app.task_metrics import queue_lengths, task_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Метрики задач Celery: число отправок и выполнений, среднее время, ошибки "
+        "и повторы, ожидание в очередях и их текущая длина"
+    )
+
+    def handle(self, *args, **options):
+        tasks, queues = task_stats()
+        for name, stats in sorted(tasks.items()):
+            count = stats.get("count", 0)
+            average = stats.get("seconds", 0) / count if count else 0
+            sent = sum(v for f, v in stats.items() if f.startswith("sent:"))
+            self.stdout.write(
+                f"{name}: {sent:.0f} отправок, {count:.0f} выполнений, "
+                f"в среднем {average:.2f} с, "
+                f"ошибок {stats.get('state:FAILURE', 0):.0f}, "
+                f"повторов {stats.get('state:RETRY', 0):.0f}"
+            )
+
+        try:
+            lengths = queue_lengths()
+        except OperationalError as e:
+            self.stderr.write(f"Брокер недоступен: {e}")
+            lengths = {}
+        for name in sorted(set(lengths) | set(queues)):
+            stats = queues.get(name, {})
+            lag = stats.get("lag_seconds", 0) / max(stats.get("lag_count", 0), 1)
+            self.stdout.write(
+                f"Очередь {name}: {lengths.get(name, '?')} сообщений, "
+                f"среднее ожидание {lag:.2f} с"
+            )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from app.conditional import CATALOG, bump, recipe_scope
+from app.ranking import AGGREGATE_FIELDS, find_drift, repair_drift
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверка хранимых агрегатов и гистограмм оценок рецептов "
+        "с таблицей оценок; с --repair расхождения исправляются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Пересчитать рецепты с расхождениями",
+        )
+
+    def handle(self, *args, **options):
+        drift = find_drift()
+        for pk, (stored, actual) in drift.items():
+            changes = ", ".join(
+                f"{field}: {old} → {new}"
+                for field, old, new in zip(AGGREGATE_FIELDS, stored, actual)
+                if old != new
+            )
+            self.stdout.write(f"Рецепт {pk}: {changes}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Расхождений нет"))
+        elif options["repair"]:
+            repair_drift(drift)
+            bump(CATALOG, *map(recipe_scope, drift))
+            self.stdout.write(self.style.SUCCESS(f"Исправлено рецептов: {len(drift)}"))
+        else:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Расхождений: {len(drift)}; запустите с --repair для исправления"
+                )
+            )
@@ -0,0 +1,169 @@
+import logging
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from .models import MediaDeletion, Recipe, User
+
+logger = logging.getLogger(__name__)
+
+# Удаление файлов изображений вынесено из запросов: старые и ненужные
+# файлы попадают в таблицу-очередь MediaDeletion (в той же транзакции,
+# что и изменение строки), а периодическая задача разбирает ее пачками.
+# В S3 пачка удаляется одним запросом DeleteObjects (до 1000 ключей),
+# в остальных хранилищах — по одному файлу.
+# Файлы, на которые никто не ссылается (брошенные при регистрации tmp/,
+# потерянные при сбоях), находит сверка листинга хранилища с БД
+BATCH_SIZE = 1000  # Предел DeleteObjects
+MAX_ATTEMPTS = 5
+DIRECTORIES = ("pictures/", "avatars/")  # upload_to изображений рецептов и аватаров
+TMP_DIRECTORY = "tmp/"  # Аватары из формы регистрации до подтверждения email
+TMP_TTL = timedelta(hours=1)  # Данные формы живут 30 минут
+ORPHAN_GRACE = timedelta(hours=24)  # Файл мог быть загружен, а строка — еще нет
+
+
+def _default_avatar():
+    return User._meta.get_field("avatar").default
+
+
+def enqueue(names):
+    """Постановка файлов в очередь на удаление"""
+    skip = {"", None, _default_avatar()}
+    MediaDeletion.objects.bulk_create(
+        [MediaDeletion(name=name) for name in dict.fromkeys(names) if name not in skip]
+    )
+
+
+def _referenced(names):
+    """Имена из names, которые снова используются рецептом или аватаром"""
+    return set(
+        Recipe.objects.filter(picture__in=names).values_list("picture", flat=True)
+    ) | set(User.objects.filter(avatar__in=names).values_list("avatar", flat=True))
+
+
+def delete_files(names, storage=default_storage):
+    """Удаление файлов пачками; возвращает множество имен, удалить которые
+    не удалось"""
+    names = list(names)
+    if hasattr(storage, "delete_many"):  # Учет блобов, см. app/storage.py
+        return storage.delete_many(names)
+
+    failed = set()
+    bucket = getattr(storage, "bucket", None)  # S3 (django-storages)
+    if bucket is None:
+        for name in names:
+            try:
+                storage.delete(name)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить файл {name}: {e}")
+                failed.add(name)
+        return failed
+
+    from storages.utils import clean_name
+
+    for start in range(0, len(names), BATCH_SIZE):
+        keys = {
+            storage._normalize_name(clean_name(name)): name
+            for name in names[start : start + BATCH_SIZE]
+        }
+        try:
+            response = bucket.delete_objects(
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось удалить пачку из {len(keys)} файлов: {e}")
+            failed.update(keys.values())
+            continue
+        for error in response.get("Errors", []):
+            logger.warning(f"Не удалось удалить файл {error['Key']}: {error}")
+            failed.add(keys.get(error["Key"], error["Key"]))
+    return failed
+
+
+def drain(batch_size=BATCH_SIZE, storage=default_storage):
+    """Разбор очереди удаления. Возвращает число удаленных файлов"""
+    deleted = 0
+    while True:
+        batch = list(
+            MediaDeletion.objects.order_by("pk").values_list("pk", "name")[:batch_size]
+        )
+        if not batch:
+            return deleted
+
+        names = {name for _, name in batch}
+        obsolete = names - _referenced(names)
+        failed = delete_files(obsolete, storage) if obsolete else set()
+        deleted += len(obsolete) - len(failed)
+
+        MediaDeletion.objects.filter(
+            pk__in=[pk for pk, name in batch if name not in failed]
+        ).delete()
+        if not failed:
+            continue
+
+        retry = MediaDeletion.objects.filter(name__in=failed)
+        retry.update(attempts=F("attempts") + 1)
+        given_up = retry.filter(attempts__gte=MAX_ATTEMPTS)
+        for name in given_up.values_list("name", flat=True):
+            logger.error(f"Файл {name} не удален после {MAX_ATTEMPTS} попыток")
+        given_up.delete()
+        # Хранилище сбоит — остальное подождет следующего запуска
+        return deleted
+
+
+def _listing(storage, directory):
+    """(имя, время изменения) всех файлов каталога хранилища"""
+    storage = getattr(storage, "backend", storage)  # Обертка с дедупликацией
+    bucket = getattr(storage, "bucket", None)
+    if bucket is not None:
+        # Листинг S3 отдает время изменения сразу — без HEAD на каждый файл
+        prefix = storage._normalize_name(directory)
+        location = storage._normalize_name("")
+        for obj in bucket.objects.filter(Prefix=prefix):
+            yield obj.key[len(location) :].lstrip("/"), obj.last_modified
+        return
+
+    if not storage.exists(directory):
+        return
+    subdirectories, files = storage.listdir(directory)
+    for name in files:
+        path = f"{directory}{name}"
+        yield path, storage.get_modified_time(path)
+    for subdirectory in subdirectories:
+        yield from _listing(storage, f"{directory}{subdirectory}/")
+
+
+def find_orphans(storage=default_storage, grace=ORPHAN_GRACE, tmp_ttl=TMP_TTL):
+    """Файлы хранилища без ссылок из БД"""
+    now = timezone.now()
+    referenced = (
+        set(Recipe.objects.values_list("picture", flat=True))
+        | set(User.objects.values_list("avatar", flat=True))
+        | set(MediaDeletion.objects.values_list("name", flat=True))  # Уже в очереди
+        | {_default_avatar()}
+    )
+    orphans = []
+    for directory in DIRECTORIES:
+        orphans += [
+            name
+            for name, modified in _listing(storage, directory)
+            if name not in referenced and modified < now - grace
+        ]
+    orphans += [
+        name
+        for name, modified in _listing(storage, TMP_DIRECTORY)
+        if modified < now - tmp_ttl
+    ]
+    return orphans
+
+
+def sweep_orphans(storage=default_storage, **kwargs):
+    """Сверка хранилища с БД и удаление брошенных файлов пачками.
+    Возвращает (найдено, удалено)"""
+    orphans = find_orphans(storage, **kwargs)
+    if not orphans:
+        return 0, 0
+    failed = delete_files(orphans, storage)
+    return len(orphans), len(orphans) - len(failed)
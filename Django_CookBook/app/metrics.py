@@ -0,0 +1,222 @@
+import logging
+import os
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from django_redis.client import DefaultClient
+from kombu.exceptions import OperationalError
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    HistogramMetricFamily,
+    SummaryMetricFamily,
+)
+from prometheus_client.utils import floatToGoString
+from redis.exceptions import RedisError
+
+from .task_metrics import DURATION_BUCKETS, queue_lengths, task_stats
+
+logger = logging.getLogger(__name__)
+
+# Метрики в текстовом формате Prometheus на /metrics.
+# Под Gunicorn каждый воркер пишет значения в файлы общего каталога
+# PROMETHEUS_MULTIPROC_DIR (переменная окружения задается до запуска,
+# см. gunicorn.conf.py), /metrics суммирует их по всем воркерам. Без
+# каталога метрики живут в памяти процесса (runserver, тесты).
+# Метрики задач Celery (отправки, выполнения) копятся в Redis (task_metrics),
+# длина очередей — у брокера: они читаются в момент сбора.
+# Доступ — с адресов METRICS_ALLOWED_IPS и для персонала
+METRICS_ALLOWED_IPS = ("127.0.0.1", "::1")
+DB_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+UPLOAD_BYTES_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 512 * 1024, 1024 * 1024)
+
+REQUEST_SECONDS = Histogram(
+    "cookbook_request_seconds", "Время ответа по маршрутам", ["view", "status"]
+)
+REQUEST_QUERIES = Histogram(
+    "cookbook_request_db_queries",
+    "Запросов к БД за HTTP-запрос",
+    ["view"],
+    buckets=DB_QUERY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "cookbook_cache_requests", "Чтения из кэша по префиксу ключа", ["prefix", "result"]
+)
+EMAILS_SENT = Counter("cookbook_emails_sent", "Отправленные письма", ["kind"])
+EMAILS_FAILED = Counter(
+    "cookbook_emails_failed", "Письма, которые не удалось отправить", ["kind"]
+)
+UPLOAD_BYTES = Histogram(
+    "cookbook_upload_bytes", "Размер принятых файлов", buckets=UPLOAD_BYTES_BUCKETS
+)
+UPLOAD_SECONDS = Histogram("cookbook_upload_seconds", "Время приема файлов")
+UPLOADS_REJECTED = Counter(
+    "cookbook_uploads_rejected", "Отклоненные загрузки по причинам", ["reason"]
+)
+
+
+class MetricsMiddleware:
+    """Время ответа и число запросов к БД по имени маршрута"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(connections[alias].execute_wrapper(count_query))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        REQUEST_SECONDS.labels(view, response.status_code).observe(seconds)
+        REQUEST_QUERIES.labels(view).observe(queries)
+        return response
+
+
+def key_prefix(key):
+    """Префикс ключа кэша до первого двоеточия ("etag:catalog" -> "etag")"""
+    return str(key).partition(":")[0]
+
+
+class MeteredRedisClient(DefaultClient):
+    """Клиент django_redis, считающий попадания и промахи чтений"""
+
+    _missing = object()
+
+    def get(self, key, default=None, version=None, client=None):
+        value = super().get(key, self._missing, version=version, client=client)
+        hit = value is not self._missing
+        CACHE_REQUESTS.labels(key_prefix(key), "hit" if hit else "miss").inc()
+        return value if hit else default
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        found = super().get_many(keys, version=version, client=client)
+        for key in keys:
+            CACHE_REQUESTS.labels(
+                key_prefix(key), "hit" if key in found else "miss"
+            ).inc()
+        return found
+
+
+@contextmanager
+def count_emails(kind, count=1):
+    """Учет отправки count писем вида kind: успех или исключение"""
+    try:
+        yield
+    except Exception:
+        EMAILS_FAILED.labels(kind).inc(count)
+        raise
+    EMAILS_SENT.labels(kind).inc(count)
+
+
+class CeleryCollector:
+    """Метрики задач и очередей Celery из Redis и брокера на момент сбора"""
+
+    def collect(self):
+        try:
+            tasks, queues = task_stats()
+        except RedisError as e:
+            logger.warning(f"Не удалось прочитать метрики задач: {e}")
+            tasks, queues = {}, {}
+
+        sent = CounterMetricFamily(
+            "cookbook_celery_tasks_sent",
+            "Отправленные в очередь задачи",
+            labels=["task", "queue"],
+        )
+        runs = CounterMetricFamily(
+            "cookbook_celery_task_runs",
+            "Выполнения задач по состояниям",
+            labels=["task", "state"],
+        )
+        duration = HistogramMetricFamily(
+            "cookbook_celery_task_seconds",
+            "Время выполнения задач",
+            labels=["task"],
+        )
+        for name, stats in sorted(tasks.items()):
+            for field, value in sorted(stats.items()):
+                if field.startswith("state:"):
+                    runs.add_metric([name, field.removeprefix("state:")], value)
+                elif field.startswith("sent:"):
+                    sent.add_metric([name, field.removeprefix("sent:")], value)
+            buckets = [
+                (floatToGoString(bound), stats.get(f"le:{bound}", 0))
+                for bound in DURATION_BUCKETS
+            ]
+            buckets.append(("+Inf", stats.get("count", 0)))
+            duration.add_metric([name], buckets, stats.get("seconds", 0))
+
+        wait = SummaryMetricFamily(
+            "cookbook_celery_queue_wait_seconds",
+            "Ожидание задач в очереди",
+            labels=["queue"],
+        )
+        for name, stats in sorted(queues.items()):
+            wait.add_metric(
+                [name], stats.get("lag_count", 0), stats.get("lag_seconds", 0)
+            )
+
+        length = GaugeMetricFamily(
+            "cookbook_celery_queue_length",
+            "Сообщений в очереди брокера",
+            labels=["queue"],
+        )
+        try:
+            for name, count in sorted(queue_lengths().items()):
+                length.add_metric([name], count)
+        except OperationalError as e:
+            logger.warning(f"Брокер недоступен: {e}")
+
+        yield from (sent, runs, duration, wait, length)
+
+
+celery_registry = CollectorRegistry()
+celery_registry.register(CeleryCollector())
+
+
+def can_scrape(request):
+    # Модуль подключается клиентом кэша, до загрузки моделей
+    from .stats import client_ip
+
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", METRICS_ALLOWED_IPS)
+    # За nginx REMOTE_ADDR всегда 127.0.0.1 — проверяется адрес клиента
+    return client_ip(request) in allowed or request.user.is_staff
+
+
+@require_GET
+def metrics_view(request):
+    if not can_scrape(request):
+        raise PermissionDenied
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry) + generate_latest(celery_registry)
+    return HttpResponse(body, content_type=CONTENT_TYPE_LATEST)
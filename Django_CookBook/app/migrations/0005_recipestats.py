@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0004_recipe_notified_saved_recipe_notified_top_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeStats",
+            fields=[
+                (
+                    "recipe",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="app.recipe",
+                    ),
+                ),
+                (
+                    "views",
+                    models.PositiveBigIntegerField(default=0, verbose_name="Просмотры"),
+                ),
+                (
+                    "unique_viewers",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Уникальные зрители"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["-views"], name="app_recipes_views_865169_idx")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:02
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_rated_at(apps, schema_editor):
+    """Время существующих оценок неизвестно: берется дата публикации
+    рецепта, чтобы старые оценки не попали в тренды как свежие"""
+    Recipe = apps.get_model("app", "Recipe")
+    RecipeRating = apps.get_model("app", "RecipeRating")
+    RecipeRating.objects.update(
+        updated_at=Subquery(
+            Recipe.objects.filter(pk=OuterRef("recipe_id")).values("created_at")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0005_recipestats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reciperating",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_rated_at, migrations.RunPython.noop),
+    ]
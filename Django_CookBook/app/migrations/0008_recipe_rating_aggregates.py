@@ -0,0 +1,62 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:35
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+PRIOR_WEIGHT = 10
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    """Начальное заполнение агрегатов оценок и взвешенного рейтинга"""
+    Recipe = apps.get_model("app", "Recipe")
+    RecipeRating = apps.get_model("app", "RecipeRating")
+
+    totals = RecipeRating.objects.aggregate(count=Count("id"), total=Sum("rating"))
+    mean = totals["total"] / totals["count"] if totals["count"] else 3.0
+
+    recipes = list(
+        Recipe.objects.annotate(count=Count("ratings"), total=Sum("ratings__rating"))
+    )
+    for recipe in recipes:
+        recipe.rating_count = recipe.count
+        recipe.rating_sum = recipe.total or 0
+        recipe.bayesian_rating = (PRIOR_WEIGHT * mean + recipe.rating_sum) / (
+            PRIOR_WEIGHT + recipe.rating_count
+        )
+    Recipe.objects.bulk_update(
+        recipes, ["rating_count", "rating_sum", "bayesian_rating"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0007_similarrecipe"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="bayesian_rating",
+            field=models.FloatField(default=0.0, verbose_name="Взвешенный рейтинг"),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="rating_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество оценок"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0, verbose_name="Сумма оценок"),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-bayesian_rating"], name="app_recipe_bayesia_68c9fd_idx"
+            ),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:39
+
+import re
+
+from django.db import migrations, models
+
+
+def trigrams(text):
+    """Копия app.fuzzy.trigrams на момент миграции"""
+    words = re.findall(r"\w+", text.lower().replace("ё", "е"))
+    result = set()
+    for word in words:
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def build_trigram_index(apps, schema_editor):
+    """PostgreSQL: расширение pg_trgm и GIN-индексы; остальные БД —
+    начальное заполнение таблицы триграмм"""
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS app_recipe_dish_name_trgm "
+            "ON app_recipe USING gin (dish_name gin_trgm_ops)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS app_user_nickname_trgm "
+            "ON app_user USING gin (nickname gin_trgm_ops)"
+        )
+        return
+
+    SearchTrigram = apps.get_model("app", "SearchTrigram")
+    sources = [
+        ("d", apps.get_model("app", "Recipe").objects.values_list("pk", "dish_name")),
+        ("a", apps.get_model("app", "User").objects.values_list("pk", "nickname")),
+    ]
+    for kind, rows in sources:
+        SearchTrigram.objects.bulk_create(
+            [
+                SearchTrigram(trigram=trigram, kind=kind, object_id=pk)
+                for pk, text in rows
+                for trigram in trigrams(text)
+            ],
+            batch_size=1000,
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS app_recipe_dish_name_trgm")
+        schema_editor.execute("DROP INDEX IF EXISTS app_user_nickname_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0008_recipe_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchTrigram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("trigram", models.CharField(max_length=3)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("d", "Название блюда"), ("a", "Никнейм автора")],
+                        max_length=1,
+                    ),
+                ),
+                ("object_id", models.PositiveBigIntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "object_id"], name="app_searcht_kind_482ecf_idx"
+                    )
+                ],
+                "unique_together": {("trigram", "kind", "object_id")},
+            },
+        ),
+        migrations.RunPython(build_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,234 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:43
+
+import re
+from html.parser import HTMLParser
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Начальный словарь: название → основы слов (см. app/ingredients.py)
+INGREDIENTS = [
+    ("Авокадо", "авокадо"),
+    ("Бананы", "банан"),
+    ("Баклажаны", "баклажан"),
+    ("Бекон", "бекон"),
+    ("Ванилин", "ванил*"),
+    ("Говядина", "говядин"),
+    ("Горох и нут", "горох, горош*, нут"),
+    ("Гречка", "гречк, гречнев*"),
+    ("Грибы", "гриб, шампиньон, лисичк, лисичек, опят"),
+    ("Дрожжи", "дрожж"),
+    ("Желатин", "желатин"),
+    ("Зелень", "зелен, укроп, петрушк, кинз, базилик"),
+    ("Кабачки", "кабачок, кабачк, цукини"),
+    ("Капуста", "капуст"),
+    ("Картофель", "картофел, картошк, картофельн*"),
+    ("Кефир", "кефир"),
+    ("Колбаса и ветчина", "колбас, сосиск, ветчин"),
+    ("Корица", "кориц"),
+    ("Креветки", "креветк, креветок"),
+    ("Курица", "куриц, курин*, курочк"),
+    ("Лимон", "лимон, лимонн*"),
+    ("Лук", "лук, лучок"),
+    ("Макароны", "макарон, спагетти, лапш"),
+    ("Майонез", "майонез"),
+    ("Масло растительное", "растительн* масл, подсолнечн* масл, оливков* масл"),
+    ("Масло сливочное", "сливочн* масл"),
+    ("Мед", "мед"),
+    ("Молоко", "молок, молочн*"),
+    ("Морковь", "морков, морковк"),
+    ("Мука", "мук, мучн*"),
+    ("Огурцы", "огурец, огурц"),
+    ("Орехи", "орех, миндал, фундук, кешью"),
+    ("Перец", "перец, перц, перчик"),
+    ("Помидоры", "помидор, томат, черри"),
+    ("Разрыхлитель и сода", "разрыхлител, сод"),
+    ("Рис", "рис"),
+    ("Рыба", "рыб, рыбн*, лосос, семг, форел, треск"),
+    ("Сахар", "сахар, сахарн* пудр"),
+    ("Свинина", "свинин"),
+    ("Сливки", "сливк, сливок"),
+    ("Сметана", "сметан"),
+    ("Соевый соус", "соев* соус"),
+    ("Соль", "сол"),
+    ("Сыр", "сыр, пармезан, моцарелл, фет, брынз"),
+    ("Творог", "творог, творожн*"),
+    ("Уксус", "уксус"),
+    ("Фарш", "фарш"),
+    ("Фасоль", "фасол"),
+    ("Хлеб", "хлеб, батон, багет"),
+    ("Чеснок", "чеснок, чесночн*"),
+    ("Шоколад и какао", "шоколад*, какао"),
+    ("Яблоки", "яблок, яблочн*"),
+    ("Ягоды", "ягод, клубник, малин, черник, смородин"),
+    ("Яйца", "яйц, яиц, яичн*, желток, желтк, белок, белк"),
+    ("Йогурт", "йогурт"),
+]
+
+
+# Извлечение ингредиентов — копия app/ingredients.py на момент миграции
+ENDINGS = "а|я|о|у|ю|ом|ем|ой|ей|е|и|ы|ов|ев|ам|ям|ами|ями|ах|ях|ь|ью"
+
+
+def normalize(text):
+    text = re.sub(r"[^\w\s]", " ", text.lower().replace("ё", "е"))
+    return " ".join(text.split())
+
+
+class ListItems(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.items, self.text = [], []
+        self._depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "li":
+            self._depth += 1
+            self.items.append("")
+
+    def handle_endtag(self, tag):
+        if tag == "li" and self._depth:
+            self._depth -= 1
+
+    def handle_data(self, data):
+        if self._depth:
+            self.items[-1] += data
+        self.text.append(data)
+
+
+def alias_pattern(alias):
+    words = []
+    for word in alias.split():
+        stem = normalize(word.rstrip("*"))
+        if word.endswith("*"):
+            words.append(re.escape(stem) + r"\w*")
+        else:
+            words.append(re.escape(stem) + f"(?:{ENDINGS})?")
+    return r"\s+".join(words)
+
+
+def compile_dictionary(rows):
+    dictionary = []
+    for pk, aliases in rows:
+        patterns = [alias_pattern(a) for a in aliases.split(",") if a.strip()]
+        if patterns:
+            dictionary.append(
+                (pk, re.compile(rf"(?<!\w)(?:{'|'.join(patterns)})(?!\w)"))
+            )
+    return dictionary
+
+
+def extract_ingredients(html, dictionary):
+    parser = ListItems()
+    parser.feed(html or "")
+    parser.close()
+    lines = [normalize(item) for item in parser.items]
+    if not any(lines):
+        lines = [normalize(" ".join(parser.text))]
+    return {
+        pk for pk, pattern in dictionary if any(pattern.search(line) for line in lines)
+    }
+
+
+def fill_ingredients(apps, schema_editor):
+    """Словарь ингредиентов и извлечение их из существующих рецептов"""
+    Ingredient = apps.get_model("app", "Ingredient")
+    RecipeIngredient = apps.get_model("app", "RecipeIngredient")
+    Recipe = apps.get_model("app", "Recipe")
+
+    Ingredient.objects.bulk_create(
+        [Ingredient(name=name, aliases=aliases) for name, aliases in INGREDIENTS]
+    )
+    dictionary = compile_dictionary(Ingredient.objects.values_list("pk", "aliases"))
+    RecipeIngredient.objects.bulk_create(
+        [
+            RecipeIngredient(recipe_id=pk, ingredient_id=ingredient_id)
+            for pk, text in Recipe.objects.values_list("pk", "text")
+            for ingredient_id in extract_ingredients(text, dictionary)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0009_searchtrigram"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Ingredient",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50, unique=True, verbose_name="Название"
+                    ),
+                ),
+                (
+                    "aliases",
+                    models.CharField(
+                        help_text="Через запятую, например: яйц, яиц, яичн* (со звездочкой — любое окончание)",
+                        max_length=200,
+                        verbose_name="Основы слов",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="RecipeIngredient",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="app.ingredient"
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recipe_ingredients",
+                        to="app.recipe",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("recipe", "ingredient")},
+            },
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="ingredients",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="recipes",
+                through="app.RecipeIngredient",
+                to="app.ingredient",
+                verbose_name="Ингредиенты",
+            ),
+        ),
+        migrations.RunPython(fill_ingredients, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-19 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0010_ingredients"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="deactivated_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Аккаунт удаляется с"
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:02
+
+from html import unescape
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+BATCH_SIZE = 1000
+
+
+# Копия app.models.make_text_preview на момент миграции
+def make_text_preview(html):
+    text = " ".join(unescape(strip_tags(html.replace("<", " <"))).split())
+    return Truncator(text).chars(150)
+
+
+def fill_text_previews(apps, schema_editor):
+    """Превью шагов существующих рецептов, по BATCH_SIZE строк за раз"""
+    Recipe = apps.get_model("app", "Recipe")
+    batch = []
+    for recipe in Recipe.objects.only("id", "text").iterator(chunk_size=BATCH_SIZE):
+        recipe.text_preview = make_text_preview(recipe.text)
+        batch.append(recipe)
+        if len(batch) == BATCH_SIZE:
+            Recipe.objects.bulk_update(batch, ["text_preview"])
+            batch = []
+    Recipe.objects.bulk_update(batch, ["text_preview"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0013_mediablob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="text_preview",
+            field=models.CharField(
+                blank=True, editable=False, max_length=150, verbose_name="Шаги"
+            ),
+        ),
+        migrations.RunPython(fill_text_previews, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:07
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_rating_histograms(apps, schema_editor):
+    """Начальное заполнение гистограмм оценок"""
+    Recipe = apps.get_model("app", "Recipe")
+    RecipeRating = apps.get_model("app", "RecipeRating")
+
+    histograms = {}
+    for recipe_id, rating, count in (
+        RecipeRating.objects.values("recipe_id", "rating")
+        .annotate(count=Count("id"))
+        .values_list("recipe_id", "rating", "count")
+        .order_by()
+    ):
+        histograms.setdefault(recipe_id, {})[rating] = count
+
+    # bulk_update нужен только pk — рецепты не читаются
+    recipes = [
+        Recipe(
+            pk=recipe_id,
+            **{f"rating_{rating}": counts.get(rating, 0) for rating in range(1, 6)},
+        )
+        for recipe_id, counts in histograms.items()
+    ]
+    Recipe.objects.bulk_update(
+        recipes, [f"rating_{rating}" for rating in range(1, 6)], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0014_recipe_text_preview"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="rating_1",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок «1»"),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="rating_2",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок «2»"),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="rating_3",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок «3»"),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="rating_4",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок «4»"),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="rating_5",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок «5»"),
+        ),
+        migrations.RunPython(fill_rating_histograms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0015_recipe_rating_histogram"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="digest_date",
+            field=models.DateField(
+                blank=True, null=True, verbose_name="Последняя сводка за"
+            ),
+        ),
+        migrations.CreateModel(
+            name="DigestEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("saved", "Более 500 сохранений"),
+                            ("top", "Попадание в топ"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="digest_events",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="app.recipe"
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -1,3 +1,5 @@
+from html import unescape
+
 from django.db import models
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -5,7 +7,17 @@ from django.urls import reverse
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import User, AbstractUser
 from django_ckeditor_5.fields import CKEditor5Field
-from django.db.models import Avg
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+TEXT_PREVIEW_LENGTH = 150
+
+
+def make_text_preview(html):
+    """Начало шагов приготовления без HTML-разметки (для списков админки)"""
+    # Пробел перед тегом, чтобы соседние абзацы не слипались
+    text = " ".join(unescape(strip_tags(html.replace("<", " <"))).split())
+    return Truncator(text).chars(TEXT_PREVIEW_LENGTH)
 
 
 class Category(models.Model):
@@ -15,6 +27,24 @@ class Category(models.Model):
         return self.category
 
 
+class Ingredient(models.Model):
+    """Ингредиент из нормализованного словаря; в шагах рецепта
+    распознается по основам слов из aliases, см. app/ingredients.py"""
+
+    name = models.CharField(max_length=50, unique=True, verbose_name="Название")
+    aliases = models.CharField(
+        max_length=200,
+        verbose_name="Основы слов",
+        help_text="Через запятую, например: яйц, яиц, яичн* (со звездочкой — любое окончание)",
+    )
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
 class Recipe(models.Model):
     """Модель рецепта"""
 
@@ -34,6 +64,16 @@ class Recipe(models.Model):
         max_length=500, blank=False, null=False, verbose_name="Описание блюда"
     )
     text = CKEditor5Field(verbose_name="Шаги приготовления")
+    text_preview = models.CharField(
+        max_length=TEXT_PREVIEW_LENGTH, blank=True, editable=False, verbose_name="Шаги"
+    )  # Заполняется при сохранении, чтобы не читать полный text в списках
+    ingredients = models.ManyToManyField(
+        Ingredient,
+        through="RecipeIngredient",
+        blank=True,
+        related_name="recipes",
+        verbose_name="Ингредиенты",
+    )  # Извлекаются из шагов приготовления при сохранении
 
     notified_saved = models.BooleanField(
         default=False, verbose_name="Уведомление о 500 сохранениях отправлено"
@@ -42,9 +82,35 @@ class Recipe(models.Model):
         default=False, verbose_name="Уведомление о топе отправлено"
     )
 
+    # Агрегаты оценок хранятся в рецепте и обновляются при каждой оценке,
+    # байесовский рейтинг пересчитывается пакетно (см. app/ranking.py)
+    rating_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество оценок"
+    )
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name="Сумма оценок")
+    # Гистограмма: число оценок каждого значения; среднее, количество и
+    # распределение читаются из строки рецепта без обращения к оценкам
+    rating_1 = models.PositiveIntegerField(default=0, verbose_name="Оценок «1»")
+    rating_2 = models.PositiveIntegerField(default=0, verbose_name="Оценок «2»")
+    rating_3 = models.PositiveIntegerField(default=0, verbose_name="Оценок «3»")
+    rating_4 = models.PositiveIntegerField(default=0, verbose_name="Оценок «4»")
+    rating_5 = models.PositiveIntegerField(default=0, verbose_name="Оценок «5»")
+    bayesian_rating = models.FloatField(default=0.0, verbose_name="Взвешенный рейтинг")
+
+    class Meta:
+        indexes = [models.Index(fields=["-bayesian_rating"])]  # Сортировка /best/
+
     def __str__(self):
         return self.dish_name
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "text" in update_fields:
+            self.text_preview = make_text_preview(self.text)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "text_preview"}
+        super().save(*args, **kwargs)
+
     def like(self):
         if self.rating < 5:
             self.rating += 1
@@ -56,8 +122,24 @@ class Recipe(models.Model):
             self.save()
 
     def average_rating(self):
-        average = self.ratings.aggregate(avg_rating=Avg("rating"))["avg_rating"]
-        return round(average, 1) if average else 0.0
+        if not self.rating_count:
+            return 0.0
+        return round(self.rating_sum / self.rating_count, 1)
+
+    def rating_histogram(self):
+        """Распределение оценок от 5 до 1: (оценка, количество, доля в %)"""
+        return [
+            (
+                stars,
+                getattr(self, f"rating_{stars}"),
+                (
+                    round(100 * getattr(self, f"rating_{stars}") / self.rating_count)
+                    if self.rating_count
+                    else 0
+                ),
+            )
+            for stars in range(5, 0, -1)
+        ]
 
     def preview(self):
         return (
@@ -78,6 +160,7 @@ class RecipeRating(models.Model):
     rating = models.PositiveSmallIntegerField(
         validators=[MinValueValidator(1), MaxValueValidator(5)]
     )
+    updated_at = models.DateTimeField(auto_now=True)  # Время последней оценки
 
     class Meta:
         unique_together = ("user", "recipe")  # 1 пользователь - 1 оценка
@@ -100,6 +183,135 @@ class Favorite(models.Model):
         return f"{self.user} → {self.recipe}"
 
 
+class RecipeIngredient(models.Model):
+    """Ингредиент, найденный в шагах рецепта"""
+
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="recipe_ingredients"
+    )
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ("recipe", "ingredient")
+
+    def __str__(self):
+        return f"{self.recipe_id} → {self.ingredient_id}"
+
+
+class RecipeStats(models.Model):
+    """Статистика просмотров рецепта; счетчики копятся в Redis
+    и периодически переносятся в базу задачей flush_recipe_views"""
+
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    views = models.PositiveBigIntegerField(default=0, verbose_name="Просмотры")
+    unique_viewers = models.PositiveIntegerField(
+        default=0, verbose_name="Уникальные зрители"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["-views"])]  # Поиск популярных рецептов
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.views}"
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт (top-K соседей по косинусной близости аудиторий);
+    таблица целиком пересобирается офлайн, см. app/recommendations.py"""
+
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="similar_recipes"
+    )
+    similar = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="similar_to"
+    )
+    score = models.FloatField(verbose_name="Косинусная близость")
+    rank = models.PositiveSmallIntegerField(verbose_name="Позиция")
+
+    class Meta:
+        unique_together = ("recipe", "similar")
+        indexes = [models.Index(fields=["recipe", "rank"])]  # Выдача на странице
+
+    def __str__(self):
+        return f"{self.recipe_id} ~ {self.similar_id}: {self.score:.3f}"
+
+
+class SearchTrigram(models.Model):
+    """Инвертированный индекс триграмм для нечеткого поиска
+    (на PostgreSQL вместо него используется pg_trgm), см. app/fuzzy.py"""
+
+    DISH = "d"
+    AUTHOR = "a"
+    KIND_CHOICES = [(DISH, "Название блюда"), (AUTHOR, "Никнейм автора")]
+
+    trigram = models.CharField(max_length=3)
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()  # id рецепта или автора
+
+    class Meta:
+        unique_together = ("trigram", "kind", "object_id")  # Поиск по триграмме
+        indexes = [models.Index(fields=["kind", "object_id"])]  # Переиндексация
+
+    def __str__(self):
+        return f"{self.trigram} → {self.kind}:{self.object_id}"
+
+
+class MediaBlob(models.Model):
+    """Файл хранилища с именем по содержимому, см. app/storage.py"""
+
+    name = models.CharField(max_length=255, unique=True, verbose_name="Файл")
+    digest = models.CharField(max_length=64, db_index=True, verbose_name="SHA-256")
+    size = models.PositiveBigIntegerField(verbose_name="Размер")
+    phash = models.BigIntegerField(
+        null=True, blank=True, verbose_name="Перцептивный хэш"
+    )
+    similar_to = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="near_duplicates",
+        verbose_name="Почти совпадает с",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class MediaDeletion(models.Model):
+    """Очередь файлов хранилища на удаление, см. app/media.py"""
+
+    name = models.CharField(max_length=255, verbose_name="Файл")
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+
+class DigestEvent(models.Model):
+    """Событие для ежедневной сводки автора (достигнутый порог),
+    см. app/digest.py"""
+
+    SAVED = "saved"
+    TOP = "top"
+    KIND_CHOICES = [(SAVED, "Более 500 сохранений"), (TOP, "Попадание в топ")]
+
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="digest_events"
+    )
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.author_id}: {self.kind} {self.recipe_id}"
+
+
 class UserManager(BaseUserManager):
     """Менеджер пользователей для кастомной модели User"""
 
@@ -137,6 +349,15 @@ class User(AbstractUser):
     )
     is_staff = models.BooleanField(default=False)  # Доступ в админку
     is_superuser = models.BooleanField(default=False)  # Полный доступ
+    # Время запроса на удаление аккаунта; данные удаляются в фоне
+    deactivated_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Аккаунт удаляется с"
+    )
+    # День, за который отправлена последняя сводка (повторный запуск
+    # рассылки за тот же день автора пропускает)
+    digest_date = models.DateField(
+        null=True, blank=True, verbose_name="Последняя сводка за"
+    )
 
     objects = UserManager()  # Подключаем кастомный менеджер
 
@@ -0,0 +1,74 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import DigestEvent, Favorite, Recipe
+
+logger = logging.getLogger(__name__)
+
+# Пороги для авторов: больше 500 сохранений и попадание в топ.
+# Кандидатов находит периодическая сверка (задача reconcile_notifications):
+# два запроса с группировкой вместо проверки на каждое сохранение и
+# каждую оценку, поэтому потерянная задача или недоступный Redis не
+# оставляют рецепт без уведомления — следующая сверка найдет его снова.
+# Достигнутый порог — событие DigestEvent для ежедневной сводки автора
+# (app/digest.py); флаг notified_* ставится в той же транзакции, поэтому
+# событие создается один раз
+SAVED_THRESHOLD = 500  # Сохранений больше этого числа
+TOP_RATING = 4.7  # Средняя оценка выше этой
+
+
+def pending_saved():
+    """Id неуведомленных рецептов, сохраненных больше SAVED_THRESHOLD раз"""
+    return list(
+        Favorite.objects.filter(recipe__notified_saved=False)
+        .values("recipe_id")
+        .annotate(saves=Count("pk"))
+        .filter(saves__gt=SAVED_THRESHOLD)
+        .values_list("recipe_id", flat=True)
+        .order_by()
+    )
+
+
+def pending_top_rated():
+    """Id неуведомленных рецептов со средней оценкой выше TOP_RATING;
+    по хранимым агрегатам, без чтения оценок"""
+    return list(
+        Recipe.objects.filter(
+            notified_top=False,
+            rating_count__gt=0,
+            rating_sum__gt=F("rating_count") * TOP_RATING,
+        ).values_list("pk", flat=True)
+    )
+
+
+def _claim(recipe_ids, flag, kind):
+    """Отметка рецептов флагом и события для сводки (внутри транзакции);
+    рецепты, отмеченные параллельной сверкой, пропускаются"""
+    claimed = list(
+        Recipe.objects.select_for_update()
+        .filter(pk__in=recipe_ids, **{flag: False})
+        .values_list("pk", "author_id")
+    )
+    Recipe.objects.filter(pk__in=[pk for pk, _ in claimed]).update(**{flag: True})
+    DigestEvent.objects.bulk_create(
+        [
+            DigestEvent(author_id=author_id, recipe_id=pk, kind=kind)
+            for pk, author_id in claimed
+        ]
+    )
+    return len(claimed)
+
+
+def reconcile():
+    """События для всех рецептов, достигших порогов.
+    Возвращает (о сохранениях, о топе)"""
+    saved = pending_saved()
+    top = pending_top_rated()
+    with transaction.atomic():
+        saved = _claim(saved, "notified_saved", DigestEvent.SAVED) if saved else 0
+        top = _claim(top, "notified_top", DigestEvent.TOP) if top else 0
+    if saved or top:
+        logger.info(f"Новые события для сводок: сохранения {saved}, топ {top}")
+    return saved, top
@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Профилирование запросов и задач Celery по требованию.
+# Профилировщик статистический: отдельный поток раз в INTERVAL секунд
+# снимает стек профилируемого потока (sys._current_frames), поэтому код
+# не замедляется на каждом вызове, как под cProfile. Вместе со стеками
+# пишутся SQL-запросы (execute_wrapper всех баз) с числом и временем.
+# Профилируются:
+# - запросы персонала с заголовком X-Profile или параметром ?_profile=1
+#   (id профиля — в заголовке ответа X-Profile-Id);
+# - случайная доля PROFILE_SAMPLE_RATE всех запросов;
+# - задачи Celery из PROFILED_TASKS.
+# Последние PROFILES_KEPT профилей хранятся в Redis (PROFILES_KEY),
+# см. python manage.py show_profiles; страницу без сервера профилирует
+# python manage.py profile_url
+INTERVAL = 0.005
+TOP = 25  # Функций и запросов в отчете
+STACKS_KEPT = 200  # Самых частых стеков (для flame graph)
+PROFILES_KEY = "profiles:recent"
+PROFILES_KEPT = 50
+PROFILES_TIMEOUT = 7 * 24 * 60 * 60
+FLAG_HEADER = "X-Profile"
+FLAG_PARAM = "_profile"
+ID_HEADER = "X-Profile-Id"
+
+_running = {}
+
+
+def short_path(path):
+    """Путь к файлу относительно проекта или site-packages"""
+    base = str(settings.BASE_DIR) + os.sep
+    if path.startswith(base):
+        return path[len(base) :]
+    _, found, rest = path.rpartition("site-packages" + os.sep)
+    return rest if found else os.path.basename(path)
+
+
+def frame_label(frame):
+    path, line, name = frame
+    return f"{name} ({short_path(path)}:{line})"
+
+
+class Profiler:
+    """Стеки и SQL-запросы текущего потока между start() и stop()"""
+
+    def __init__(self, kind, name, interval=None):
+        self.kind = kind
+        self.name = name
+        self.interval = interval or getattr(settings, "PROFILE_INTERVAL", INTERVAL)
+        self.stacks = Counter()
+        self.queries = {}  # (база, sql) -> [число, секунды]
+
+    def start(self):
+        self._wrappers = ExitStack()
+        for alias in settings.DATABASES:
+            self._wrappers.enter_context(connections[alias].execute_wrapper(self.trace))
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(
+            target=self.sample, name="profiler", daemon=True
+        )
+        self._started_at = timezone.now()
+        self._started = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        seconds = time.perf_counter() - self._started
+        self._stopped.set()
+        self._sampler.join()
+        self._wrappers.close()
+        return self.report(seconds)
+
+    def sample(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def trace(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            entry = self.queries.setdefault(
+                (context["connection"].alias, sql), [0, 0.0]
+            )
+            entry[0] += 1
+            entry[1] += time.perf_counter() - started
+
+    def report(self, seconds):
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):
+                total[frame] += count
+        queries = sorted(self.queries.items(), key=lambda item: -item[1][1])
+        return {
+            "id": uuid.uuid4().hex,
+            "kind": self.kind,
+            "name": self.name,
+            "started_at": self._started_at.isoformat(),
+            "seconds": seconds,
+            "interval": self.interval,
+            "samples": sum(self.stacks.values()),
+            "functions": [
+                {"function": frame_label(frame), "self": count, "total": total[frame]}
+                for frame, count in own.most_common(TOP)
+            ],
+            "query_count": sum(count for count, _ in self.queries.values()),
+            "query_seconds": sum(spent for _, spent in self.queries.values()),
+            "queries": [
+                {"alias": alias, "sql": sql, "count": count, "seconds": spent}
+                for (alias, sql), (count, spent) in queries[:TOP]
+            ],
+            # Свернутые стеки: "a;b;c" -> число снимков
+            "stacks": {
+                ";".join(frame_label(frame) for frame in stack): count
+                for stack, count in self.stacks.most_common(STACKS_KEPT)
+            },
+        }
+
+
+def save(report):
+    try:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        pipe.lpush(PROFILES_KEY, json.dumps(report, ensure_ascii=False))
+        pipe.ltrim(PROFILES_KEY, 0, PROFILES_KEPT - 1)
+        pipe.expire(PROFILES_KEY, PROFILES_TIMEOUT)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Не удалось сохранить профиль {report['name']}: {e}")
+
+
+def recent():
+    """Сохраненные профили, новые первыми"""
+    raw = get_redis_connection("default").lrange(PROFILES_KEY, 0, -1)
+    return [json.loads(item) for item in raw]
+
+
+def format_report(report, top=TOP):
+    """Строки отчета: самые горячие функции и запросы"""
+    lines = [
+        f"{report['kind']} {report['name']}: {report['seconds'] * 1000:.1f} мс, "
+        f"{report['samples']} снимков по {report['interval'] * 1000:.0f} мс, "
+        f"SQL: {report['query_count']} за {report['query_seconds'] * 1000:.1f} мс",
+        "",
+        f"{'своих':>6} {'всего':>6}  функция",
+    ]
+    for entry in report["functions"][:top]:
+        lines.append(f"{entry['self']:>6} {entry['total']:>6}  {entry['function']}")
+    lines += ["", f"{'число':>6} {'мс':>8}  запрос"]
+    for entry in report["queries"][:top]:
+        sql = " ".join(entry["sql"].split())
+        lines.append(
+            f"{entry['count']:>6} {entry['seconds'] * 1000:>8.2f}  "
+            f"[{entry['alias']}] {sql[:200]}"
+        )
+    return lines
+
+
+def flagged(request):
+    """Запрос просит профиль: заголовок или параметр от персонала,
+    иначе — случайная выборка"""
+    asked = request.headers.get(FLAG_HEADER) or FLAG_PARAM in request.GET
+    if asked and getattr(getattr(request, "user", None), "is_staff", False):
+        return True
+    return random.random() < getattr(settings, "PROFILE_SAMPLE_RATE", 0)
+
+
+class ProfilingMiddleware:
+    """Профиль отмеченных и выбранных запросов (после аутентификации)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not flagged(request):
+            return self.get_response(request)
+
+        profiler = Profiler("request", request.path)
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            report = profiler.stop()
+        match = getattr(request, "resolver_match", None)
+        report.update(
+            name=match.view_name if match else request.path,
+            path=request.get_full_path(),
+            status=response.status_code,
+        )
+        save(report)
+        response[ID_HEADER] = report["id"]
+        return response
+
+
+@task_prerun.connect
+def start_task_profile(task_id=None, task=None, **kwargs):
+    if task.name in getattr(settings, "PROFILED_TASKS", ()):
+        profiler = Profiler("task", task.name)
+        profiler.start()
+        _running[task_id] = profiler
+
+
+@task_postrun.connect
+def stop_task_profile(task_id=None, state=None, **kwargs):
+    profiler = _running.pop(task_id, None)
+    if profiler is not None:
+        report = profiler.stop()
+        report.update(task_id=task_id, state=state)
+        save(report)
@@ -0,0 +1,179 @@
+import logging
+from itertools import chain
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+
+from .models import Recipe, RecipeRating
+
+logger = logging.getLogger(__name__)
+
+# Байесовский (взвешенный) рейтинг: к оценкам рецепта добавляются
+# PRIOR_WEIGHT "виртуальных" оценок, равных среднему по всему сайту.
+# Рецепт с единственной пятеркой больше не обгоняет рецепт с 2000 оценок
+PRIOR_WEIGHT = 10
+DEFAULT_PRIOR_MEAN = 3.0
+PRIOR_CACHE_KEY = "ranking:prior_mean"
+RATINGS = range(1, 6)
+
+
+def prior_mean():
+    """Средняя оценка по сайту из последнего пакетного пересчета"""
+    return cache.get(PRIOR_CACHE_KEY, DEFAULT_PRIOR_MEAN)
+
+
+def bayesian(rating_sum, rating_count, mean):
+    return (PRIOR_WEIGHT * mean + rating_sum) / (PRIOR_WEIGHT + rating_count)
+
+
+def bucket(rating):
+    """Поле гистограммы рецепта для оценки"""
+    return f"rating_{rating}"
+
+
+def apply_rating_change(recipe_id, old_rating, new_rating):
+    """Инкрементальное обновление агрегатов и гистограммы рецепта одним
+    UPDATE (old_rating — None для новой оценки, new_rating — None для
+    удаленной); F-выражения защищают от гонок параллельных оценок"""
+    counts = {}
+    if old_rating is not None:
+        counts[old_rating] = -1
+    if new_rating is not None:
+        counts[new_rating] = counts.get(new_rating, 0) + 1
+    apply_rating_changes({recipe_id: counts})
+
+
+def apply_rating_changes(deltas):
+    """То же для пачки рецептов одним UPDATE:
+    deltas — {recipe_id: {оценка: изменение числа таких оценок}}"""
+    deltas = {
+        pk: {rating: delta for rating, delta in counts.items() if delta}
+        for pk, counts in deltas.items()
+    }
+    deltas = {pk: counts for pk, counts in deltas.items() if counts}
+    if not deltas:
+        return
+
+    def case(value):
+        return Case(
+            *[When(pk=pk, then=Value(value(counts))) for pk, counts in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+
+    buckets = {
+        bucket(rating): F(bucket(rating))
+        + case(lambda counts, rating=rating: counts.get(rating, 0))
+        for rating in RATINGS
+        if any(rating in counts for counts in deltas.values())
+    }
+    new_sum = F("rating_sum") + case(
+        lambda counts: sum(rating * delta for rating, delta in counts.items())
+    )
+    new_count = F("rating_count") + case(lambda counts: sum(counts.values()))
+    Recipe.objects.filter(pk__in=deltas).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        bayesian_rating=bayesian(new_sum * 1.0, new_count, prior_mean()),
+        **buckets,
+    )
+
+
+HISTOGRAM_FIELDS = [bucket(rating) for rating in RATINGS]
+AGGREGATE_FIELDS = ["rating_count", "rating_sum", *HISTOGRAM_FIELDS]
+
+
+def _histograms():
+    """Гистограммы всех рецептов за один проход по таблице оценок (NumPy):
+    массив [recipe_id, оценка - 1] и все оценки подряд"""
+    # NumPy нужен только пакетным пересчетам, не при запуске процесса
+    import numpy as np
+
+    rows = RecipeRating.objects.values_list("recipe_id", "rating").iterator(
+        chunk_size=10000
+    )
+    flat = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+    recipe_ids, ratings = flat[:, 0], flat[:, 1]
+    size = int(recipe_ids.max(initial=0)) + 1
+    histograms = np.bincount(
+        recipe_ids * len(RATINGS) + ratings - 1, minlength=size * len(RATINGS)
+    ).reshape(size, len(RATINGS))
+    return histograms, ratings
+
+
+def _aggregates(histogram):
+    """Значения AGGREGATE_FIELDS по гистограмме"""
+    counts = [int(count) for count in histogram]
+    total = sum(rating * count for rating, count in zip(RATINGS, counts))
+    return [sum(counts), total, *counts]
+
+
+def recompute_scores(batch_size=1000):
+    """Пакетный пересчет агрегатов, гистограмм и рейтинга всех рецептов
+    за один проход по таблице оценок.
+    Исправляет возможный дрейф инкрементальных обновлений"""
+    import numpy as np
+
+    histograms, ratings = _histograms()
+    mean = float(ratings.mean()) if len(ratings) else DEFAULT_PRIOR_MEAN
+    cache.set(PRIOR_CACHE_KEY, mean, timeout=None)
+    empty = np.zeros(len(RATINGS), dtype=np.int64)
+
+    updated = []
+    recipes = Recipe.objects.only("pk", "bayesian_rating", *AGGREGATE_FIELDS)
+    for recipe in recipes.iterator(chunk_size=batch_size):
+        pk = recipe.pk
+        values = _aggregates(histograms[pk] if pk < len(histograms) else empty)
+        score = bayesian(values[1], values[0], mean)
+        # Записываются только изменившиеся рецепты
+        stored = [getattr(recipe, field) for field in AGGREGATE_FIELDS]
+        if stored != values or abs(recipe.bayesian_rating - score) > 1e-9:
+            for field, value in zip(AGGREGATE_FIELDS, values):
+                setattr(recipe, field, value)
+            recipe.bayesian_rating = score
+            updated.append(recipe)
+
+    Recipe.objects.bulk_update(
+        updated, [*AGGREGATE_FIELDS, "bayesian_rating"], batch_size=batch_size
+    )
+    logger.info(f"Рейтинги пересчитаны: обновлено {len(updated)} рецептов")
+    return len(updated)
+
+
+def find_drift(batch_size=1000):
+    """Рецепты, у которых хранимые агрегаты или гистограмма расходятся
+    с таблицей оценок: {recipe_id: (хранимые, фактические)}"""
+    import numpy as np
+
+    histograms, _ = _histograms()
+    empty = np.zeros(len(RATINGS), dtype=np.int64)
+    drift = {}
+    rows = Recipe.objects.values_list("pk", *AGGREGATE_FIELDS)
+    for pk, *stored in rows.iterator(chunk_size=batch_size):
+        actual = _aggregates(histograms[pk] if pk < len(histograms) else empty)
+        if stored != actual:
+            drift[pk] = (stored, actual)
+    return drift
+
+
+def repair_drift(recipe_ids):
+    """Пересчет агрегатов рецептов по их оценкам. Строка рецепта
+    блокируется, чтобы параллельная оценка не потерялась"""
+    mean = prior_mean()
+    for pk in recipe_ids:
+        with transaction.atomic():
+            if not Recipe.objects.select_for_update().filter(pk=pk).exists():
+                continue
+            counts = dict(
+                RecipeRating.objects.filter(recipe_id=pk)
+                .order_by()
+                .values_list("rating")
+                .annotate(count=Count("pk"))
+                .values_list("rating", "count")
+            )
+            values = _aggregates([counts.get(rating, 0) for rating in RATINGS])
+            Recipe.objects.filter(pk=pk).update(
+                bayesian_rating=bayesian(values[1], values[0], mean),
+                **dict(zip(AGGREGATE_FIELDS, values)),
+            )
@@ -0,0 +1,132 @@
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .stats import viewer_id
+
+logger = logging.getLogger(__name__)
+
+# Ограничение частоты запросов алгоритмом token bucket: у каждой пары
+# (представление, пользователь или IP) есть ведро на capacity жетонов,
+# которое равномерно наполняется за period секунд; запрос тратит жетон.
+# Ведро — hash в Redis, проверка и списание — один атомарный Lua-скрипт
+# (время берется с сервера Redis, поэтому часы воркеров не важны).
+# Если Redis недоступен, используется ведро в памяти процесса
+KEY = "ratelimit:{}:{}"
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 24 * 3600}
+MESSAGE = "Слишком много запросов. Попробуйте немного позже."
+
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(tokens)}
+"""
+_token_bucket = None
+
+# Ведра в памяти на случай недоступности Redis (лимит — на процесс)
+_local_buckets = {}
+_local_lock = threading.Lock()
+LOCAL_MAX_BUCKETS = 10_000
+
+
+def parse_rate(rate):
+    """Разбор лимита: "10/m" → (10, 60) — 10 запросов, ведро наполняется за минуту"""
+    count, period = rate.split("/")
+    return int(count), PERIODS[period]
+
+
+def _check_redis(key, capacity, refill):
+    global _token_bucket
+    redis = get_redis_connection("default")
+    if _token_bucket is None:
+        _token_bucket = redis.register_script(_TOKEN_BUCKET_SCRIPT)
+    allowed, tokens = _token_bucket(keys=[key], args=[capacity, refill])
+    return bool(allowed), float(tokens)
+
+
+def _check_local(key, capacity, refill):
+    now = time.monotonic()
+    with _local_lock:
+        tokens, ts = _local_buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - ts) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        if len(_local_buckets) >= LOCAL_MAX_BUCKETS and key not in _local_buckets:
+            _local_buckets.clear()  # Грубо, но память ограничена
+        _local_buckets[key] = (tokens, now)
+    return allowed, tokens
+
+
+def check(name, ident, rate):
+    """Списание жетона: (разрешено, осталось жетонов, секунд до следующего)"""
+    capacity, period = parse_rate(rate)
+    refill = capacity / period
+    key = KEY.format(name, ident)
+    try:
+        allowed, tokens = _check_redis(key, capacity, refill)
+    except RedisError as e:
+        logger.warning(f"Ограничение частоты без Redis ({name}): {e}")
+        allowed, tokens = _check_local(key, capacity, refill)
+    retry_after = 0 if allowed else math.ceil((1 - tokens) / refill)
+    return allowed, int(tokens), retry_after
+
+
+def rate_limit(name, rate, methods=("POST",)):
+    """Декоратор представления: не больше rate запросов ("N/s|m|h|d")
+    от одного пользователя (гостя — по IP, см. stats.client_ip). Лимит можно переопределить
+    в settings.RATE_LIMITS[name]"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return view(request, *args, **kwargs)
+
+            limit = getattr(settings, "RATE_LIMITS", {}).get(name, rate)
+            allowed, remaining, retry_after = check(name, viewer_id(request), limit)
+            capacity, _ = parse_rate(limit)
+            if allowed:
+                response = view(request, *args, **kwargs)
+            else:
+                # Поля для обоих форматов AJAX-ответов проекта
+                response = JsonResponse(
+                    {
+                        "status": "error",
+                        "success": False,
+                        "message": MESSAGE,
+                        "error": MESSAGE,
+                    },
+                    status=429,
+                )
+                response.headers["Retry-After"] = str(retry_after)
+
+            response.headers["X-RateLimit-Limit"] = str(capacity)
+            response.headers["X-RateLimit-Remaining"] = str(remaining)
+            return response
+
+        return wrapper
+
+    return decorator
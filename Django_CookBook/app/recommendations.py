@@ -0,0 +1,207 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+
+from .models import Favorite, Recipe, RecipeRating, SimilarRecipe
+
+logger = logging.getLogger(__name__)
+
+# Рекомендации "похожие рецепты" по схеме item-item:
+# рецепты похожи, если их сохраняют и высоко оценивают одни и те же люди.
+# Матрица пользователь × рецепт разреженная, близость — косинусная,
+# считается блоками рецептов, чтобы память не зависела от размера каталога
+TOP_K = 10
+FAVORITE_WEIGHT = 1.0
+BLOCK_CELLS = 4_000_000  # Размер плотного блока близостей (~32 МБ float64)
+BLOCK_PAIRS = 1_000_000  # Пар взаимодействий за один проход (~40 МБ массивов)
+
+
+def load_interactions():
+    """Взаимодействия из БД в виде массивов (user_id, recipe_id, вес):
+    сохранение весит 1, оценка — rating / 5"""
+
+    def column_stack(queryset, fields):
+        rows = queryset.values_list(*fields).iterator(chunk_size=10000)
+        flat = np.fromiter(chain.from_iterable(rows), dtype=np.int64)
+        return flat.reshape(-1, len(fields))
+
+    favorites = column_stack(Favorite.objects.all(), ("user_id", "recipe_id"))
+    ratings = column_stack(
+        RecipeRating.objects.all(), ("user_id", "recipe_id", "rating")
+    )
+
+    users = np.concatenate([favorites[:, 0], ratings[:, 0]])
+    items = np.concatenate([favorites[:, 1], ratings[:, 1]])
+    weights = np.concatenate(
+        [np.full(len(favorites), FAVORITE_WEIGHT), ratings[:, 2] / 5.0]
+    )
+    return users, items, weights
+
+
+# Массивы матрицы для процессов-воркеров (передаются один раз в initializer)
+_matrix = {}
+
+
+def _init_worker(matrix):
+    _matrix.update(matrix)
+
+
+def _top_k_block(bounds):
+    """Top-K соседей для рецептов с индексами [start, stop).
+    Скалярные произведения столбцов считаются через совместные
+    взаимодействия пользователей: каждая пара (i из блока, j) одного
+    пользователя дает вклад w_i * w_j"""
+    start, stop = bounds
+    m = _matrix
+    n_items, top_k = m["n_items"], m["top_k"]
+    user_idx, item_idx, w = m["user_idx"], m["item_idx"], m["w"]
+    indptr, by_item, col_ptr = m["indptr"], m["by_item"], m["col_ptr"]
+
+    # Взаимодействия с рецептами блока и длины строк их пользователей
+    sel = by_item[col_ptr[start] : col_ptr[stop]]
+    lengths = indptr[user_idx[sel] + 1] - indptr[user_idx[sel]]
+    ends = np.cumsum(lengths)
+
+    # Пар столько, сколько взаимодействий у пользователей блока, а не
+    # ячеек блока: у популярных рецептов их на порядки больше. Пары
+    # разворачиваются кусками не больше BLOCK_PAIRS
+    size = stop - start
+    dots = np.zeros(size * n_items)
+    lo = 0
+    while lo < len(sel):
+        done = ends[lo - 1] if lo else 0
+        hi = max(lo + 1, int(np.searchsorted(ends, done + BLOCK_PAIRS, "right")))
+        chunk, chunk_lengths = sel[lo:hi], lengths[lo:hi]
+        u = user_idx[chunk]
+        row_start = np.repeat(indptr[u], chunk_lengths)
+        offsets = np.arange(chunk_lengths.sum()) - np.repeat(
+            np.cumsum(chunk_lengths) - chunk_lengths, chunk_lengths
+        )
+        pairs = row_start + offsets
+        cells = (
+            np.repeat(item_idx[chunk] - start, chunk_lengths) * n_items
+            + item_idx[pairs]
+        )
+        dots += np.bincount(
+            cells,
+            weights=np.repeat(w[chunk], chunk_lengths) * w[pairs],
+            minlength=size * n_items,
+        )
+        lo = hi
+    dots = dots.reshape(size, n_items)
+
+    norms = m["norms"]
+    sims = dots / np.outer(norms[start:stop], norms)
+    sims[np.arange(size), np.arange(start, stop)] = 0.0  # Не похож сам на себя
+
+    k = min(top_k, n_items - 1)
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    scores = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-scores, axis=1)
+    return (
+        start,
+        np.take_along_axis(top, order, axis=1),
+        np.take_along_axis(scores, order, axis=1),
+    )
+
+
+def compute_similar(users, items, weights, top_k=TOP_K, workers=1):
+    """Top-K похожих рецептов по косинусной близости.
+    Возвращает (recipe_ids, neighbours, scores): для recipe_ids[i]
+    соседи — recipe_ids[neighbours[i]] с близостью scores[i] по убыванию"""
+    recipe_ids, item_idx = np.unique(items, return_inverse=True)
+    _, user_idx = np.unique(users, return_inverse=True)
+    n_items, n_users = len(recipe_ids), int(user_idx.max(initial=-1)) + 1
+    if n_items < 2:
+        return recipe_ids, np.empty((n_items, 0), int), np.empty((n_items, 0))
+
+    # Повторные взаимодействия (сохранение + оценка) складываются в одну ячейку;
+    # после сортировки по ключу ячейки упорядочены по пользователям (CSR)
+    keys, inverse = np.unique(
+        user_idx.astype(np.int64) * n_items + item_idx, return_inverse=True
+    )
+    w = np.bincount(inverse, weights=weights)
+    user_idx, item_idx = np.divmod(keys, n_items)
+
+    indptr = np.zeros(n_users + 1, dtype=np.int64)
+    np.cumsum(np.bincount(user_idx, minlength=n_users), out=indptr[1:])
+    col_ptr = np.zeros(n_items + 1, dtype=np.int64)
+    np.cumsum(np.bincount(item_idx, minlength=n_items), out=col_ptr[1:])
+
+    matrix = {
+        "n_items": n_items,
+        "top_k": top_k,
+        "user_idx": user_idx,
+        "item_idx": item_idx,
+        "w": w,
+        "indptr": indptr,
+        "by_item": np.argsort(item_idx, kind="stable"),  # CSC-порядок
+        "col_ptr": col_ptr,
+        "norms": np.sqrt(np.bincount(item_idx, weights=w**2, minlength=n_items)),
+    }
+
+    block = max(1, BLOCK_CELLS // n_items)
+    blocks = [(s, min(s + block, n_items)) for s in range(0, n_items, block)]
+
+    k = min(top_k, n_items - 1)
+    neighbours = np.empty((n_items, k), dtype=np.int64)
+    scores = np.empty((n_items, k))
+
+    if workers > 1:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(matrix,)
+        ) as pool:
+            results = pool.map(_top_k_block, blocks)
+            for start, top, top_scores in results:
+                neighbours[start : start + len(top)] = top
+                scores[start : start + len(top)] = top_scores
+    else:
+        _init_worker(matrix)
+        for bounds in blocks:
+            start, top, top_scores = _top_k_block(bounds)
+            neighbours[start : start + len(top)] = top
+            scores[start : start + len(top)] = top_scores
+    _matrix.clear()
+
+    return recipe_ids, neighbours, scores
+
+
+def rebuild_similar_recipes(top_k=TOP_K, workers=1):
+    """Пересчет таблицы SimilarRecipe по всем взаимодействиям.
+    Возвращает число сохраненных пар"""
+    recipe_ids, neighbours, scores = compute_similar(
+        *load_interactions(), top_k=top_k, workers=workers
+    )
+
+    with transaction.atomic():
+        # Рецепты могли удалить, пока шел расчет
+        existing = set(Recipe.objects.values_list("pk", flat=True))
+        rows = []
+        for i, recipe_id in enumerate(recipe_ids.tolist()):
+            if recipe_id not in existing:
+                continue
+            rank = 0
+            for j, score in zip(neighbours[i].tolist(), scores[i].tolist()):
+                similar_id = int(recipe_ids[j])
+                if score <= 0:
+                    break  # Соседи отсортированы: дальше только нули
+                if similar_id not in existing:
+                    continue
+                rank += 1
+                rows.append(
+                    SimilarRecipe(
+                        recipe_id=recipe_id,
+                        similar_id=similar_id,
+                        score=score,
+                        rank=rank,
+                    )
+                )
+
+        SimilarRecipe.objects.all().delete()
+        SimilarRecipe.objects.bulk_create(rows, batch_size=1000)
+
+    logger.info(f"Похожие рецепты пересчитаны: {len(rows)} пар")
+    return len(rows)
@@ -1,16 +1,253 @@
-from django.db.models.signals import post_save, m2m_changed
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.db import transaction
 from django.dispatch import receiver
 
-from .models import Favorite, RecipeRating
-from .tasks import notify_recipe_saved, notify_recipe_top_rated
+from . import autocomplete, conditional, fuzzy, ingredients, media, ranking, trending
+from .facets import bump_generation
+from .models import (
+    Category,
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeRating,
+    SearchTrigram,
+    User,
+)
+from .tasks import extract_recipe_ingredients
 
 
+# Пороги уведомлений (сохранения, топ) проверяет периодическая сверка,
+# см. app/notifications.py
 @receiver(post_save, sender=Favorite)
 def favorite_added(sender, instance, created, **kwargs):
     if created:
-        notify_recipe_saved(instance.recipe.id)
+        trending.record_event(
+            instance.recipe_id, instance.recipe.category_id, trending.FAVORITE_WEIGHT
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    """Отмена вклада сохранения в тренды (с учетом его давности)"""
+    # Рецепт может удаляться каскадом вместе с сохранением
+    category_id = (
+        Recipe.objects.filter(pk=instance.recipe_id)
+        .values_list("category_id", flat=True)
+        .first()
+    )
+    if category_id is not None:
+        trending.record_event(
+            instance.recipe_id,
+            category_id,
+            -trending.FAVORITE_WEIGHT,
+            timestamp=instance.created_at.timestamp(),
+        )
+
+
+@receiver(pre_save, sender=RecipeRating)
+def remember_old_rating(sender, instance, **kwargs):
+    """Запоминание прежней оценки и ее времени: для инкрементального
+    пересчета агрегатов и замены вклада оценки в тренды"""
+    instance._old_rating = instance._old_rated_at = None
+    if instance.pk:
+        old = (
+            RecipeRating.objects.filter(pk=instance.pk)
+            .values_list("rating", "updated_at")
+            .first()
+        )
+        if old:
+            instance._old_rating, instance._old_rated_at = old
 
 
 @receiver(post_save, sender=RecipeRating)
 def rating_added_or_updated(sender, instance, created, **kwargs):
-    notify_recipe_top_rated.delay(instance.recipe.id)
+    old_rating = getattr(instance, "_old_rating", None)
+    if old_rating == instance.rating:
+        return  # Повторная та же оценка ничего не меняет
+    ranking.apply_rating_change(instance.recipe_id, old_rating, instance.rating)
+
+    category_id = instance.recipe.category_id
+    if old_rating is not None:
+        trending.record_event(
+            instance.recipe_id,
+            category_id,
+            -trending.rating_weight(old_rating),
+            timestamp=instance._old_rated_at.timestamp(),
+        )
+    trending.record_event(
+        instance.recipe_id, category_id, trending.rating_weight(instance.rating)
+    )
+
+
+@receiver(post_delete, sender=RecipeRating)
+def rating_removed(sender, instance, **kwargs):
+    ranking.apply_rating_change(instance.recipe_id, instance.rating, None)
+
+    # Вклад в тренды отменяется с учетом давности оценки
+    category_id = (
+        Recipe.objects.filter(pk=instance.recipe_id)
+        .values_list("category_id", flat=True)
+        .first()
+    )
+    if category_id is not None:
+        trending.record_event(
+            instance.recipe_id,
+            category_id,
+            -trending.rating_weight(instance.rating),
+            timestamp=instance.updated_at.timestamp(),
+        )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_facets(sender, **kwargs):
+    """Счетчики рецептов по категориям устарели"""
+    bump_generation()
+
+
+# Индексы подсказок и нечеткого поиска обновляются только при изменении подписей
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "dish_name" in update_fields:
+        autocomplete.index_member(f"r:{instance.pk}", instance.dish_name)
+        if not fuzzy.uses_pg_trgm():
+            fuzzy.index_object(SearchTrigram.DISH, instance.pk, instance.dish_name)
+
+
+@receiver(post_save, sender=User)
+def index_author(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "nickname" in update_fields:
+        autocomplete.index_member(f"u:{instance.pk}", instance.nickname)
+        if not fuzzy.uses_pg_trgm():
+            fuzzy.index_object(SearchTrigram.AUTHOR, instance.pk, instance.nickname)
+
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, **kwargs):
+    autocomplete.index_member(f"c:{instance.pk}", instance.category)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Category)
+def unindex(sender, instance, **kwargs):
+    prefix = {Recipe: "r", User: "u", Category: "c"}[sender]
+    autocomplete.remove_member(f"{prefix}:{instance.pk}")
+
+    kind = {Recipe: SearchTrigram.DISH, User: SearchTrigram.AUTHOR}.get(sender)
+    if kind and not fuzzy.uses_pg_trgm():
+        fuzzy.unindex_object(kind, instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def extract_ingredients(sender, instance, update_fields=None, **kwargs):
+    """Ингредиенты пересчитываются только при изменении шагов приготовления"""
+    if update_fields is None or "text" in update_fields:
+        ingredients.update_recipe_ingredients(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def drop_from_ingredient_index(sender, instance, **kwargs):
+    ingredients.bump_version()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def reextract_ingredients(sender, **kwargs):
+    """Словарь изменился — каталог размечается заново в фоне"""
+    ingredients.bump_version()
+    transaction.on_commit(extract_recipe_ingredients.delay)
+
+
+# Версии страниц для условных GET-запросов (см. app/conditional.py)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_pages(sender, instance, created=False, **kwargs):
+    scopes = [
+        conditional.recipe_scope(instance.pk),
+        conditional.author_scope(instance.author_id),
+        conditional.CATALOG,
+    ]
+    # Название и фото рецепта показываются в блоках "похожие" других
+    # рецептов; новый рецепт попадет в них только при пересборке
+    if not created:
+        scopes.append(conditional.SIMILAR)
+    conditional.bump(*scopes)
+
+
+@receiver(post_save, sender=RecipeRating)
+@receiver(post_delete, sender=RecipeRating)
+def invalidate_rated_pages(sender, instance, **kwargs):
+    """Средний рейтинг на странице рецепта и оценка зрителя"""
+    conditional.bump(
+        conditional.recipe_scope(instance.recipe_id),
+        conditional.viewer_scope(instance.user_id),
+        conditional.CATALOG,
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_favorite_pages(sender, instance, **kwargs):
+    conditional.bump(conditional.viewer_scope(instance.user_id), conditional.CATALOG)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_listing_pages(sender, **kwargs):
+    conditional.bump(conditional.CATALOG, conditional.CATEGORIES)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_pages(sender, instance, update_fields=None, **kwargs):
+    """Профиль, навбар пользователя и никнейм автора на страницах его рецептов"""
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    scopes = [
+        conditional.author_scope(instance.pk),
+        conditional.viewer_scope(instance.pk),
+    ]
+    if update_fields is None or "nickname" in update_fields:
+        scopes += [
+            conditional.recipe_scope(pk)
+            for pk in Recipe.objects.filter(author=instance).values_list(
+                "pk", flat=True
+            )
+        ]
+    conditional.bump(*scopes)
+
+
+# Старые файлы изображений удаляются в фоне через очередь (см. app/media.py),
+# а не синхронно в запросе, как делал django_cleanup
+MEDIA_FIELDS = {Recipe: "picture", User: "avatar"}
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def remember_old_media(sender, instance, update_fields=None, **kwargs):
+    field = MEDIA_FIELDS[sender]
+    instance._old_media = None
+    if instance.pk and (update_fields is None or field in update_fields):
+        instance._old_media = (
+            sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def queue_replaced_media(sender, instance, **kwargs):
+    old_name = getattr(instance, "_old_media", None)
+    if old_name and old_name != getattr(instance, MEDIA_FIELDS[sender]).name:
+        media.enqueue([old_name])
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def queue_deleted_media(sender, instance, **kwargs):
+    media.enqueue([getattr(instance, MEDIA_FIELDS[sender]).name])
@@ -0,0 +1,136 @@
+import importlib
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Время запуска процесса (manage.py, воркер Gunicorn или Celery).
+# import_report() запускает чистый интерпретатор с -X importtime до
+# готовности URL и разбирает вывод в дерево импортов: сколько стоит
+# каждый пакет и кто его импортировал (python manage.py startup_report).
+# Тяжелые модули (NumPy, boto3, Pillow) импортируются при первом
+# использовании; warm_up() загружает их вместе с URL, шаблонами и
+# переводами в мастер-процессе Gunicorn до fork (gunicorn.conf.py),
+# поэтому воркеры отвечают на первый запрос без этих задержек
+STARTUP_BUDGET = 1.0  # Секунд до готовности URL, переопределяется в settings
+STARTUP_CODE = (
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+WARM_UP_MODULES = ("app.bitmap", "PIL.Image")  # NumPy и Pillow
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def parse_importtime(output):
+    """Дерево импортов из вывода -X importtime: корневые узлы
+    {"name", "self", "total", "children"}, время в секундах"""
+    pending = []  # (уровень, узел); дети печатаются раньше родителя
+    for line in output.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        own, total, indent, name = match.groups()
+        level = len(indent) // 2
+        node = {
+            "name": name,
+            "self": int(own) / 1e6,
+            "total": int(total) / 1e6,
+            "children": [child for depth, child in pending if depth == level + 1],
+        }
+        pending = [(depth, child) for depth, child in pending if depth <= level]
+        pending.append((level, node))
+    return [node for _, node in pending]
+
+
+def _walk(nodes, chain=()):
+    for node in nodes:
+        yield node, chain
+        yield from _walk(node["children"], (*chain, node["name"]))
+
+
+def package_costs(roots):
+    """[(пакет, секунды, цепочка первого импорта)] по убыванию времени;
+    время пакета — сумма собственного времени его модулей"""
+    costs, chains = Counter(), {}
+    for node, chain in _walk(roots):
+        package = node["name"].split(".")[0]
+        costs[package] += node["self"]
+        if package not in chains:
+            chains[package] = [
+                name for name in reversed(chain) if name.split(".")[0] != package
+            ]
+    return [
+        (package, seconds, chains[package]) for package, seconds in costs.most_common()
+    ]
+
+
+def import_report(code=STARTUP_CODE):
+    """Запуск отдельного интерпретатора: общее время, время импортов
+    и стоимость пакетов"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=settings.BASE_DIR,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+    )
+    seconds = time.perf_counter() - started
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    roots = parse_importtime(result.stderr)
+    return {
+        "seconds": seconds,
+        "import_seconds": sum(node["total"] for node in roots),
+        "packages": package_costs(roots),
+        "budget": getattr(settings, "STARTUP_BUDGET", STARTUP_BUDGET),
+    }
+
+
+def _template_names(directory):
+    for path in Path(directory).rglob("*"):
+        if path.is_file() and path.suffix in (".html", ".txt"):
+            yield path.relative_to(directory).as_posix()
+
+
+def warm_up():
+    """Прогрев процесса перед fork: URL, шаблоны проекта, переводы,
+    хранилище и тяжелые модули. Соединения с БД закрываются — они не
+    должны достаться воркерам"""
+    from django.core.files.storage import default_storage
+    from django.db import connections
+    from django.template import TemplateSyntaxError, engines
+    from django.urls import get_resolver
+    from django.utils import translation
+
+    started = time.perf_counter()
+    get_resolver().reverse_dict  # Импорт всех views и таблица reverse()
+    translation.activate(settings.LANGUAGE_CODE)
+
+    templates = 0
+    for engine in engines.all():
+        for directory in getattr(engine, "dirs", ()):
+            for name in _template_names(directory):
+                try:
+                    engine.get_template(name)  # Кэширующий загрузчик хранит
+                    templates += 1
+                except TemplateSyntaxError as e:
+                    logger.warning(f"Шаблон {name} не загружен: {e}")
+
+    # Хранилище и модуль его бэкенда (boto3 для S3), без соединений
+    getattr(default_storage, "backend", None)
+    for module in WARM_UP_MODULES:
+        importlib.import_module(module)
+
+    connections.close_all()
+    logger.info(
+        f"Прогрев: {templates} шаблонов за {time.perf_counter() - started:.2f} с"
+    )
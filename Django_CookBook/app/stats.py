@@ -0,0 +1,125 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError, ResponseError
+
+from . import trending
+from .models import Recipe, RecipeStats
+
+logger = logging.getLogger(__name__)
+
+# Счетчики просмотров копятся в Redis (хэш recipe_id → прирост),
+# уникальные зрители — в HyperLogLog на каждый рецепт.
+# В базу данные попадают только при периодическом сбросе
+VIEWS_KEY = "stats:views"
+FLUSH_KEY = "stats:views:flushing"
+UNIQUE_KEY = "stats:uv:{}"
+
+
+def client_ip(request):
+    """IP-адрес клиента. За обратным прокси из settings.TRUSTED_PROXIES
+    REMOTE_ADDR — адрес прокси, поэтому клиент берется из X-Forwarded-For:
+    первый справа адрес, не принадлежащий доверенным прокси (левые
+    значения заголовка клиент может подставить сам)"""
+    addr = request.META.get("REMOTE_ADDR", "")
+    trusted = getattr(settings, "TRUSTED_PROXIES", ())
+    if addr not in trusted:
+        return addr
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    for hop in reversed([ip.strip() for ip in forwarded.split(",") if ip.strip()]):
+        addr = hop
+        if hop not in trusted:
+            break
+    return addr
+
+
+def viewer_id(request):
+    """Идентификатор зрителя для подсчета уникальных просмотров:
+    id пользователя или IP-адрес для гостей"""
+    if request.user.is_authenticated:
+        return f"u{request.user.pk}"
+    return f"a{client_ip(request)}"
+
+
+def track_view(request, recipe_id):
+    """Учет просмотра рецепта: один round-trip в Redis, без записи в БД.
+    Ошибки Redis не должны ломать страницу рецепта"""
+    try:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        pipe.hincrby(VIEWS_KEY, recipe_id, 1)
+        pipe.pfadd(UNIQUE_KEY.format(recipe_id), viewer_id(request))
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Не удалось учесть просмотр рецепта {recipe_id}: {e}")
+
+
+def flush_view_counters():
+    """Перенос накопленных просмотров из Redis в RecipeStats.
+    Хэш атомарно переименовывается, поэтому просмотры, пришедшие во время
+    сброса, попадут в следующий интервал. Возвращает число рецептов"""
+    redis = get_redis_connection("default")
+
+    # Незавершенный прошлый сброс (например, упала БД) обрабатывается первым
+    if not redis.exists(FLUSH_KEY):
+        try:
+            redis.rename(VIEWS_KEY, FLUSH_KEY)
+        except ResponseError:
+            return 0  # Новых просмотров не было
+
+    deltas = {int(k): int(v) for k, v in redis.hgetall(FLUSH_KEY).items()}
+
+    # Просмотры удаленных за интервал рецептов отбрасываются
+    existing = dict(
+        Recipe.objects.filter(pk__in=deltas).values_list("pk", "category_id")
+    )
+    removed = [UNIQUE_KEY.format(pk) for pk in deltas if pk not in existing]
+    if removed:
+        redis.delete(*removed)
+    deltas = {pk: d for pk, d in deltas.items() if pk in existing}
+
+    if not deltas:
+        redis.delete(FLUSH_KEY)
+        return 0
+
+    # Оценки уникальных зрителей — одним пайплайном
+    pipe = redis.pipeline(transaction=False)
+    for recipe_id in deltas:
+        pipe.pfcount(UNIQUE_KEY.format(recipe_id))
+    uniques = dict(zip(deltas, pipe.execute()))
+
+    with transaction.atomic():
+        # Строки для рецептов, которые просматривают впервые
+        RecipeStats.objects.bulk_create(
+            [RecipeStats(recipe_id=recipe_id) for recipe_id in deltas],
+            ignore_conflicts=True,
+        )
+        # Один UPDATE на все рецепты интервала
+        RecipeStats.objects.filter(recipe_id__in=deltas).update(
+            views=F("views")
+            + Case(
+                *[When(recipe_id=pk, then=Value(d)) for pk, d in deltas.items()],
+                output_field=IntegerField(),
+            ),
+            unique_viewers=Case(
+                *[When(recipe_id=pk, then=Value(u)) for pk, u in uniques.items()],
+                output_field=IntegerField(),
+            ),
+        )
+
+    redis.delete(FLUSH_KEY)
+
+    # Просмотры поднимают рецепты в ленте трендов
+    trending.record_views([(pk, existing[pk], delta) for pk, delta in deltas.items()])
+    return len(deltas)
+
+
+def hot_recipe_ids(limit=20):
+    """Id самых просматриваемых рецептов (например, для прогрева кэша)"""
+    return list(
+        RecipeStats.objects.order_by("-views").values_list("recipe_id", flat=True)[
+            :limit
+        ]
+    )
@@ -0,0 +1,237 @@
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.storage import Storage
+from django.db import IntegrityError, transaction
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Хранилище с адресацией по содержимому поверх основного (MediaStorage, S3).
+# При загрузке файл хэшируется (SHA-256) по чанкам, пока читается, и
+# сохраняется под именем "<каталог>/<хэш><расширение>": повторная загрузка
+# той же картинки не отправляется в S3, а получает имя уже лежащего файла.
+# Учет блобов — таблица MediaBlob; ссылки на блоб — строки рецептов и
+# пользователей с этим именем, их пересчитывает очередь удаления перед тем,
+# как удалить файл (см. app/media.py), поэтому общий файл живет, пока на
+# него ссылается хоть одна строка.
+# Дополнительно для изображений считается перцептивный хэш (dHash, 64 бита):
+# почти одинаковые картинки (другое сжатие или размер) отмечаются в
+# MediaBlob.similar_to
+DEDUPLICATED = ("pictures/", "avatars/")  # tmp/ живет недолго — без учета
+PHASH_DISTANCE = 6  # Порог расстояния Хэмминга для "почти дубликатов"
+
+
+def content_digest(content):
+    """SHA-256 файла по чанкам (без чтения целиком в память) и его размер"""
+    digest = hashlib.sha256()
+    size = 0
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    content.seek(0)
+    return digest.hexdigest(), size
+
+
+def perceptual_hash(content):
+    """dHash изображения как знаковое 64-битное число (для BigIntegerField)
+    или None, если это не изображение"""
+    import numpy as np
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        content.seek(0)
+        with Image.open(content) as image:
+            # JPEG декодируется сразу в уменьшенном виде — без полного размера
+            image.draft("L", (64, 64))
+            pixels = np.asarray(
+                image.convert("L").resize((9, 8), Image.Resampling.LANCZOS),
+                dtype=np.int16,
+            )
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+    finally:
+        content.seek(0)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    value = int("".join("1" if bit else "0" for bit in bits), 2)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def near_duplicates(phash, queryset=None, max_distance=PHASH_DISTANCE):
+    """Блобы, перцептивный хэш которых отличается не больше чем на
+    max_distance бит"""
+    import numpy as np
+
+    from .models import MediaBlob
+
+    queryset = MediaBlob.objects.all() if queryset is None else queryset
+    rows = list(queryset.exclude(phash=None).values_list("pk", "phash"))
+    if not rows:
+        return MediaBlob.objects.none()
+    ids, hashes = zip(*rows)
+    diff = np.array(hashes, dtype=np.int64) ^ np.int64(phash)
+    distances = np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+    close = np.asarray(ids)[distances <= max_distance]
+    return MediaBlob.objects.filter(pk__in=close.tolist())
+
+
+@deconstructible
+class DeduplicatedStorage(Storage):
+    """Обертка над settings.MEDIA_BACKEND_STORAGE с дедупликацией файлов"""
+
+    def __init__(self, backend=None, perceptual=None):
+        self._backend = backend or getattr(
+            settings, "MEDIA_BACKEND_STORAGE", "Django_CookBook.s3_storage.MediaStorage"
+        )
+        self.perceptual = (
+            getattr(settings, "MEDIA_PERCEPTUAL_HASH", True)
+            if perceptual is None
+            else perceptual
+        )
+
+    @cached_property
+    def backend(self):
+        # Модуль хранилища (boto3 для S3) импортируется при первом
+        # обращении к файлам, а не при запуске процесса
+        if isinstance(self._backend, str):
+            return import_string(self._backend)()
+        return self._backend
+
+    def get_available_name(self, name, max_length=None):
+        # Имя дедуплицируемого файла определяется содержимым в _save
+        if name.startswith(DEDUPLICATED):
+            return name
+        return self.backend.get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not name.startswith(DEDUPLICATED):
+            return self.backend.save(name, content)
+
+        from .models import MediaBlob
+
+        digest, size = content_digest(content)
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        blob_name = f"{directory}/{digest}{extension}"
+
+        if MediaBlob.objects.filter(name=blob_name).exists():
+            logger.info(f"Повторная загрузка {name} → {blob_name}")
+            return blob_name
+
+        if not self.backend.exists(blob_name):
+            saved = self.backend.save(blob_name, content)
+            if saved != blob_name:  # Хранилище переименовало файл — без дедупликации
+                return saved
+
+        phash = perceptual_hash(content) if self.perceptual else None
+        try:
+            blob = MediaBlob.objects.create(
+                name=blob_name, digest=digest, size=size, phash=phash
+            )
+        except IntegrityError:
+            return blob_name  # Такой же файл загрузили параллельно
+
+        if phash is not None:
+            similar = near_duplicates(phash).exclude(pk=blob.pk).first()
+            if similar is not None:
+                blob.similar_to = similar
+                blob.save(update_fields=["similar_to"])
+                logger.info(f"{blob_name} почти совпадает с {similar.name}")
+        return blob_name
+
+    def delete_many(self, names):
+        """Удаление файлов пачкой основного хранилища (см. media.delete_files);
+        возвращает имена, удалить которые не удалось. Блоб, на который еще
+        ссылается строка рецепта или пользователя, остается на месте"""
+        from . import media
+        from .models import MediaBlob
+
+        names = set(names) - media._referenced(names)
+        if not names:
+            return set()
+        failed = media.delete_files(names, self.backend)
+        MediaBlob.objects.filter(name__in=names - failed).delete()
+        return failed
+
+    def delete(self, name):
+        self.delete_many([name])
+
+    def _open(self, name, mode="rb"):
+        return self.backend.open(name, mode)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+    def get_created_time(self, name):
+        return self.backend.get_created_time(name)
+
+    def get_accessed_time(self, name):
+        return self.backend.get_accessed_time(name)
+
+
+def deduplicate_existing(storage, dry_run=False):
+    """Перевод загруженных раньше файлов на имена по содержимому: строки
+    рецептов и пользователей получают имя блоба, старые файлы уходят в
+    очередь удаления. Возвращает {старое имя: новое}"""
+    from . import conditional, media
+    from .models import MediaBlob, Recipe, User
+
+    fields = {Recipe: "picture", User: "avatar"}
+    renamed = {}
+    for model, field in fields.items():
+        names = set(model.objects.values_list(field, flat=True))
+        names -= set(
+            MediaBlob.objects.filter(name__in=names).values_list("name", flat=True)
+        )
+        for name in sorted(names - {"", media._default_avatar()}):
+            if not name.startswith(DEDUPLICATED) or not storage.exists(name):
+                continue
+            with storage.open(name) as content:
+                if dry_run:
+                    digest, _ = content_digest(content)
+                    extension = os.path.splitext(name)[1].lower()
+                    renamed[name] = f"{os.path.dirname(name)}/{digest}{extension}"
+                else:
+                    renamed[name] = storage.save(name, content)
+
+    renamed = {old: new for old, new in renamed.items() if old != new}
+    if dry_run or not renamed:
+        return renamed
+
+    scopes = {conditional.CATALOG}
+    with transaction.atomic():
+        for old, new in renamed.items():
+            recipes = Recipe.objects.filter(picture=old)
+            scopes.update(
+                map(conditional.recipe_scope, recipes.values_list("pk", flat=True))
+            )
+            recipes.update(picture=new)
+            users = User.objects.filter(avatar=old)
+            for pk in users.values_list("pk", flat=True):
+                scopes.update(
+                    [conditional.author_scope(pk), conditional.viewer_scope(pk)]
+                )
+            users.update(avatar=new)
+        media.enqueue(renamed)
+    conditional.bump(*scopes)
+    return renamed
@@ -0,0 +1,124 @@
+import logging
+import time
+
+from celery.signals import (
+    after_task_publish,
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+)
+from django.conf import settings
+from django_redis import get_redis_connection
+from kombu.exceptions import ChannelError
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Метрики задач Celery в Redis-хэше STATS_KEY (как метрики загрузок):
+# - task:<имя>:count / :seconds — число выполнений и суммарное время,
+#   task:<имя>:le:<граница> — сколько выполнений уложилось в границу (сек);
+# - task:<имя>:state:<состояние> — SUCCESS, FAILURE, RETRY;
+# - task:<имя>:sent:<очередь> — отправки задачи в очередь: их считает
+#   процесс, который ставит задачу (веб, beat, воркер), поэтому счетчик
+#   общий для всех процессов и переживает их перезапуск;
+# - queue:<очередь>:lag_count / :lag_seconds — ожидание в очереди: при
+#   отправке в заголовок пишется время, при старте считается разница.
+# Текущая длина очередей — у брокера, см. queue_lengths()
+STATS_KEY = "celery:stats"
+PUBLISHED_HEADER = "published_at"
+DURATION_BUCKETS = (0.1, 1, 10, 60, 600)
+
+_started = {}
+
+
+def queue_names():
+    return [queue.name for queue in settings.CELERY_TASK_QUEUES]
+
+
+def queue_lengths():
+    """{очередь: сообщений в брокере}"""
+    from Django_CookBook.celery import app
+
+    with app.connection_for_read() as connection:
+        # Одна попытка: сбор метрик не ждет недоступный брокер
+        connection.ensure_connection(max_retries=0)
+        channel = connection.default_channel
+        lengths = {}
+        for name in queue_names():
+            try:
+                lengths[name] = channel.queue_declare(name, passive=True).message_count
+            except ChannelError:
+                # Очередь еще не создана брокером: в нее ничего не отправляли.
+                # В AMQP ошибка закрывает канал — следующей очереди нужен новый
+                lengths[name] = 0
+                channel = connection.channel()
+        return lengths
+
+
+def _record(increments):
+    try:
+        pipe = get_redis_connection("default").pipeline(transaction=False)
+        for field, value in increments.items():
+            if isinstance(value, float):
+                pipe.hincrbyfloat(STATS_KEY, field, value)
+            else:
+                pipe.hincrby(STATS_KEY, field, value)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Не удалось записать метрики задачи: {e}")
+
+
+@before_task_publish.connect
+def stamp_published(headers=None, **kwargs):
+    if headers is not None:
+        headers[PUBLISHED_HEADER] = time.time()
+
+
+@after_task_publish.connect
+def count_published(sender=None, routing_key=None, **kwargs):
+    _record({f"task:{sender}:sent:{routing_key or 'default'}": 1})
+
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    _started[task_id] = time.monotonic()
+    published = getattr(task.request, PUBLISHED_HEADER, None)
+    if published is None:  # Вызов напрямую или eager-режим
+        return
+    delivery = task.request.delivery_info or {}
+    queue = delivery.get("routing_key") or "default"
+    _record(
+        {
+            f"queue:{queue}:lag_count": 1,
+            f"queue:{queue}:lag_seconds": max(time.time() - published, 0.0),
+        }
+    )
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is None:
+        return
+    seconds = time.monotonic() - started
+    prefix = f"task:{task.name}"
+    increments = {
+        f"{prefix}:count": 1,
+        f"{prefix}:seconds": seconds,
+        f"{prefix}:state:{state}": 1,
+    }
+    for bound in DURATION_BUCKETS:
+        if seconds <= bound:
+            increments[f"{prefix}:le:{bound}"] = 1
+    _record(increments)
+
+
+def task_stats():
+    """Метрики из STATS_KEY: ({задача: {поле: значение}}, {очередь: {...}})"""
+    tasks, queues = {}, {}
+    raw = get_redis_connection("default").hgetall(STATS_KEY)
+    for field, value in raw.items():
+        kind, name, metric = field.decode().split(":", 2)
+        target = tasks if kind == "task" else queues
+        target.setdefault(name, {})[metric] = float(value)
+    return tasks, queues
@@ -1,77 +1,115 @@
 from celery import shared_task
-from .models import Recipe
-from django.core.mail import send_mail
-from django.contrib.sites.models import Site
+from .conditional import CATALOG, SIMILAR, TRENDING, bump
 
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-def send_email(user, subject, message):
-    try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email="noreply@recipesite.com",
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
-        logger.info(f"Письмо успешно отправлено {user.email}")
-        return True
-    except Exception as e:
-        logger.exception(f"Ошибка при отправке письма {user.email}: {e}")
-        return False
+@shared_task
+def reconcile_notifications():
+    """Периодическая сверка порогов уведомлений (Celery beat)"""
+    from . import notifications
+
+    return notifications.reconcile()
+
+
+@shared_task
+def send_daily_digests():
+    """Ежедневные сводки авторам (Celery beat). Запускается каждый час:
+    повторный запуск досылает только сводки, которые еще не ушли"""
+    from . import digest
+
+    return digest.send_digests()
+
+
+@shared_task
+def flush_recipe_views():
+    """Периодический перенос счетчиков просмотров из Redis в БД (Celery beat)"""
+    from .stats import flush_view_counters
+
+    flushed = flush_view_counters()
+    if flushed:
+        bump(TRENDING)
+    logger.info(f"Сброшены просмотры для {flushed} рецептов")
+    return flushed
+
+
+@shared_task
+def rebuild_trending():
+    """Периодическая пересборка лент трендов из БД (Celery beat)"""
+    from . import trending
+
+    size = trending.rebuild_trending()
+    bump(TRENDING)
+    logger.info(f"Лента трендов пересобрана: {size} рецептов")
+    return size
+
+
+@shared_task
+def rebuild_similar_recipes():
+    """Ночной пересчет похожих рецептов (Celery beat)"""
+    from . import recommendations
+
+    pairs = recommendations.rebuild_similar_recipes()
+    bump(SIMILAR)
+    return pairs
 
 
 @shared_task
-def notify_recipe_saved(recipe_id):
-    """Уведомление на почту: рецепт сохранило более 500 человек"""
-    try:
-        recipe = Recipe.objects.get(id=recipe_id)
-    except Recipe.DoesNotExist:
-        logger.error(f"Рецепт с id={recipe_id} не найден")
-        return False
-
-    if not recipe.notified_saved and recipe.favorite_set.count() > 500:
-        current_site = Site.objects.get_current()
-        url = f"https://{current_site.domain}{recipe.get_absolute_url()}"
-        subject = "Поздравляем с безупречным рецептом!"
-        message = (
-            f'Дорогой кулинар, ваш рецепт "{recipe.dish_name}" был сохранен более 500 раз!'
-            f"Это несомненно говорит о вашем выдающемся вкусе. 💫"
-            f"\nСтраница рецепта: {url}"
-        )
-
-        if send_email(recipe.author, subject, message):
-            recipe.notified_saved = True
-            recipe.save(update_fields=["notified_saved"])
-            return True
-    return False
+def recompute_bayesian_ratings():
+    """Периодический пакетный пересчет взвешенных рейтингов (Celery beat)"""
+    from . import ranking
+
+    updated = ranking.recompute_scores()
+    bump(CATALOG)
+    return updated
+
+
+@shared_task
+def rebuild_autocomplete():
+    """Периодическая пересборка индекса подсказок с актуальной популярностью"""
+    from . import autocomplete
+
+    return autocomplete.rebuild_index()
+
+
+@shared_task
+def extract_recipe_ingredients():
+    """Повторное извлечение ингредиентов всех рецептов после правки словаря"""
+    from . import ingredients
+
+    changed = ingredients.extract_all()
+    bump(CATALOG)
+    logger.info(f"Ингредиенты обновлены у {changed} рецептов")
+    return changed
 
 
 @shared_task
-def notify_recipe_top_rated(recipe_id):
-    """Уведомление на почту: рецепт попал в топ (рейтинг > 4.7)"""
-    try:
-        recipe = Recipe.objects.get(id=recipe_id)
-    except Recipe.DoesNotExist:
-        logger.error(f"Рецепт с id={recipe_id} не найден")
-        return False
-
-    avg_rating = recipe.average_rating()
-    if not recipe.notified_top and avg_rating > 4.7:
-        current_site = Site.objects.get_current()
-        url = f"https://{current_site.domain}{recipe.get_absolute_url()}"
-        subject = "Ваш рецепт сияет среди лучших!"
-        message = (
-            f'Поздравляем! Ваш рецепт "{recipe.dish_name}" достиг исключительного рейтинга {avg_rating} ⭐️ '
-            f"и занял почётное место в нашей коллекции избранного. Это просто безупречно!"
-            f"\nСтраница рецепта: {url}"
-        )
-
-        if send_email(recipe.author, subject, message):
-            recipe.notified_top = True
-            recipe.save(update_fields=["notified_top"])
-            return True
-    return False
+def delete_account_data(user_id):
+    """Фоновое удаление аккаунта порциями после деактивации"""
+    from . import accounts
+
+    return accounts.delete_account_data(user_id)
+
+
+@shared_task
+def drain_media_deletions():
+    """Периодическое удаление файлов из очереди пачками (Celery beat)"""
+    from . import media
+
+    deleted = media.drain()
+    if deleted:
+        logger.info(f"Удалено файлов из хранилища: {deleted}")
+    return deleted
+
+
+@shared_task
+def purge_deactivated_accounts():
+    """Повторная постановка удаления аккаунтов, задача которых потерялась"""
+    from . import accounts
+
+    user_ids = accounts.stale_deactivated_ids()
+    for user_id in user_ids:
+        delete_account_data.delay(user_id)
+    return len(user_ids)
@@ -1,3 +1,1708 @@
-from django.test import TestCase
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from celery.signals import after_task_publish, task_postrun, task_prerun
+from django.conf import settings
+from django.core import mail
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_redis import get_redis_connection
+from kombu import Connection
+from PIL import Image
+from prometheus_client import REGISTRY
+from redis.exceptions import RedisError
+
+from Django_CookBook.celery import app as celery_app
+
+from . import (
+    accounts,
+    api,
+    autocomplete,
+    conditional,
+    db_router,
+    digest,
+    fuzzy,
+    media,
+    metrics,
+    notifications,
+    profiling,
+    ranking,
+    ratelimit,
+    recommendations,
+    startup,
+    task_metrics,
+    tasks,
+    trending,
+    uploads,
+    user_state,
+)
+from .bitmap import RoaringBitmap
+from .facets import category_facets
+from .forms import SignUpForm
+from .ingredients import extract_ingredients, load_dictionary, match_recipes
+from .models import (
+    Category,
+    DigestEvent,
+    Favorite,
+    Ingredient,
+    MediaBlob,
+    MediaDeletion,
+    Recipe,
+    RecipeIngredient,
+    RecipeRating,
+    RecipeStats,
+    SearchTrigram,
+    SimilarRecipe,
+    User,
+)
+from .stats import VIEWS_KEY, flush_view_counters
+from .storage import DeduplicatedStorage
+
+
+class ViewCounterTests(TestCase):
+    """Просмотры копятся в Redis и переносятся в базу одним UPDATE"""
+
+    def setUp(self):
+        get_redis_connection("default").flushdb()
+        self.author = User.objects.create_user(
+            email="author@example.com", nickname="author", password="password"
+        )
+        self.reader = User.objects.create_user(
+            email="reader@example.com", nickname="reader", password="password"
+        )
+        category = Category.objects.create(category="Салаты")
+        self.first, self.second = [
+            Recipe.objects.create(
+                author=self.author,
+                category=category,
+                dish_name=name,
+                picture="pictures/salad.jpg",
+                description="Описание",
+                text="<p>Шаги</p>",
+            )
+            for name in ("Салат", "Суп")
+        ]
+
+    def view(self, recipe, times=1):
+        for _ in range(times):
+            self.client.get(recipe.get_absolute_url())
+
+    def test_flush_applies_all_deltas_in_one_update(self):
+        self.view(self.first, 2)
+        self.client.force_login(self.reader)
+        self.view(self.first)
+        self.view(self.second)
+        self.assertFalse(RecipeStats.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(flush_view_counters(), 2)
+        updates = [q for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+
+        first = RecipeStats.objects.get(recipe=self.first)
+        self.assertEqual((first.views, first.unique_viewers), (3, 2))
+        second = RecipeStats.objects.get(recipe=self.second)
+        self.assertEqual((second.views, second.unique_viewers), (1, 1))
+        self.assertFalse(get_redis_connection("default").exists(VIEWS_KEY))
+        self.assertEqual(flush_view_counters(), 0)
+
+    def test_flush_adds_to_stored_views(self):
+        self.view(self.first, 2)
+        flush_view_counters()
+        self.view(self.first, 3)
+        flush_view_counters()
+
+        stats = RecipeStats.objects.get(recipe=self.first)
+        self.assertEqual((stats.views, stats.unique_viewers), (5, 1))
+
+    def test_views_of_deleted_recipe_are_dropped(self):
+        self.view(self.first)
+        self.view(self.second)
+        self.second.delete()
+
+        self.assertEqual(flush_view_counters(), 1)
+        self.assertEqual(
+            list(RecipeStats.objects.values_list("recipe_id", flat=True)),
+            [self.first.pk],
+        )
+
+
+class TrendingTests(TestCase):
+    """Очки трендов с прямым затуханием: Lua-скрипт и пересборка из БД"""
+
+    def setUp(self):
+        self.redis = get_redis_connection("default")
+        self.redis.flushdb()
+        self.user = User.objects.create_user(
+            email="user@example.com", nickname="user", password="password"
+        )
+        self.salads = Category.objects.create(category="Салаты")
+        self.soups = Category.objects.create(category="Супы")
+        self.salad, self.soup = [
+            Recipe.objects.create(
+                author=self.user,
+                category=category,
+                dish_name=category.category,
+                picture="pictures/dish.jpg",
+                description="Описание",
+                text="<p>Шаги</p>",
+            )
+            for category in (self.salads, self.soups)
+        ]
+
+    def score(self, recipe, feed=trending.ALL):
+        return self.redis.zscore(trending.FEED_KEY.format(feed), recipe.pk) or 0.0
+
+    def test_event_weight_halves_every_half_life(self):
+        now = time.time()
+        trending.record_event(self.salad.pk, self.salads.pk, 3.0, now)
+        trending.record_event(
+            self.soup.pk, self.soups.pk, 3.0, now - trending.HALF_LIFE
+        )
+
+        self.assertEqual(trending.trending_ids(), [self.salad.pk, self.soup.pk])
+        self.assertAlmostEqual(self.score(self.salad) / self.score(self.soup), 2.0)
+        self.assertEqual(trending.trending_ids(self.soups.pk), [self.soup.pk])
+
+    def test_removed_favorite_takes_back_its_score(self):
+        favorite = Favorite.objects.create(user=self.user, recipe=self.salad)
+        self.assertGreater(self.score(self.salad, self.salads.pk), 0)
+
+        favorite.delete()
+        self.assertAlmostEqual(self.score(self.salad), 0.0)
+        self.assertAlmostEqual(self.score(self.salad, self.salads.pk), 0.0)
+
+    def test_rerating_replaces_previous_weight(self):
+        rating = RecipeRating.objects.create(
+            user=self.user, recipe=self.salad, rating=5
+        )
+        first = self.score(self.salad)
+        self.assertAlmostEqual(first, trending.rating_weight(5), places=3)
+
+        rating.save()  # Та же оценка еще раз
+        self.assertEqual(self.score(self.salad), first)
+
+        rating.rating = 4
+        rating.save()
+        self.assertAlmostEqual(
+            self.score(self.salad), trending.rating_weight(4), places=3
+        )
+
+        rating.delete()
+        self.assertAlmostEqual(self.score(self.salad), 0.0, places=3)
+
+    def test_rebuild_restores_feeds_from_database(self):
+        Favorite.objects.create(user=self.user, recipe=self.soup)
+        RecipeRating.objects.create(user=self.user, recipe=self.salad, rating=4)
+        self.redis.flushdb()
+
+        self.assertEqual(trending.rebuild_trending(), 2)
+        self.assertEqual(trending.trending_ids(), [self.soup.pk, self.salad.pk])
+        self.assertEqual(trending.trending_ids(self.salads.pk), [self.salad.pk])
+
+
+class RecommendationTests(TestCase):
+    """Блочный top-K косинусной близости совпадает с плотным расчетом"""
+
+    def interactions(self, seed=7):
+        rng = np.random.default_rng(seed)
+        users = rng.integers(0, 40, 600)
+        items = rng.integers(100, 160, 600)  # Id рецептов, а не индексы
+        weights = rng.choice([1.0, 0.2, 0.6, 1.0], 600)
+        return users, items, weights
+
+    def dense_similarity(self, users, items, weights):
+        recipe_ids, item_idx = np.unique(items, return_inverse=True)
+        _, user_idx = np.unique(users, return_inverse=True)
+        matrix = np.zeros((user_idx.max() + 1, len(recipe_ids)))
+        np.add.at(matrix, (user_idx, item_idx), weights)
+        norms = np.linalg.norm(matrix, axis=0)
+        sims = matrix.T @ matrix / np.outer(norms, norms)
+        np.fill_diagonal(sims, 0.0)
+        return recipe_ids, sims
+
+    def assert_matches_dense(self, result, interactions):
+        recipe_ids, neighbours, scores = result
+        expected_ids, sims = self.dense_similarity(*interactions)
+        np.testing.assert_array_equal(recipe_ids, expected_ids)
+        k = neighbours.shape[1]
+        for i in range(len(recipe_ids)):
+            # Соседи по убыванию, их близость — из плотной матрицы
+            np.testing.assert_allclose(scores[i], sims[i, neighbours[i]])
+            np.testing.assert_allclose(scores[i], np.sort(sims[i])[::-1][:k])
+
+    @mock.patch("app.recommendations.BLOCK_CELLS", 300)  # Блоки по 5 рецептов
+    def test_blocks_match_dense_cosine(self):
+        interactions = self.interactions()
+        result = recommendations.compute_similar(*interactions, top_k=5)
+        self.assertEqual(result[1].shape, (60, 5))
+        self.assert_matches_dense(result, interactions)
+
+    def test_pairs_are_expanded_in_bounded_chunks(self):
+        interactions = self.interactions(seed=11)
+        expected = recommendations.compute_similar(*interactions, top_k=5)
+        with mock.patch("app.recommendations.BLOCK_PAIRS", 50):
+            chunked = recommendations.compute_similar(*interactions, top_k=5)
+        np.testing.assert_allclose(chunked[2], expected[2])
+        self.assert_matches_dense(chunked, interactions)
+
+    def test_rebuild_stores_ranked_neighbours(self):
+        author, *readers = [
+            User.objects.create_user(
+                email=f"user{i}@example.com", nickname=f"user{i}", password="password"
+            )
+            for i in range(4)
+        ]
+        category = Category.objects.create(category="Салаты")
+        salad, soup, cake = [
+            Recipe.objects.create(
+                author=author,
+                category=category,
+                dish_name=name,
+                picture="pictures/dish.jpg",
+                description="Описание",
+                text="<p>Шаги</p>",
+            )
+            for name in ("Салат", "Суп", "Торт")
+        ]
+        for reader in readers[:2]:
+            Favorite.objects.create(user=reader, recipe=salad)
+            Favorite.objects.create(user=reader, recipe=soup)
+        Favorite.objects.create(user=readers[2], recipe=cake)
+
+        self.assertEqual(recommendations.rebuild_similar_recipes(), 2)
+        self.assertEqual(
+            list(
+                SimilarRecipe.objects.order_by("recipe_id").values_list(
+                    "recipe_id", "similar_id", "rank"
+                )
+            ),
+            [(salad.pk, soup.pk, 1), (soup.pk, salad.pk, 1)],
+        )
+
+
+class BayesianRatingTests(TestCase):
+    """Агрегаты оценок обновляются инкрементально и сходятся с пересчетом"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [
+            User.objects.create_user(
+                email=f"user{i}@example.com", nickname=f"user{i}", password=None
+            )
+            for i in range(20)
+        ]
+        category = Category.objects.create(category="Салаты")
+        self.single, self.popular = [
+            Recipe.objects.create(
+                author=self.users[0],
+                category=category,
+                dish_name=name,
+                picture="pictures/dish.jpg",
+                description="Описание",
+                text="<p>Шаги</p>",
+            )
+            for name in ("Салат", "Суп")
+        ]
+
+    def aggregates(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.rating_count, recipe.rating_sum, recipe.bayesian_rating
+
+    def test_incremental_updates_follow_ratings(self):
+        first = RecipeRating.objects.create(
+            user=self.users[1], recipe=self.single, rating=5
+        )
+        second = RecipeRating.objects.create(
+            user=self.users[2], recipe=self.single, rating=3
+        )
+        self.assertEqual(
+            self.aggregates(self.single), (2, 8, ranking.bayesian(8, 2, 3.0))
+        )
+
+        first.rating = 1
+        first.save()
+        self.assertEqual(self.aggregates(self.single)[:2], (2, 4))
+
+        second.delete()
+        self.assertEqual(
+            self.aggregates(self.single), (1, 1, ranking.bayesian(1, 1, 3.0))
+        )
+
+    def test_recompute_fixes_drift_and_updates_prior(self):
+        RecipeRating.objects.create(user=self.users[1], recipe=self.single, rating=5)
+        RecipeRating.objects.create(user=self.users[1], recipe=self.popular, rating=2)
+        self.assertEqual(ranking.recompute_scores(), 2)  # Новое среднее по сайту 3.5
+        self.assertEqual(ranking.recompute_scores(), 0)
+
+        Recipe.objects.filter(pk=self.single.pk).update(rating_sum=99)
+        self.assertEqual(ranking.recompute_scores(), 1)
+        self.assertEqual(ranking.prior_mean(), 3.5)
+        self.assertEqual(
+            self.aggregates(self.single), (1, 5, ranking.bayesian(5, 1, 3.5))
+        )
+
+    def test_many_ratings_outrank_a_single_five(self):
+        RecipeRating.objects.create(user=self.users[1], recipe=self.single, rating=5)
+        for i, user in enumerate(self.users):
+            RecipeRating.objects.create(
+                user=user, recipe=self.popular, rating=4 if i == 0 else 5
+            )
+
+        response = self.client.get(reverse("best"))
+        self.assertEqual(list(response.context["recipes"]), [self.popular, self.single])
+
+
+class CategoryFacetTests(TestCase):
+    """Счетчики по категориям кэшируются до смены поколения"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email="author@example.com", nickname="author", password="password"
+        )
+        self.salads = Category.objects.create(category="Салаты")
+        self.soups = Category.objects.create(category="Супы")
+        self.add_recipe(self.salads)
+        self.add_recipe(self.salads)
+
+    def add_recipe(self, category):
+        return Recipe.objects.create(
+            author=self.author,
+            category=category,
+            dish_name="Блюдо",
+            picture="pictures/dish.jpg",
+            description="Описание",
+            text="<p>Шаги</p>",
+        )
+
+    def counts(self, *key_parts):
+        facets = category_facets(Recipe.objects.all(), *key_parts)
+        return {facet["category"]: facet["count"] for facet in facets}
+
+    def test_facets_are_counted_once_per_generation(self):
+        with self.assertNumQueries(2):  # GROUP BY и список категорий
+            self.assertEqual(self.counts("best"), {"Салаты": 2, "Супы": 0})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts("best"), {"Салаты": 2, "Супы": 0})
+        with self.assertNumQueries(2):  # Другая выборка — свой ключ
+            self.counts("search", "суп")
+
+    def test_changes_bump_generation(self):
+        self.counts("best")
+        self.add_recipe(self.soups)
+        self.assertEqual(self.counts("best"), {"Салаты": 2, "Супы": 1})
+
+        Category.objects.create(category="Торты")
+        self.assertEqual(self.counts("best")["Торты"], 0)
+
+    def test_search_sidebar_counts_ignore_selected_category(self):
+        self.add_recipe(self.soups)
+        response = self.client.get(
+            reverse("recipe_search"), {"category": self.soups.pk}
+        )
+        counts = {f["category"]: f["count"] for f in response.context["categories"]}
+        self.assertEqual(counts, {"Салаты": 2, "Супы": 1})
+        self.assertEqual(len(response.context["recipes"]), 1)
+
+
+class AutocompleteTests(TestCase):
+    """Подсказки читаются Lua-скриптом из префиксного индекса в Redis"""
+
+    def setUp(self):
+        self.redis = get_redis_connection("default")
+        self.redis.flushdb()
+        self.author = User.objects.create_user(
+            email="author@example.com", nickname="Ёжик", password="password"
+        )
+        self.category = Category.objects.create(category="Салаты")
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            category=self.category,
+            dish_name="Салат Цезарь",
+            picture="pictures/dish.jpg",
+            description="Описание",
+            text="<p>Шаги</p>",
+        )
+
+    def test_members_are_indexed_on_save(self):
+        self.assertEqual(
+            autocomplete.suggest("цез"), [(f"r:{self.recipe.pk}", "Салат Цезарь")]
+        )
+        self.assertEqual(autocomplete.suggest("ЕЖ"), [(f"u:{self.author.pk}", "Ёжик")])
+
+        self.recipe.dish_name = "Суп"
+        self.recipe.save()
+        self.assertEqual(autocomplete.suggest("цез"), [])
+
+        self.recipe.delete()
+        self.assertEqual(autocomplete.suggest("суп"), [])
+
+    def test_suggestions_are_ordered_by_popularity(self):
+        autocomplete.build_index(
+            [("r:1", "Салат", 5), ("r:2", "Сало", 10), ("c:3", "Супы", 50)]
+        )
+        self.assertEqual(
+            autocomplete.suggest("сал"), [("r:2", "Сало"), ("r:1", "Салат")]
+        )
+        self.assertEqual(autocomplete.suggest("с", limit=2)[0], ("c:3", "Супы"))
+
+    def test_rebuild_switches_version_and_drops_old_keys(self):
+        old = autocomplete._version(self.redis)
+        autocomplete.rebuild_index()
+
+        self.assertNotEqual(autocomplete._version(self.redis), old)
+        self.assertEqual(list(self.redis.scan_iter(f"autocomplete:{old}:*")), [])
+        self.assertEqual(
+            [label for _, label in autocomplete.suggest("са")],
+            ["Салаты", "Салат Цезарь"],  # В категории один рецепт
+        )
+
+    def test_long_query_is_filtered_by_full_text(self):
+        autocomplete.build_index(
+            [
+                ("r:1", "Салат из свежих огурцов", 1),
+                ("r:2", "Салат из свежих помидоров", 2),
+            ]
+        )
+        self.assertEqual(
+            autocomplete.suggest("салат из свежих огу"),
+            [("r:1", "Салат из свежих огурцов")],
+        )
+
+    def test_view_returns_links(self):
+        response = self.client.get(reverse("autocomplete"), {"q": "сала"})
+        self.assertCountEqual(
+            response.json()["results"],
+            [
+                {
+                    "type": "category",
+                    "label": "Салаты",
+                    "url": f"{reverse('recipe_search')}?category={self.category.pk}",
+                },
+                {
+                    "type": "recipe",
+                    "label": "Салат Цезарь",
+                    "url": self.recipe.get_absolute_url(),
+                },
+            ],
+        )
+
+
+class FuzzySearchTests(TestCase):
+    """Нечеткий поиск: отбор по индексу триграмм и порядок по близости"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email="author@example.com", nickname="Поваренок", password="password"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", nickname="Гость", password="password"
+        )
+        self.category = Category.objects.create(category="Салаты")
+        self.salad = self.add_recipe("Салат")
+        self.tuna = self.add_recipe("Салат с тунцом и яйцом")
+        self.lard = self.add_recipe("Сало")
+        self.borsch = self.add_recipe("Борщ", self.other)
+
+    def add_recipe(self, name, author=None):
+        return Recipe.objects.create(
+            author=author or self.author,
+            category=self.category,
+            dish_name=name,
+            picture="pictures/dish.jpg",
+            description="Описание",
+            text="<p>Шаги</p>",
+        )
+
+    def test_word_match_ranks_before_whole_name_similarity(self):
+        self.assertEqual(
+            fuzzy.fuzzy_recipe_ids("салат"),
+            [self.salad.pk, self.tuna.pk, self.lard.pk],
+        )
+
+    def test_typo_in_dish_name_and_nickname(self):
+        self.assertEqual(fuzzy.fuzzy_recipe_ids("борш"), [self.borsch.pk])
+        self.assertCountEqual(
+            fuzzy.fuzzy_recipe_ids("поваренак"),
+            [self.salad.pk, self.tuna.pk, self.lard.pk],
+        )
+        self.assertEqual(fuzzy.fuzzy_recipe_ids("торт"), [])
+
+    def test_index_follows_renames_and_rebuild(self):
+        self.borsch.dish_name = "Торт"
+        self.borsch.save()
+        self.assertEqual(fuzzy.fuzzy_recipe_ids("борш"), [])
+        self.assertEqual(fuzzy.fuzzy_recipe_ids("тотр"), [])  # Ниже порога
+        self.assertEqual(fuzzy.fuzzy_recipe_ids("торты"), [self.borsch.pk])
+
+        SearchTrigram.objects.all().delete()
+        self.assertGreater(fuzzy.rebuild_index(), 0)
+        self.assertEqual(fuzzy.fuzzy_recipe_ids("торты"), [self.borsch.pk])
+
+    def test_search_falls_back_to_fuzzy_results(self):
+        response = self.client.get(reverse("recipe_search"), {"q": "Салатт"})
+        self.assertTrue(response.context["fuzzy"])
+        self.assertEqual(list(response.context["recipes"]), [self.salad, self.tuna])
+
+        response = self.client.get(reverse("recipe_search"), {"q": "Борщ"})
+        self.assertFalse(response.context["fuzzy"])
+        self.assertEqual(list(response.context["recipes"]), [self.borsch])
+
+
+class RoaringBitmapTests(SimpleTestCase):
+    """Операции над сжатыми множествами совпадают с операциями над set"""
+
+    def test_set_operations_match_python_sets(self):
+        rng = np.random.default_rng(3)
+        # Разреженные (массивы) и плотные (битовые карты) контейнеры
+        first = set(rng.integers(0, 200_000, 3000).tolist()) | set(range(5000))
+        second = set(rng.integers(0, 200_000, 9000).tolist()) | set(range(70000, 80000))
+        a, b = RoaringBitmap.from_ids(list(first)), RoaringBitmap.from_ids(list(second))
+
+        self.assertEqual(len(a), len(first))
+        self.assertEqual(set(a & b), first & second)
+        self.assertEqual(set(a | b), first | second)
+        self.assertEqual(
+            set(RoaringBitmap.intersection([a, b, RoaringBitmap.from_ids([3, 75000])])),
+            {3, 75000} & first & second,
+        )
+        self.assertIn(4999, a)
+        self.assertNotIn(200_001, a)
+        self.assertEqual(len(RoaringBitmap.union([])), 0)
+
+
+class IngredientSearchTests(TestCase):
+    """Ингредиенты из шагов рецепта и поиск по их сжатым множествам"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email="author@example.com", nickname="author", password="password"
+        )
+        self.category = Category.objects.create(category="Завтраки")
+        self.cheese = Ingredient.objects.get(name="Сыр")
+        self.eggs = Ingredient.objects.get(name="Яйца")
+        self.salt = Ingredient.objects.get(name="Соль")
+        self.omelette = self.add_recipe(
+            "Омлет", "<ul><li>2 яйца</li><li>50 г сыра</li></ul><p>Посолить</p>"
+        )
+        self.toast = self.add_recipe("Тост", "<p>Хлеб с сыром и солью</p>")
+
+    def add_recipe(self, name, text):
+        return Recipe.objects.create(
+            author=self.author,
+            category=self.category,
+            dish_name=name,
+            picture="pictures/dish.jpg",
+            description="Описание",
+            text=text,
+        )
+
+    def ingredients_of(self, recipe):
+        return set(
+            RecipeIngredient.objects.filter(recipe=recipe).values_list(
+                "ingredient_id", flat=True
+            )
+        )
+
+    def test_list_items_take_precedence_over_text(self):
+        self.assertEqual(
+            self.ingredients_of(self.omelette), {self.eggs.pk, self.cheese.pk}
+        )
+        self.assertEqual(
+            self.ingredients_of(self.toast),
+            extract_ingredients(self.toast.text, load_dictionary()),
+        )
+        self.assertIn(self.salt.pk, self.ingredients_of(self.toast))
+
+    def test_all_and_any_match(self):
+        both = [self.cheese.pk, self.eggs.pk]
+        self.assertEqual(list(match_recipes(both)), [self.omelette.pk])
+        self.assertEqual(
+            list(match_recipes(both, match_all=False)),
+            [self.omelette.pk, self.toast.pk],
+        )
+
+    def test_index_is_rebuilt_after_changes(self):
+        self.assertEqual(list(match_recipes([self.salt.pk])), [self.toast.pk])
+        self.omelette.text = "<p>Яйца, соль</p>"
+        self.omelette.save()
+        self.assertEqual(
+            list(match_recipes([self.salt.pk])), [self.omelette.pk, self.toast.pk]
+        )
+
+    def test_index_is_rebuilt_after_cache_flush(self):
+        self.assertEqual(list(match_recipes([self.salt.pk])), [self.toast.pk])
+        cache.clear()
+        self.omelette.text = "<p>Яйца, соль</p>"
+        self.omelette.save()
+        self.toast.text = "<p>Хлеб с сыром</p>"
+        self.toast.save()
+        self.assertEqual(list(match_recipes([self.salt.pk])), [self.omelette.pk])
+
+    def test_search_filters_by_ingredients(self):
+        url = reverse("recipe_search")
+        ingredients = [self.cheese.pk, self.eggs.pk]
+        response = self.client.get(url, {"ingredient": ingredients})
+        self.assertEqual(list(response.context["recipes"]), [self.omelette])
+
+        response = self.client.get(url, {"ingredient": ingredients, "match": "any"})
+        self.assertEqual(list(response.context["recipes"]), [self.toast, self.omelette])
+
+    @mock.patch("app.ingredients.MATCH_LIMIT", 1)
+    def test_category_is_applied_before_match_limit(self):
+        lunches = Category.objects.create(category="Обеды")
+        Recipe.objects.filter(pk=self.omelette.pk).update(category=lunches)
+        url = reverse("recipe_search")
+
+        response = self.client.get(url, {"ingredient": self.cheese.pk})
+        self.assertEqual(list(response.context["recipes"]), [self.toast])
+
+        response = self.client.get(
+            url, {"ingredient": self.cheese.pk, "category": lunches.pk}
+        )
+        self.assertEqual(list(response.context["recipes"]), [self.omelette])
+
+        data = self.client.get(
+            reverse("api_recipes"),
+            {"ingredient": self.cheese.pk, "category": lunches.pk, "fields": "id"},
+        ).json()
+        self.assertEqual(data["results"], [{"id": self.omelette.pk}])
+
+    @mock.patch("app.ingredients.MATCH_LIMIT", 1)
+    def test_old_text_match_survives_match_limit(self):
+        # Сыр есть в обоих рецептах, но ограничение оставило бы только тост
+        response = self.client.get(
+            reverse("recipe_search"), {"q": "омлет", "ingredient": self.cheese.pk}
+        )
+        self.assertEqual(list(response.context["recipes"]), [self.omelette])
+        counts = {c["id"]: c["count"] for c in response.context["categories"]}
+        self.assertEqual(counts[self.category.pk], 1)
+
+        response = self.client.get(
+            reverse("recipe_search"), {"ingredient": self.cheese.pk}
+        )
+        counts = {c["id"]: c["count"] for c in response.context["categories"]}
+        self.assertEqual(counts[self.category.pk], 2)
+
+
+class UserStateTests(TestCase):
+    """Отметки пользователя читаются из Redis одним пайплайном"""
+
+    def setUp(self):
+        self.redis = get_redis_connection("default")
+        self.redis.flushdb()
+        self.user = User.objects.create_user(
+            email="user@example.com", nickname="user", password="password"
+        )
+        author = User.objects.create_user(
+            email="author@example.com", nickname="author", password="password"
+        )
+        category = Category.objects.create(category="Салаты")
+        self.salad, self.soup, self.cake = [
+            Recipe.objects.create(
+                author=author,
+                category=category,
+                dish_name=name,
+                picture="pictures/dish.jpg",
+                description="Описание",
+                text="<p>Шаги</p>",
+            )
+            for name in ("Салат", "Суп", "Торт")
+        ]
+        Favorite.objects.create(user=self.user, recipe=self.salad)
+        RecipeRating.objects.create(user=self.user, recipe=self.soup, rating=4)
+        self.ids = [self.salad.pk, self.soup.pk, self.cake.pk]
+
+    def state(self):
+        return {
+            pk: (state["is_favorite"], state["user_rating"])
+            for pk, state in user_state.user_state(self.user, self.ids).items()
+        }
+
+    def test_state_is_loaded_once_then_read_from_redis(self):
+        expected = {
+            self.salad.pk: (True, None),
+            self.soup.pk: (False, 4),
+            self.cake.pk: (False, None),
+        }
+        with self.assertNumQueries(2):
+            self.assertEqual(self.state(), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.state(), expected)
+
+    def test_views_write_through_loaded_state(self):
+        self.client.force_login(self.user)
+        self.state()
+        self.client.post(reverse("rate_recipe", args=[self.cake.pk]), {"rating": 5})
+        self.client.post(reverse("add_to_favorites", args=[self.salad.pk]))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.state()[self.cake.pk], (False, 5))
+            self.assertEqual(self.state()[self.salad.pk], (False, None))
+
+    def test_writes_do_not_create_partial_state(self):
+        user_state.set_favorite(self.user.pk, self.cake.pk, True)
+        self.assertFalse(
+            self.redis.exists(user_state.FAVORITES_KEY.format(self.user.pk))
+        )
+        self.assertEqual(self.state()[self.cake.pk], (False, None))
+
+    def test_redis_errors_fall_back_to_database(self):
+        with mock.patch("app.user_state.get_redis_connection", side_effect=RedisError):
+            self.assertEqual(self.state()[self.soup.pk], (False, 4))
+
+    def test_anonymous_user_has_no_marks(self):
+        anonymous = mock.Mock(is_authenticated=False)
+        with self.assertNumQueries(0):
+            states = user_state.user_state(anonymous, self.ids)
+        self.assertFalse(any(s["is_favorite"] for s in states.values()))
+
+
+class ConditionalGetTests(TestCase):
+    """Условные GET-запросы: 304 без рендеринга и сброс ETag при изменениях"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            email="author@example.com", nickname="author", password="password"
+        )
+        self.reader = User.objects.create_user(
+            email="reader@example.com", nickname="reader", password="password"
+        )
+        self.other = User.objects.create_user(
+            email="other@example.com", nickname="other", password="password"
+        )
+        category = Category.objects.create(category="Салаты")
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            category=category,
+            dish_name="Салат",
+            picture="pictures/salad.jpg",
+            description="Описание",
+            text="<p>Шаги</p>",
+        )
+        self.url = self.recipe.get_absolute_url()
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_unchanged_recipe_returns_304(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("ETag", first)
+        self.assertIn("Last-Modified", first)
+
+        with self.assertNumQueries(0):
+            second = self.revalidate(self.url, first)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_rating_by_another_user_invalidates_recipe(self):
+        self.client.force_login(self.reader)
+        first = self.client.get(self.url)
+
+        RecipeRating.objects.create(user=self.other, recipe=self.recipe, rating=5)
+
+        second = self.revalidate(self.url, first)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertEqual(self.revalidate(self.url, second).status_code, 304)
+
+    def test_renamed_or_deleted_similar_recipe_invalidates_recipe(self):
+        soup = Recipe.objects.create(
+            author=self.other,
+            category=self.recipe.category,
+            dish_name="Суп",
+            picture="pictures/soup.jpg",
+            description="Описание",
+            text="<p>Шаги</p>",
+        )
+        SimilarRecipe.objects.create(
+            recipe=self.recipe, similar=soup, score=0.5, rank=1
+        )
+        first = self.client.get(self.url)
+
+        soup.dish_name = "Борщ"
+        soup.save()
+        second = self.revalidate(self.url, first)
+        self.assertEqual(second.status_code, 200)
+
+        User.objects.filter(pk=self.other.pk).update(
+            is_active=False, deactivated_at=timezone.now()
+        )
+        accounts.delete_account_data(self.other.pk)
+        self.assertEqual(self.revalidate(self.url, second).status_code, 200)
+
+    def test_own_rating_change_invalidates_recipe(self):
+        self.client.force_login(self.reader)
+        self.client.post(reverse("rate_recipe", args=[self.recipe.pk]), {"rating": 3})
+        first = self.client.get(self.url)
+        self.assertEqual(first.context["user_rating"], 3)
+
+        self.client.post(reverse("rate_recipe", args=[self.recipe.pk]), {"rating": 4})
+
+        second = self.revalidate(self.url, first)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.context["user_rating"], 4)
+
+    def test_rating_change_invalidates_listing(self):
+        url = reverse("best")
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        RecipeRating.objects.create(user=self.reader, recipe=self.recipe, rating=5)
+
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_etag_depends_on_viewer(self):
+        anonymous = self.client.get(self.url)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.revalidate(self.url, anonymous).status_code, 200)
+
+    def test_profile_invalidated_by_new_recipe(self):
+        url = reverse("user_profile", args=[self.author.pk])
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        self.recipe.dish_name = "Новый салат"
+        self.recipe.save()
+
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_versions_of_unknown_scopes_expire(self):
+        response = self.client.get(reverse("recipe_detail", args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+        key = conditional.VERSION_KEY.format(conditional.recipe_scope(999999))
+        self.assertTrue(0 < cache.ttl(key) <= conditional.VERSION_TIMEOUT)
+
+
+@override_settings(RATE_LIMITS={"check_email": "3/m"})
+class RateLimitTests(TestCase):
+    """Token bucket: лимит, заголовки и резервное ведро в памяти"""
+
+    def setUp(self):
+        redis = get_redis_connection("default")
+        for key in redis.scan_iter(ratelimit.KEY.format("*", "*")):
+            redis.delete(key)
+        ratelimit._local_buckets.clear()
+        self.url = reverse("check_email")
+
+    def test_limit_and_headers(self):
+        for remaining in (2, 1, 0):
+            response = self.client.get(self.url, {"email": "a@example.com"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-RateLimit-Limit"], "3")
+            self.assertEqual(response["X-RateLimit-Remaining"], str(remaining))
+
+        response = self.client.get(self.url, {"email": "a@example.com"})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "20")
+
+    def test_clients_are_limited_separately(self):
+        for _ in range(4):
+            self.client.get(self.url, REMOTE_ADDR="10.0.0.1")
+        response = self.client.get(self.url, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+
+    def test_clients_behind_proxy_are_limited_separately(self):
+        for _ in range(4):
+            self.client.get(
+                self.url,
+                REMOTE_ADDR="127.0.0.1",
+                HTTP_X_FORWARDED_FOR="203.0.113.1",
+            )
+        # Подставленный клиентом левый адрес не помогает обойти лимит
+        response = self.client.get(
+            self.url,
+            REMOTE_ADDR="127.0.0.1",
+            HTTP_X_FORWARDED_FOR="198.51.100.9, 203.0.113.1",
+        )
+        self.assertEqual(response.status_code, 429)
+
+        response = self.client.get(
+            self.url, REMOTE_ADDR="127.0.0.1", HTTP_X_FORWARDED_FOR="203.0.113.2"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_forwarded_for_ignored_from_untrusted_address(self):
+        for _ in range(4):
+            self.client.get(
+                self.url, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="203.0.113.1"
+            )
+        response = self.client.get(
+            self.url, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="203.0.113.2"
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_local_fallback_without_redis(self):
+        with mock.patch.object(
+            ratelimit, "_check_redis", side_effect=RedisError("down")
+        ):
+            statuses = [self.client.get(self.url).status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+
+class MediaDeletionTests(TestCase):
+    """Очередь удаления файлов и сверка хранилища с БД"""
+
+    def setUp(self):
+        self.storage = FileSystemStorage(location=tempfile.mkdtemp())
+        for name in ("pictures/old.jpg", "pictures/new.jpg", "pictures/lost.jpg"):
+            self.storage.save(name, ContentFile(b"jpg"))
+        self.storage.save("tmp/avatar.png", ContentFile(b"png"))
+        self.recipe = Recipe.objects.create(
+            author=User.objects.create_user(
+                email="author@example.com", nickname="author", password="password"
+            ),
+            category=Category.objects.create(category="Салаты"),
+            dish_name="Салат",
+            picture="pictures/old.jpg",
+            description="Описание",
+            text="<p>Шаги</p>",
+        )
+
+    def test_replaced_picture_is_deleted_by_worker(self):
+        self.recipe.picture = "pictures/new.jpg"
+        self.recipe.save()
+        self.assertTrue(self.storage.exists("pictures/old.jpg"))
+        self.assertEqual(
+            list(MediaDeletion.objects.values_list("name", flat=True)),
+            ["pictures/old.jpg"],
+        )
+
+        self.assertEqual(media.drain(storage=self.storage), 1)
+        self.assertFalse(self.storage.exists("pictures/old.jpg"))
+        self.assertFalse(MediaDeletion.objects.exists())
+
+    def test_referenced_file_is_kept(self):
+        media.enqueue(["pictures/old.jpg", "avatars/default.png"])
+        self.assertEqual(media.drain(storage=self.storage), 0)
+        self.assertTrue(self.storage.exists("pictures/old.jpg"))
+        self.assertFalse(MediaDeletion.objects.exists())
+
+    def test_sweep_removes_orphans(self):
+        no_grace = {"grace": timedelta(0), "tmp_ttl": timedelta(0)}
+        self.assertEqual(media.find_orphans(self.storage), [])
+        self.assertEqual(
+            sorted(media.find_orphans(self.storage, **no_grace)),
+            ["pictures/lost.jpg", "pictures/new.jpg", "tmp/avatar.png"],
+        )
+
+        self.assertEqual(media.sweep_orphans(self.storage, **no_grace), (3, 3))
+        self.assertTrue(self.storage.exists("pictures/old.jpg"))
+        self.assertFalse(self.storage.exists("tmp/avatar.png"))
+
+    def test_verify_ignores_client_avatar_path(self):
+        response = self.client.post(
+            reverse("verify_email", args=["new@example.com"]),
+            {"code": "000000", "avatar_path": "tmp/../pictures/old.jpg"},
+        )
+        self.assertFalse(response.json()["success"])
+        self.assertFalse(MediaDeletion.objects.exists())
+
+
+class DeduplicatedStorageTests(TestCase):
+    """Хранилище с адресацией по содержимому"""
+
+    def setUp(self):
+        self.backend = FileSystemStorage(location=tempfile.mkdtemp())
+        self.storage = DeduplicatedStorage(backend=self.backend)
+        with open(settings.BASE_DIR / "media" / "pictures" / "quiche.jpg", "rb") as f:
+            self.photo = f.read()
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save("pictures/quiche.jpg", ContentFile(self.photo))
+        second = self.storage.save("pictures/quiche_copy.jpg", ContentFile(self.photo))
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.backend.listdir("pictures")[1], [first.split("/")[1]])
+        self.assertEqual(MediaBlob.objects.get().size, len(self.photo))
+
+    def test_shared_file_lives_while_referenced(self):
+        name = self.storage.save("pictures/quiche.jpg", ContentFile(self.photo))
+        author = User.objects.create_user(
+            email="author@example.com", nickname="author", password="password"
+        )
+        category = Category.objects.create(category="Выпечка")
+        recipes = [
+            Recipe.objects.create(
+                author=author,
+                category=category,
+                dish_name="Киш",
+                picture=name,
+                description="Описание",
+                text="<p>Шаги</p>",
+            )
+            for _ in range(2)
+        ]
+
+        recipes[0].delete()
+        media.drain(storage=self.storage)
+        self.assertTrue(self.backend.exists(name))
+
+        recipes[1].delete()
+        media.drain(storage=self.storage)
+        self.assertFalse(self.backend.exists(name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_direct_delete_keeps_referenced_blob(self):
+        name = self.storage.save("avatars/quiche.jpg", ContentFile(self.photo))
+        User.objects.create_user(
+            email="cook@example.com", nickname="cook", password=None, avatar=name
+        )
+
+        self.storage.delete(name)
+        self.assertTrue(self.backend.exists(name))
+        self.assertTrue(MediaBlob.objects.filter(name=name).exists())
+
+    def test_is_default_storage(self):
+        self.assertIsInstance(default_storage, DeduplicatedStorage)
+
+    def test_recompressed_photo_is_flagged(self):
+        original = self.storage.save("pictures/quiche.jpg", ContentFile(self.photo))
+        image = Image.open(io.BytesIO(self.photo))
+        smaller = io.BytesIO()
+        image.resize((image.width // 3, image.height // 3)).save(
+            smaller, "JPEG", quality=40
+        )
+        copy = self.storage.save("pictures/small.jpg", ContentFile(smaller.getvalue()))
+
+        self.assertNotEqual(original, copy)
+        self.assertEqual(MediaBlob.objects.get(name=copy).similar_to.name, original)
+
+
+class ImageUploadHandlerTests(TestCase):
+    """Проверка загрузок на лету: размер, формат и число пикселей"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(
+            email="author@example.com", nickname="author", password="password"
+        )
+        self.client.force_login(user)
+        self.category = Category.objects.create(category="Выпечка")
+        with open(settings.BASE_DIR / "media" / "pictures" / "quiche.jpg", "rb") as f:
+            self.photo = f.read()
+
+    def post_picture(self, content, name="quiche.jpg"):
+        # Название с маленькой буквы — рецепт не сохранится даже с картинкой
+        return self.client.post(
+            reverse("create_recipe"),
+            {
+                "dish_name": "киш",
+                "category": self.category.pk,
+                "picture": SimpleUploadedFile(name, content),
+                "description": "Описание",
+                "text": "<p>Шаги</p>",
+            },
+        )
+
+    def picture_errors(self, response):
+        return response.context["form"].errors.get("picture")
+
+    def test_valid_image_passes(self):
+        self.assertIsNone(self.picture_errors(self.post_picture(self.photo)))
+
+    @override_settings(MAX_UPLOAD_SIZE=64 * 1024)
+    def test_oversized_upload_is_aborted(self):
+        response = self.post_picture(self.photo)
+        self.assertEqual(
+            self.picture_errors(response), ["Размер изображения превышает 0.0625 МБ!"]
+        )
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_not_an_image_is_rejected(self):
+        response = self.post_picture(b"<?php echo 1; ?>" * 100, name="shell.jpg")
+        self.assertEqual(self.picture_errors(response), [uploads.NOT_AN_IMAGE])
+
+    @override_settings(MAX_IMAGE_PIXELS=1000)
+    def test_too_many_pixels_is_rejected(self):
+        response = self.post_picture(self.photo)
+        self.assertEqual(self.picture_errors(response), [uploads.TOO_MANY_PIXELS])
+
+    def test_rejected_avatar_shows_reason(self):
+        avatar = uploads.RejectedUpload("me.jpg", "image/jpeg", uploads.NOT_AN_IMAGE)
+        form = SignUpForm(
+            data={"email": "new@example.com", "nickname": "new"},
+            files={"avatar": avatar},
+        )
+        self.assertEqual(form.errors["avatar"], [uploads.NOT_AN_IMAGE])
+
+
+class AdminChangelistTests(TestCase):
+    """Списки админки: число запросов не зависит от числа строк"""
+
+    def setUp(self):
+        self.client.force_login(
+            User.objects.create_superuser(
+                email="admin@example.com", nickname="admin", password="password"
+            )
+        )
+        self.category = Category.objects.create(category="Салаты")
+
+    def add_recipes(self, count):
+        start = Recipe.objects.count()
+        for i in range(start, start + count):
+            author = User.objects.create_user(
+                email=f"author{i}@example.com", nickname=f"author{i}", password="pw"
+            )
+            recipe = Recipe.objects.create(
+                author=author,
+                category=self.category,
+                dish_name=f"Салат {i}",
+                picture="pictures/salad.jpg",
+                description="Описание",
+                text="<p>Нарезать</p><p>Смешать &amp; подать</p>",
+            )
+            RecipeRating.objects.create(user=author, recipe=recipe, rating=4)
+        return recipe
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        urls = [
+            reverse("admin:app_recipe_changelist"),
+            reverse("admin:app_user_changelist"),
+            reverse("admin:app_reciperating_changelist"),
+        ]
+        self.add_recipes(2)
+        few = [self.count_queries(url) for url in urls]
+        self.add_recipes(10)
+        self.assertEqual([self.count_queries(url) for url in urls], few)
+
+    def test_text_preview_and_rating_summary(self):
+        recipe = self.add_recipes(1)
+        self.assertEqual(recipe.text_preview, "Нарезать Смешать & подать")
+
+        response = self.client.get(reverse("admin:app_recipe_change", args=[recipe.pk]))
+        self.assertContains(response, "Все оценки (1)")
+        self.assertNotContains(response, "reciperating_set-TOTAL_FORMS")
+
+
+class RatingHistogramTests(TestCase):
+    """Гистограмма оценок в строке рецепта и сверка с таблицей оценок"""
+
+    def setUp(self):
+        author, self.reader, self.other = [
+            User.objects.create_user(
+                email=f"{name}@example.com", nickname=name, password="password"
+            )
+            for name in ("author", "reader", "other")
+        ]
+        self.recipe = Recipe.objects.create(
+            author=author,
+            category=Category.objects.create(category="Салаты"),
+            dish_name="Салат",
+            picture="pictures/salad.jpg",
+            description="Описание",
+            text="<p>Шаги</p>",
+        )
+
+    def histogram(self):
+        self.recipe.refresh_from_db()
+        return [count for _, count, _ in self.recipe.rating_histogram()]
+
+    def test_create_change_delete(self):
+        rating = RecipeRating.objects.create(
+            user=self.reader, recipe=self.recipe, rating=3
+        )
+        RecipeRating.objects.create(user=self.other, recipe=self.recipe, rating=4)
+        self.assertEqual(self.histogram(), [0, 1, 1, 0, 0])
+        self.assertEqual(self.recipe.average_rating(), 3.5)
+
+        rating.rating = 5
+        rating.save()
+        self.assertEqual(self.histogram(), [1, 1, 0, 0, 0])
+        self.assertEqual(self.recipe.rating_sum, 9)
+
+        rating.delete()
+        self.assertEqual(self.histogram(), [0, 1, 0, 0, 0])
+        self.assertEqual(self.recipe.rating_count, 1)
+
+    def test_drift_is_found_and_repaired(self):
+        RecipeRating.objects.create(user=self.reader, recipe=self.recipe, rating=2)
+        self.assertEqual(ranking.find_drift(), {})
+
+        Recipe.objects.filter(pk=self.recipe.pk).update(rating_2=0, rating_5=3)
+        drift = ranking.find_drift()
+        self.assertEqual(list(drift), [self.recipe.pk])
+
+        ranking.repair_drift(drift)
+        self.assertEqual(ranking.find_drift(), {})
+        self.assertEqual(self.histogram(), [0, 0, 0, 1, 0])
+
+
+class ApiTests(TestCase):
+    """JSON API: разреженные поля, курсор и хранимые агрегаты"""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email="author@example.com", nickname="author", password="password"
+        )
+        self.category = Category.objects.create(category="Салаты")
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author,
+                category=self.category,
+                dish_name=f"Салат {i}",
+                picture="pictures/salad.jpg",
+                description="Описание",
+                text="<p>Шаги</p>",
+            )
+            for i in range(7)
+        ]
+        # Одинаковое время публикации: порядок решает id
+        Recipe.objects.update(created_at=timezone.now())
+
+    def test_cursor_walks_all_recipes_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 3, "fields": "id"}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.client.get(reverse("api_recipes"), params).json()
+            seen += [row["id"] for row in data["results"]]
+            cursor = data["next"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted((r.pk for r in self.recipes), reverse=True))
+
+    def test_sparse_fields_select_only_needed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("api_recipes"), {"fields": "id,rating", "limit": 1}
+            )
+        self.assertEqual(set(response.json()["results"][0]), {"id", "rating"})
+        select = next(q["sql"] for q in queries if '"app_recipe"' in q["sql"])
+        self.assertNotIn('"text"', select)
+        self.assertNotIn("dish_name", select)
+
+        response = self.client.get(reverse("api_recipes"), {"fields": "id,email"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("api_recipes"), {"cursor": "!!"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tampered_cursor_is_rejected(self):
+        for url, values in (
+            (reverse("api_recipes"), ["abc", "x"]),
+            (reverse("api_recipes"), [{"a": 1}, 1]),
+            (reverse("api_recipes"), [None, 1]),
+            (reverse("api_best"), ["x", "y", "z"]),
+        ):
+            cursor = api.encode_cursor(values)
+            response = self.client.get(url, {"cursor": cursor})
+            self.assertEqual(response.status_code, 400, values)
+            self.assertEqual(response.json(), {"error": "Некорректный курсор"})
+
+    def test_detail_and_profile_use_stored_aggregates(self):
+        reader = User.objects.create_user(
+            email="reader@example.com", nickname="reader", password="password"
+        )
+        recipe = self.recipes[0]
+        RecipeRating.objects.create(user=reader, recipe=recipe, rating=4)
+
+        data = self.client.get(
+            reverse("api_recipe", args=[recipe.pk]),
+            {"fields": "rating,histogram,ingredients"},
+        ).json()
+        self.assertEqual(data["rating"], 4.0)
+        self.assertEqual(data["histogram"], {"1": 0, "2": 0, "3": 0, "4": 1, "5": 0})
+        self.assertEqual(data["ingredients"], [])
+
+        data = self.client.get(reverse("api_user", args=[self.author.pk])).json()
+        self.assertEqual(data["recipe_count"], 7)
+        self.assertEqual((data["rating_count"], data["rating"]), (1, 4.0))
+        self.assertNotIn("email", data)
+
+        response = self.client.get(reverse("api_recipe", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class DatabaseRouterTests(SimpleTestCase):
+    """Чтение с реплик: GET-запросы и задачи-пересборки, но не после записи"""
+
+    def handle(self, request, actions=()):
+        """Прогон запроса через ReplicaMiddleware; возвращает базы чтения
+        до и после actions и ответ"""
+        reads = []
+
+        def get_response(request):
+            reads.append(router.db_for_read(Recipe))
+            for action in actions:
+                action()
+            reads.append(router.db_for_read(Recipe))
+            return HttpResponse()
+
+        response = db_router.ReplicaMiddleware(get_response)(request)
+        return reads, response
+
+    def test_get_reads_replica_until_first_write(self):
+        factory = RequestFactory()
+        reads, response = self.handle(factory.get("/best/"))
+        self.assertEqual(reads, ["replica", "replica"])
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+
+        reads, response = self.handle(
+            factory.get("/best/"), [lambda: router.db_for_write(Recipe)]
+        )
+        self.assertEqual(reads, ["replica", "default"])
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+    def test_post_and_pinned_client_read_primary(self):
+        factory = RequestFactory()
+        reads, response = self.handle(factory.post("/recipe/1/rate/"))
+        self.assertEqual(reads, ["default", "default"])
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+
+        request = factory.get("/recipe/1/")
+        request.COOKIES[db_router.PIN_COOKIE] = "1"
+        self.assertEqual(self.handle(request)[0], ["default", "default"])
+
+        # Вне запроса (команды, shell) — основная база
+        self.assertEqual(router.db_for_read(Recipe), "default")
+
+    def test_sessions_and_request_user_read_primary(self):
+        reads = []
+
+        def get_response(request):
+            reads.extend(router.db_for_read(model) for model in (Session, User, Recipe))
+            return HttpResponse()
+
+        request = RequestFactory().options("/recipe/1/")
+        db_router.ReplicaMiddleware(get_response)(request)
+        self.assertEqual(reads, ["default", "default", "replica"])
+
+    def test_tasks_are_routed_by_workload(self):
+        for task, expected in (
+            (tasks.rebuild_trending, "replica"),
+            (tasks.send_daily_digests, "default"),
+        ):
+            task_prerun.send(sender=task, task_id="1", task=task)
+            self.assertEqual(router.db_for_read(Recipe), expected)
+            with mock.patch.object(connections["default"], "in_atomic_block", True):
+                self.assertEqual(router.db_for_read(Recipe), "default")
+            task_postrun.send(sender=task, task_id="1", task=task)
+            self.assertEqual(router.db_for_read(Recipe), "default")
+
+
+class TaskQueueTests(TestCase):
+    """Маршруты задач Celery по очередям и метрики выполнения"""
+
+    def setUp(self):
+        get_redis_connection("default").delete(task_metrics.STATS_KEY)
+
+    def test_tasks_are_routed_by_workload(self):
+        router = celery_app.amqp.router
+        for task, queue in (
+            ("app.tasks.send_daily_digests", "email"),
+            ("app.tasks.rebuild_similar_recipes", "heavy"),
+            ("app.tasks.drain_media_deletions", "maintenance"),
+        ):
+            self.assertEqual(router.route({}, task)["queue"].name, queue)
+        self.assertTrue(tasks.rebuild_trending.acks_late)
+        self.assertFalse(tasks.send_daily_digests.acks_late)
+        self.assertTrue(tasks.send_daily_digests.ignore_result)
+
+    def test_duration_and_state_are_recorded(self):
+        tasks.drain_media_deletions.apply()
+        stats, _ = task_metrics.task_stats()
+        stats = stats["app.tasks.drain_media_deletions"]
+        self.assertEqual(stats["count"], 1)
+        self.assertEqual(stats["state:SUCCESS"], 1)
+        self.assertEqual(stats["le:600"], 1)
+
+    def test_undeclared_queues_are_empty(self):
+        with mock.patch.object(
+            celery_app, "connection_for_read", return_value=Connection("memory://")
+        ):
+            lengths = task_metrics.queue_lengths()
+        self.assertEqual(lengths, dict.fromkeys(task_metrics.queue_names(), 0))
+
+
+class NotificationDigestTests(TestCase):
+    """Сверка порогов уведомлений и ежедневные сводки авторам"""
+
+    def setUp(self):
+        self.author, self.reader = [
+            User.objects.create_user(
+                email=f"{name}@example.com", nickname=name, password="password"
+            )
+            for name in ("author", "reader")
+        ]
+        category = Category.objects.create(category="Салаты")
+        self.top, self.saved, self.plain = [
+            Recipe.objects.create(
+                author=self.author,
+                category=category,
+                dish_name=name,
+                picture="pictures/salad.jpg",
+                description="Описание",
+                text="<p>Шаги</p>",
+            )
+            for name in ("Топ", "Сохраненный", "Обычный")
+        ]
+        Recipe.objects.filter(pk=self.top.pk).update(rating_count=10, rating_sum=48)
+        Recipe.objects.filter(pk=self.plain.pk).update(rating_count=10, rating_sum=47)
+        Favorite.objects.create(user=self.reader, recipe=self.saved)
+
+    @mock.patch("app.notifications.SAVED_THRESHOLD", 0)
+    def test_candidates_are_found_in_grouped_queries(self):
+        with self.assertNumQueries(2):
+            saved = notifications.pending_saved()
+            top = notifications.pending_top_rated()
+        self.assertEqual((saved, top), ([self.saved.pk], [self.top.pk]))
+
+    def test_milestone_is_recorded_once(self):
+        self.assertEqual(notifications.reconcile(), (0, 1))
+        self.assertEqual(notifications.reconcile(), (0, 0))
+        self.assertEqual(DigestEvent.objects.get().recipe, self.top)
+
+    def test_one_digest_per_author_per_day(self):
+        notifications.reconcile()
+        RecipeRating.objects.create(user=self.reader, recipe=self.plain, rating=5)
+        yesterday = timezone.localdate() - timedelta(days=1)
+        start, _ = digest.digest_window(yesterday)
+        Favorite.objects.update(created_at=start)
+        RecipeRating.objects.update(updated_at=start)
+        DigestEvent.objects.update(created_at=start)
+
+        with self.assertNumQueries(7):
+            self.assertEqual(digest.send_digests(yesterday), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        body = mail.outbox[0].body
+        for text in ("Топ", "Попадание в топ", "Сохраненный", "Новых оценок: 1"):
+            self.assertIn(text, body)
+        self.assertFalse(DigestEvent.objects.exists())
+
+        # Повторный запуск за тот же день писем не дублирует
+        self.assertEqual(digest.send_digests(yesterday), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class MetricsTests(TestCase):
+    """Метрики Prometheus: маршруты, кэш, задачи и письма"""
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_latency_and_queries_by_view(self):
+        before = self.sample(
+            "cookbook_request_seconds_count", view="api_best", status="200"
+        )
+        self.client.get(reverse("api_best"))
+        self.assertEqual(
+            self.sample(
+                "cookbook_request_seconds_count", view="api_best", status="200"
+            ),
+            before + 1,
+        )
+        self.assertGreater(
+            self.sample("cookbook_request_db_queries_sum", view="api_best"), 0
+        )
+
+    def test_cache_reads_by_prefix(self):
+        def count(result):
+            return self.sample(
+                "cookbook_cache_requests_total", prefix="metrics", result=result
+            )
+
+        hits, misses = count("hit"), count("miss")
+        cache.set("metrics:a", 1)
+        self.assertEqual(cache.get("metrics:a"), 1)
+        self.assertIsNone(cache.get("metrics:b"))
+        self.assertEqual(cache.get_many(["metrics:a", "metrics:b"]), {"metrics:a": 1})
+        self.assertEqual((count("hit"), count("miss")), (hits + 2, misses + 2))
+
+    def test_published_tasks_and_emails_are_counted(self):
+        def sent(task):
+            return (
+                metrics.celery_registry.get_sample_value(
+                    "cookbook_celery_tasks_sent_total", {"task": task, "queue": "email"}
+                )
+                or 0
+            )
+
+        name = "app.tasks.send_daily_digests"
+        before = sent(name)
+        after_task_publish.send(sender=name, routing_key="email", headers={})
+        # Счетчик общий для процессов: он в хэше Redis, а не в памяти
+        self.assertEqual(sent(name), before + 1)
+        self.assertEqual(task_metrics.task_stats()[0][name]["sent:email"], before + 1)
+
+        failed = self.sample("cookbook_emails_failed_total", kind="digest")
+        with self.assertRaises(OSError), metrics.count_emails("digest", 3):
+            raise OSError("SMTP недоступен")
+        self.assertEqual(
+            self.sample("cookbook_emails_failed_total", kind="digest"), failed + 3
+        )
+
+    @mock.patch("app.metrics.queue_lengths", return_value={"email": 2})
+    def test_endpoint_exposes_all_metrics(self, queue_lengths):
+        tasks.drain_media_deletions.apply()
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        for line in (
+            "# TYPE cookbook_request_seconds histogram",
+            'cookbook_celery_queue_length{queue="email"} 2.0',
+            'cookbook_celery_task_seconds_bucket{le="+Inf",'
+            'task="app.tasks.drain_media_deletions"}',
+        ):
+            self.assertIn(line, body)
+
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, 403)
+        # Внешний запрос через nginx приходит с 127.0.0.1
+        response = self.client.get(
+            reverse("metrics"),
+            REMOTE_ADDR="127.0.0.1",
+            HTTP_X_FORWARDED_FOR="203.0.113.7",
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class ProfilingTests(TestCase):
+    """Профили запросов и задач по требованию"""
+
+    def setUp(self):
+        get_redis_connection("default").delete(profiling.PROFILES_KEY)
+        self.staff = User.objects.create_superuser(
+            email="admin@example.com", nickname="admin", password="password"
+        )
+
+    def test_profiler_records_hot_functions_and_queries(self):
+        def busy_loop():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+
+        profiler = profiling.Profiler("test", "busy", interval=0.001)
+        profiler.start()
+        busy_loop()
+        User.objects.count()
+        report = profiler.stop()
+        self.assertGreater(report["samples"], 0)
+        self.assertTrue(report["functions"][0]["function"].startswith("busy_loop "))
+        self.assertEqual(report["query_count"], 1)
+        self.assertIn("COUNT(*)", report["queries"][0]["sql"])
+
+    def test_only_staff_can_flag_request(self):
+        response = self.client.get(reverse("api_best"), {"_profile": 1})
+        self.assertNotIn(profiling.ID_HEADER, response)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("api_best"), HTTP_X_PROFILE="1")
+        [report] = profiling.recent()
+        self.assertEqual(response[profiling.ID_HEADER], report["id"])
+        self.assertEqual((report["name"], report["status"]), ("api_best", 200))
+
+    @override_settings(PROFILED_TASKS=["app.tasks.drain_media_deletions"])
+    def test_selected_tasks_are_profiled(self):
+        tasks.drain_media_deletions.apply()
+        tasks.flush_recipe_views.apply()
+        [report] = profiling.recent()
+        self.assertEqual(
+            (report["kind"], report["name"], report["state"]),
+            ("task", "app.tasks.drain_media_deletions", "SUCCESS"),
+        )
+
+    def test_profile_url_command(self):
+        out = io.StringIO()
+        call_command("profile_url", "/api/recipes/", "--repeat", "2", stdout=out)
+        self.assertIn("url api_recipes", out.getvalue())
+        self.assertIn("запрос", out.getvalue())
+
+
+class StartupTests(SimpleTestCase):
+    """Время запуска: отчет по импортам, ленивые модули и прогрев"""
+
+    def test_importtime_tree_and_package_costs(self):
+        output = "\n".join(
+            [
+                "import time: self [us] | cumulative | imported package",
+                "import time:       200 |        200 |     numpy.core",
+                "import time:       100 |        300 |   numpy",
+                "import time:        50 |        350 | app.ingredients",
+                "import time:        30 |         30 | django",
+            ]
+        )
+        roots = startup.parse_importtime(output)
+        self.assertEqual(
+            [node["name"] for node in roots], ["app.ingredients", "django"]
+        )
+        self.assertEqual(roots[0]["children"][0]["children"][0]["name"], "numpy.core")
+        package, seconds, chain = startup.package_costs(roots)[0]
+        self.assertEqual((package, chain), ("numpy", ["app.ingredients"]))
+        self.assertAlmostEqual(seconds, 0.0003)
+
+    def test_heavy_modules_are_not_imported_at_startup(self):
+        report = startup.import_report()
+        importers = {package: chain for package, _, chain in report["packages"]}
+        for package in ("numpy", "boto3"):
+            chain = importers.get(package, [])
+            self.assertFalse([name for name in chain if name.startswith("app.")])
+        self.assertGreater(report["import_seconds"], 0)
+
+    def test_s3_storage_is_not_imported_at_startup(self):
+        code = (
+            f"{startup.STARTUP_CODE}; import sys; "
+            "from django.conf import settings; "
+            "from django.core.files.storage import default_storage; "
+            "default_storage._setup(); "
+            "print(settings.MEDIA_BACKEND_STORAGE, type(default_storage._wrapped)); "
+            "print(sorted(set(sys.modules) & {'Django_CookBook.s3_storage', 'boto3'}))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "AWS_S3_ACCESS_KEY_ID": "key"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        backend, loaded = result.stdout.splitlines()
+        self.assertEqual(
+            backend,
+            "Django_CookBook.s3_storage.MediaStorage "
+            "<class 'app.storage.DeduplicatedStorage'>",
+        )
+        self.assertEqual(loaded, "[]")
+
+    def test_storage_backend_is_created_on_first_use(self):
+        storage = DeduplicatedStorage(
+            backend="django.core.files.storage.InMemoryStorage"
+        )
+        self.assertNotIn("backend", storage.__dict__)
+        self.assertFalse(storage.exists("pictures/missing.jpg"))
+        self.assertIn("backend", storage.__dict__)
+
+    def test_warm_up_compiles_project_templates(self):
+        from django.template import engines
+
+        startup.warm_up()
+        loader = engines["django"].engine.template_loaders[0]
+        self.assertIn("best.html", loader.get_template_cache)
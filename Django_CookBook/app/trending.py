@@ -0,0 +1,173 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .models import Category, Favorite, Recipe, RecipeRating
+
+logger = logging.getLogger(__name__)
+
+# Популярность рецепта — сумма весов событий с экспоненциальным затуханием:
+# событие, случившееся HALF_LIFE секунд назад, весит вдвое меньше свежего.
+# Затухание хранится в "прямой" форме: вклад события умножается на
+# 2 ** ((t - epoch) / HALF_LIFE), поэтому старые очки не нужно пересчитывать,
+# а порядок в sorted set совпадает с порядком по затухшим очкам
+HALF_LIFE = 24 * 3600  # 1 сутки
+WINDOW = 7 * 24 * 3600  # События старше недели не учитываются
+FEED_SIZE = 500  # Сколько рецептов хранится в каждой ленте
+
+VIEW_WEIGHT = 0.1
+FAVORITE_WEIGHT = 3.0
+
+
+def rating_weight(rating):
+    """Вес оценки: 5⭐ поднимает рецепт, 1⭐ — опускает"""
+    return rating - 3
+
+
+# Ключи Redis: общая лента, ленты по категориям и отдельная
+# составляющая просмотров (просмотры не восстановить из БД при пересборке)
+EPOCH_KEY = "trending:epoch"
+FEED_KEY = "trending:{}"
+VIEWS_KEY = "trending:views:{}"
+ALL = "all"
+
+# Атомарное начисление очков за одно событие во все переданные ленты
+_INCREMENT_SCRIPT = """
+local epoch = redis.call('GET', KEYS[1])
+if not epoch then
+    epoch = ARGV[1]
+    redis.call('SET', KEYS[1], epoch)
+end
+local score = ARGV[3] * math.pow(2, (ARGV[1] - tonumber(epoch)) / ARGV[2])
+for i = 2, #KEYS do
+    redis.call('ZINCRBY', KEYS[i], score, ARGV[4])
+end
+return tostring(score)
+"""
+_increment = None
+
+
+def _script(redis):
+    global _increment
+    if _increment is None:
+        _increment = redis.register_script(_INCREMENT_SCRIPT)
+    return _increment
+
+
+def _feeds(category_id, pattern=FEED_KEY):
+    return [pattern.format(ALL), pattern.format(category_id)]
+
+
+def record_event(recipe_id, category_id, weight, timestamp=None):
+    """Начисление очков рецепту за событие (сохранение, оценка).
+    Ошибки Redis не должны ломать запрос — ленту поправит пересборка"""
+    timestamp = time.time() if timestamp is None else timestamp
+    try:
+        redis = get_redis_connection("default")
+        _script(redis)(
+            keys=[EPOCH_KEY, *_feeds(category_id)],
+            args=[timestamp, HALF_LIFE, weight, recipe_id],
+        )
+    except RedisError as e:
+        logger.warning(f"Не удалось обновить тренды для рецепта {recipe_id}: {e}")
+
+
+def record_views(views):
+    """Начисление очков за просмотры пачкой: views — список
+    (recipe_id, category_id, количество) за интервал сброса счетчиков"""
+    now = time.time()
+    try:
+        redis = get_redis_connection("default")
+        script = _script(redis)
+        pipe = redis.pipeline(transaction=False)
+        for recipe_id, category_id, count in views:
+            script(
+                keys=[
+                    EPOCH_KEY,
+                    *_feeds(category_id),
+                    *_feeds(category_id, VIEWS_KEY),
+                ],
+                args=[now, HALF_LIFE, count * VIEW_WEIGHT, recipe_id],
+                client=pipe,
+            )
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Не удалось учесть просмотры в трендах: {e}")
+
+
+def trending_ids(category_id=None, limit=50):
+    """Id рецептов ленты по убыванию популярности — один ZREVRANGE"""
+    key = FEED_KEY.format(category_id or ALL)
+    try:
+        ids = get_redis_connection("default").zrevrange(key, 0, limit - 1)
+    except RedisError as e:
+        logger.warning(f"Лента трендов недоступна: {e}")
+        return []
+    return [int(pk) for pk in ids]
+
+
+def trending_recipes(category_id=None, limit=50):
+    """Рецепты ленты в порядке популярности со средним рейтингом"""
+    ids = trending_ids(category_id, limit)
+    recipes = Recipe.objects.filter(pk__in=ids)
+    by_id = {recipe.pk: recipe for recipe in recipes}
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+
+def rebuild_trending():
+    """Полная пересборка лент из БД за последние WINDOW секунд.
+    Сохранения и оценки пересчитываются заново, составляющая просмотров
+    переносится на новую эпоху. Возвращает число рецептов в общей ленте"""
+    redis = get_redis_connection("default")
+    now = time.time()
+    since = now - WINDOW
+    since_dt = datetime.fromtimestamp(since, tz=timezone.utc)
+    epoch = since  # Степени двойки остаются небольшими
+
+    scores = defaultdict(lambda: defaultdict(float))
+
+    def add(recipe_id, category_id, weight, timestamp):
+        score = weight * 2 ** ((timestamp - epoch) / HALF_LIFE)
+        scores[ALL][recipe_id] += score
+        scores[category_id][recipe_id] += score
+
+    favorites = Favorite.objects.filter(created_at__gte=since_dt).values_list(
+        "recipe_id", "recipe__category_id", "created_at"
+    )
+    for recipe_id, category_id, created_at in favorites.iterator(chunk_size=5000):
+        add(recipe_id, category_id, FAVORITE_WEIGHT, created_at.timestamp())
+
+    ratings = RecipeRating.objects.filter(updated_at__gte=since_dt).values_list(
+        "recipe_id", "recipe__category_id", "rating", "updated_at"
+    )
+    for recipe_id, category_id, rating, updated_at in ratings.iterator(chunk_size=5000):
+        add(recipe_id, category_id, rating_weight(rating), updated_at.timestamp())
+
+    # Просмотры, накопленные в старой эпохе, пересчитываются в новую
+    old_epoch = redis.get(EPOCH_KEY)
+    factor = 2 ** ((float(old_epoch) - epoch) / HALF_LIFE) if old_epoch else 0.0
+    # Просмотры старше окна отбрасываются
+    min_views = VIEW_WEIGHT * 2 ** ((since - epoch) / HALF_LIFE)
+
+    feeds = [ALL, *Category.objects.values_list("id", flat=True)]
+    pipe = redis.pipeline()  # MULTI/EXEC: лента подменяется атомарно
+    for feed in feeds:
+        key, views_key = FEED_KEY.format(feed), VIEWS_KEY.format(feed)
+        tmp_key = f"{key}:rebuild"
+        pipe.delete(tmp_key)
+        if scores[feed]:
+            pipe.zadd(tmp_key, dict(scores[feed]))
+        pipe.zunionstore(views_key, {views_key: factor})
+        pipe.zremrangebyscore(views_key, "-inf", f"({min_views}")
+        pipe.zunionstore(key, {tmp_key: 1, views_key: 1})
+        pipe.zremrangebyscore(key, "-inf", 0)  # Непопулярные выпадают из ленты
+        pipe.zremrangebyrank(key, 0, -FEED_SIZE - 1)
+        pipe.delete(tmp_key)
+    pipe.set(EPOCH_KEY, epoch)
+    pipe.execute()
+
+    return len(scores[ALL])
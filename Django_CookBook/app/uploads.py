@@ -0,0 +1,151 @@
+import io
+import logging
+import time
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Проверка загружаемых изображений на лету, пока файл еще принимается.
+# Обработчик стоит первым в FILE_UPLOAD_HANDLERS и пропускает чанки дальше
+# (в память или во временный файл), считая байты:
+# - при превышении MAX_UPLOAD_SIZE прием запроса обрывается, остаток тела
+#   не читается;
+# - по первым килобайтам Pillow определяет формат и размеры без
+#   декодирования пикселей; чужой формат или слишком много пикселей
+#   (decompression bomb) — файл отклоняется, дальше чанки не передаются.
+# Отклоненный файл заменяется пустым RejectedUpload с причиной — ее
+# показывает поле формы (см. forms.UploadImageField); файлы оборванного
+# запроса форма получает через request_files().
+# Размер и время приема — метрики Prometheus (app/metrics.py)
+# Пределы переопределяются в settings.MAX_UPLOAD_SIZE и MAX_IMAGE_PIXELS
+MAX_UPLOAD_SIZE = 1024 * 1024
+MAX_IMAGE_PIXELS = 25_000_000
+HEADER_LIMIT = 128 * 1024  # Заголовок JPEG с EXIF-миниатюрой бывает длинным
+FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+
+TOO_LARGE = "Размер изображения превышает {} МБ!"
+NOT_AN_IMAGE = "Загрузите изображение в формате JPEG, PNG, WEBP или GIF."
+TOO_MANY_PIXELS = "Слишком большое разрешение изображения."
+
+
+class RejectedUpload(UploadedFile):
+    """Пустой файл вместо отклоненного; upload_error — причина"""
+
+    def __init__(self, name, content_type, upload_error):
+        super().__init__(io.BytesIO(), name, content_type, 0)
+        self.upload_error = upload_error
+
+
+def request_files(request):
+    """request.FILES вместе с RejectedUpload для оборванных загрузок"""
+    aborted = getattr(request, "aborted_uploads", None)
+    if not aborted:
+        return request.FILES
+    files = request.FILES.copy()
+    for field_name, upload in aborted.items():
+        files[field_name] = upload
+    return files
+
+
+def sniff_image(header):
+    """(формат, ширина, высота) по началу файла или None, если заголовка
+    не хватает или это не изображение. Пиксели не декодируются"""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(header)) as image:
+            return image.format, image.width, image.height
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        return None
+
+
+def record_upload(size, seconds, rejected=None):
+    """Метрики приема загрузок: размер, секунды и отказы по причинам"""
+    metrics.UPLOAD_BYTES.observe(size)
+    metrics.UPLOAD_SECONDS.observe(seconds)
+    if rejected:
+        metrics.UPLOADS_REJECTED.labels(rejected).inc()
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Ранний отказ для слишком больших и подозрительных изображений"""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.started = time.monotonic()
+        self.received = 0
+        self.header = b""
+        self.checked = False
+        self.error = None
+        self.max_size = getattr(settings, "MAX_UPLOAD_SIZE", MAX_UPLOAD_SIZE)
+        self.max_pixels = getattr(settings, "MAX_IMAGE_PIXELS", MAX_IMAGE_PIXELS)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error:
+            return None
+        self.received += len(raw_data)
+
+        if self.received > self.max_size:
+            message = TOO_LARGE.format(f"{self.max_size / (1024 * 1024):g}")
+            self.reject("too_large", message)
+            # Файлы оборванного запроса не попадут в request.FILES
+            if not hasattr(self.request, "aborted_uploads"):
+                self.request.aborted_uploads = {}
+            self.request.aborted_uploads[self.field_name] = RejectedUpload(
+                self.file_name, self.content_type, message
+            )
+            raise StopUpload(connection_reset=True)
+
+        if not self.checked:
+            self.header += raw_data
+            self.check_header(final=False)
+            if self.error:
+                return None
+        return raw_data
+
+    def check_header(self, final):
+        from PIL import Image
+
+        try:
+            sniffed = sniff_image(self.header)
+        except Image.DecompressionBombError:
+            self.checked = True
+            self.reject("pixels", TOO_MANY_PIXELS)
+            return
+        if sniffed is None:
+            if final or len(self.header) >= HEADER_LIMIT:
+                self.reject("not_image", NOT_AN_IMAGE)
+            return
+        self.checked = True
+        self.header = b""
+        image_format, width, height = sniffed
+        if width * height > self.max_pixels:
+            self.reject("pixels", TOO_MANY_PIXELS)
+        elif image_format not in FORMATS:
+            self.reject("format", NOT_AN_IMAGE)
+
+    def reject(self, reason, message):
+        self.error = message
+        seconds = time.monotonic() - self.started
+        record_upload(self.received, seconds, rejected=reason)
+        logger.info(f"Загрузка {self.file_name} отклонена ({reason})")
+
+    def file_complete(self, file_size):
+        if not self.error and not self.checked:
+            self.check_header(final=True)  # Файл короче одного чанка
+        if self.error:
+            # Остальные обработчики получили только часть файла
+            return RejectedUpload(self.file_name, self.content_type, self.error)
+
+        seconds = time.monotonic() - self.started
+        record_upload(self.received, seconds)
+        logger.debug(
+            f"Принят файл {self.file_name}: {self.received} байт"
+            f" за {seconds:.3f} с ({self.received / max(seconds, 1e-6) / 1024:.0f} КБ/с)"
+        )
+        return None  # Файл соберет следующий обработчик
@@ -2,8 +2,10 @@ from django.contrib.auth.views import LoginView, LogoutView
 from django.urls import path
 from django.views.generic import TemplateView
 
+from . import api, metrics
 from .views import (
     BestRecipes,
+    TrendingRecipes,
     SearchRecipe,
     CreateRecipe,
     UpdateRecipe,
@@ -24,12 +26,13 @@ from .views import (
     delete_account,
     check_nickname,
     check_email,
+    autocomplete_view,
 )
 
-
 urlpatterns = [
     path("", TemplateView.as_view(template_name="main.html"), name="main"),
     path("best/", BestRecipes.as_view(), name="best"),
+    path("trending/", TrendingRecipes.as_view(), name="trending"),
     path("recipe/<int:pk>/", recipe, name="recipe_detail"),
     path("recipe/<int:pk>/rate/", rate_recipe, name="rate_recipe"),
     path("recipe/<int:pk>/toggle/", add_to_favorites, name="add_to_favorites"),
@@ -72,9 +75,17 @@ urlpatterns = [
     path("verify_email/<str:email>/", VerifyEmailView.as_view(), name="verify_email"),
     path("ajax/check-nickname/", check_nickname, name="check_nickname"),
     path("ajax/check-email/", check_email, name="check_email"),
+    path("ajax/autocomplete/", autocomplete_view, name="autocomplete"),
     path(
         "verify_email/<str:email>/resend/", ResendCodeView.as_view(), name="resend_code"
     ),
+    # JSON API только для чтения
+    path("api/recipes/", api.recipe_list, name="api_recipes"),
+    path("api/recipes/best/", api.best_list, name="api_best"),
+    path("api/recipes/<int:pk>/", api.recipe_detail, name="api_recipe"),
+    path("api/users/<int:pk>/", api.user_detail, name="api_user"),
+    # Метрики Prometheus
+    path("metrics", metrics.metrics_view, name="metrics"),
     # Сброс пароля
     path("password_reset", CustomPasswordResetView.as_view(), name="password_reset"),
     path(
@@ -0,0 +1,137 @@
+import logging
+
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from .models import Favorite, RecipeRating
+
+logger = logging.getLogger(__name__)
+
+# Состояние пользователя по рецептам в Redis: set id сохраненных рецептов
+# и hash recipe_id → оценка. Ключи заполняются из БД при первом обращении
+# и дальше обновляются сквозной записью из представлений сохранения и оценки.
+# Служебный элемент LOADED отличает пустое состояние от незагруженного;
+# TTL ограничивает устаревание при правках в обход представлений (админка)
+FAVORITES_KEY = "user:{}:favorites"
+RATINGS_KEY = "user:{}:ratings"
+LOADED = "-"
+TTL = 24 * 3600
+
+# Запись только в уже загруженное состояние: иначе частично заполненный
+# ключ выглядел бы загруженным
+_WRITE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if ARGV[1] == 'sadd' then
+    redis.call('SADD', KEYS[1], ARGV[2])
+elseif ARGV[1] == 'srem' then
+    redis.call('SREM', KEYS[1], ARGV[2])
+else
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+end
+return 1
+"""
+_write = None
+
+
+def _keys(user_id):
+    return FAVORITES_KEY.format(user_id), RATINGS_KEY.format(user_id)
+
+
+def _write_through(key, *args):
+    global _write
+    try:
+        redis = get_redis_connection("default")
+        if _write is None:
+            _write = redis.register_script(_WRITE_SCRIPT)
+        _write(keys=[key], args=args)
+    except RedisError as e:
+        # Ключ удаляется, чтобы следующее чтение перезагрузило состояние из БД
+        logger.warning(f"Не удалось обновить состояние {key}: {e}")
+        try:
+            get_redis_connection("default").delete(key)
+        except RedisError:
+            pass
+
+
+def set_favorite(user_id, recipe_id, is_favorite):
+    _write_through(
+        FAVORITES_KEY.format(user_id), "sadd" if is_favorite else "srem", recipe_id
+    )
+
+
+def set_rating(user_id, recipe_id, rating):
+    _write_through(RATINGS_KEY.format(user_id), "hset", recipe_id, rating)
+
+
+def _from_db(user_id, recipe_ids=None):
+    favorites = Favorite.objects.filter(user_id=user_id)
+    ratings = RecipeRating.objects.filter(user_id=user_id)
+    if recipe_ids is not None:
+        favorites = favorites.filter(recipe_id__in=recipe_ids)
+        ratings = ratings.filter(recipe_id__in=recipe_ids)
+    return (
+        set(favorites.values_list("recipe_id", flat=True)),
+        dict(ratings.values_list("recipe_id", "rating")),
+    )
+
+
+def _load(redis, user_id):
+    """Полная загрузка состояния пользователя из БД (MULTI/EXEC)"""
+    favorites, ratings = _from_db(user_id)
+    favorites_key, ratings_key = _keys(user_id)
+    pipe = redis.pipeline()
+    pipe.delete(favorites_key, ratings_key)
+    pipe.sadd(favorites_key, LOADED, *favorites)
+    pipe.hset(ratings_key, mapping={LOADED: 0, **ratings})
+    pipe.expire(favorites_key, TTL)
+    pipe.expire(ratings_key, TTL)
+    pipe.execute()
+    return favorites, ratings
+
+
+def user_state(user, recipe_ids):
+    """Состояние пользователя для пачки рецептов одним round-trip:
+    {recipe_id: {"is_favorite": bool, "user_rating": int | None}}"""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids or not user.is_authenticated:
+        return {pk: {"is_favorite": False, "user_rating": None} for pk in recipe_ids}
+
+    favorites_key, ratings_key = _keys(user.pk)
+    try:
+        redis = get_redis_connection("default")
+        pipe = redis.pipeline(transaction=False)
+        pipe.exists(favorites_key, ratings_key)
+        pipe.smismember(favorites_key, recipe_ids)
+        pipe.hmget(ratings_key, recipe_ids)
+        loaded, saved, ratings = pipe.execute()
+
+        if loaded == 2:
+            return {
+                pk: {
+                    "is_favorite": bool(is_saved),
+                    "user_rating": int(rating) if rating is not None else None,
+                }
+                for pk, is_saved, rating in zip(recipe_ids, saved, ratings)
+            }
+        favorites, all_ratings = _load(redis, user.pk)
+    except RedisError as e:
+        logger.warning(f"Состояние пользователя {user.pk} недоступно: {e}")
+        favorites, all_ratings = _from_db(user.pk, recipe_ids)
+
+    return {
+        pk: {"is_favorite": pk in favorites, "user_rating": all_ratings.get(pk)}
+        for pk in recipe_ids
+    }
+
+
+def annotate_recipes(user, recipes):
+    """Отметки "сохранено" и "ваша оценка" для карточек страницы:
+    атрибуты is_favorite и user_rating у каждого рецепта"""
+    recipes = list(recipes)
+    states = user_state(user, [recipe.pk for recipe in recipes])
+    for recipe in recipes:
+        recipe.is_favorite = states[recipe.pk]["is_favorite"]
+        recipe.user_rating = states[recipe.pk]["user_rating"]
+    return recipes
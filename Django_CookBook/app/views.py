@@ -1,6 +1,6 @@
 from django.contrib.auth.views import PasswordResetView, PasswordResetConfirmView
 from django.shortcuts import redirect
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.core.cache import cache
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
@@ -8,8 +8,36 @@ from django.core.mail import send_mail
 from django.core.exceptions import PermissionDenied
 
 
-from .models import Recipe, User, Category, RecipeRating, Favorite
+from .models import Recipe, User, Category, RecipeRating, Favorite, SimilarRecipe
 from .forms import RecipeForm, SignUpForm
+from .accounts import deactivate
+from .autocomplete import suggest
+from .conditional import (
+    CATALOG,
+    CATEGORIES,
+    SIMILAR,
+    TRENDING,
+    ConditionalGetMixin,
+    author_scope,
+    conditional_page,
+    recipe_scope,
+)
+from .facets import category_facets
+from .fuzzy import fuzzy_recipe_ids
+from .ingredients import (
+    category_counts,
+    ingredient_counts,
+    match_recipes,
+    newest,
+    within,
+)
+from .media import enqueue as enqueue_media
+from .metrics import count_emails
+from .ratelimit import rate_limit
+from .stats import track_view
+from .trending import trending_recipes
+from .uploads import request_files
+from .user_state import annotate_recipes, set_favorite, set_rating, user_state
 from django.shortcuts import render, get_object_or_404
 from django.views import View
 from django.views.generic import (
@@ -19,14 +47,32 @@ from django.views.generic import (
     UpdateView,
     DeleteView,
 )
-from django.db.models import Avg, Count, Q
+from django.db.models import (
+    Case,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    IntegerField,
+    Q,
+    When,
+)
+from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
+from django.utils.decorators import method_decorator
 from django.contrib import messages
 from django.http import JsonResponse
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 
 
-class BestRecipes(ListView):
+def best_recipes():
+    """Рецепты со средней оценкой от 4.7 по убыванию взвешенного рейтинга"""
+    # Отбор по хранимым агрегатам, без GROUP BY по оценкам
+    return Recipe.objects.filter(
+        rating_count__gt=0, rating_sum__gte=F("rating_count") * 4.7
+    ).order_by("-bayesian_rating", "-created_at")
+
+
+class BestRecipes(ConditionalGetMixin, ListView):
     """Страница с лучшими рецептами"""
 
     model = Recipe
@@ -36,18 +82,17 @@ class BestRecipes(ListView):
 
     def get_queryset(self):
         """Фильтрация рецептов с рейтингом > 4.7
-        Сортировка по убыванию; возможность фильтрации по категориям"""
-
-        # Базовый queryset с аннотациями среднего рейтинга и количества оценок
-        queryset = (
-            super()
-            .get_queryset()
-            .annotate(
-                average_rating=Avg("ratings__rating"), rating_count=Count("ratings")
+        Сортировка по убыванию взвешенного рейтинга;
+        возможность фильтрации по категориям"""
+
+        # Средняя оценка для шаблона — тоже из хранимых агрегатов
+        queryset = best_recipes().annotate(
+            average_rating=ExpressionWrapper(
+                F("rating_sum") * 1.0 / F("rating_count"),
+                output_field=FloatField(),
             )
-            .filter(average_rating__gte=4.7)
-            .order_by("-created_at")
         )
+        self.unfiltered_queryset = queryset  # Для счетчиков по категориям
 
         # Фильтрацию по категориям через GET-запрос
         category_id = self.request.GET.get("category")
@@ -56,14 +101,107 @@ class BestRecipes(ListView):
 
         return queryset
 
+    def get_context_data(self, **kwargs):
+        """Добавление всех категорий с количеством рецептов в контекст для фильтрации"""
+        context = super().get_context_data(**kwargs)
+        context["categories"] = category_facets(self.unfiltered_queryset, "best")
+        annotate_recipes(self.request.user, context["recipes"])
+        return context
+
+
+class TrendingRecipes(ConditionalGetMixin, ListView):
+    """Страница с набирающими популярность рецептами;
+    лента хранится в Redis и читается одним ZREVRANGE"""
+
+    template_name = "trending.html"
+    context_object_name = "recipes"
+    paginate_by = 10
+
+    def get_etag_scopes(self):
+        return [CATALOG, TRENDING]
+
+    def get_queryset(self):
+        """Рецепты ленты (общей или выбранной категории) по убыванию популярности"""
+        return trending_recipes(self.request.GET.get("category"))
+
     def get_context_data(self, **kwargs):
         """Добавление всех категорий в контекст для фильтрации"""
         context = super().get_context_data(**kwargs)
         context["categories"] = Category.objects.all()
+        annotate_recipes(self.request.user, context["recipes"])
         return context
 
 
-class SearchRecipe(ListView):
+def search_matches(query, fuzzy=False, ingredient_ids=(), match_any=False):
+    """Совпадения поиска до ограничения выдачи: (queryset по запросу, был ли
+    поиск нечетким, RoaringBitmap id рецептов по ингредиентам или None)"""
+    queryset = Recipe.objects.all().order_by("-created_at")
+
+    # Фильтрация по названию и никнейму автора
+    # Нормализация запроса: первая буква заглавная, остальные — маленькие
+    normalized_query = query.capitalize()
+    if query:
+        exact = queryset.filter(
+            Q(dish_name__icontains=normalized_query)
+            | Q(author__nickname__icontains=normalized_query)
+        )
+        # Нечеткий поиск по триграммам: по запросу (fuzzy=1)
+        # или если точных совпадений нет (опечатка, другая форма слова)
+        fuzzy = fuzzy or not exact.exists()
+        if fuzzy:
+            ids = fuzzy_recipe_ids(query)
+            # Позиция в выдаче — колонка, по ней листает и курсор API
+            queryset = (
+                Recipe.objects.filter(pk__in=ids)
+                .annotate(
+                    relevance=Case(
+                        *[When(pk=pk, then=pos) for pos, pk in enumerate(ids)],
+                        output_field=IntegerField(),
+                    )
+                )
+                .order_by("relevance")
+            )
+        else:
+            queryset = exact
+    else:
+        fuzzy = False
+
+    # Фильтрация по ингредиентам: пересечение ("все") или объединение
+    # ("любой") сжатых множеств id рецептов из индекса в памяти; с запросом
+    # множество сразу сужается до рецептов, найденных по тексту
+    ids = None
+    if ingredient_ids:
+        ids = match_recipes(ingredient_ids, match_all=not match_any)
+        if query:
+            ids = within(ids, queryset)
+
+    return queryset, fuzzy, ids
+
+
+def limit_matches(queryset, ids, category_id=None):
+    """Итоговая выдача: фильтр по категории и не больше MATCH_LIMIT самых
+    новых совпадений по ингредиентам. Ограничивается только результат:
+    все фильтры применены к id до него"""
+    if category_id is not None:
+        queryset = queryset.filter(category__id=category_id)
+        if ids is not None:
+            ids = within(ids, queryset)
+    if ids is not None:
+        queryset = queryset.filter(pk__in=newest(ids))
+    return queryset
+
+
+def search_recipes(
+    query, fuzzy=False, ingredient_ids=(), match_any=False, category_id=None
+):
+    """Рецепты по запросу (название блюда или никнейм автора), ингредиентам
+    и категории. Возвращает (queryset, был ли поиск нечетким); используется
+    JSON API"""
+    queryset, fuzzy, ids = search_matches(query, fuzzy, ingredient_ids, match_any)
+    return limit_matches(queryset, ids, category_id), fuzzy
+
+
+class SearchRecipe(ConditionalGetMixin, ListView):
     """Класс поиска рецептов"""
 
     model = Recipe
@@ -74,42 +212,67 @@ class SearchRecipe(ListView):
     def get_queryset(self):
         """Функция возвращает queryset рецептов, отфильтрованных по
         названию блюда, никнейму автора  и категории (выбор через sidebar)"""
-        queryset = Recipe.objects.all().order_by("-created_at")
-
         # Получение данных из GET-запроса
         query = self.request.GET.get(
             "q", ""
         ).strip()  # Удаление пробелов в поисковом запросе
         category_id = self.request.GET.get("category")
+        self.selected_ingredients = sorted(
+            {int(pk) for pk in self.request.GET.getlist("ingredient") if pk.isdigit()}
+        )
+        self.match_any = self.request.GET.get("match") == "any"
 
-        # Фильтрация по названию и никнейму автора
         # Нормализация запроса: первая буква заглавная, остальные — маленькие
-        if query:
-            normalized_query = query.capitalize()
+        normalized_query = query.capitalize()
+        queryset, self.fuzzy, ids = search_matches(
+            query,
+            self.request.GET.get("fuzzy") == "1",
+            self.selected_ingredients,
+            self.match_any,
+        )
 
-            queryset = queryset.filter(
-                Q(dish_name__icontains=normalized_query)
-                | Q(author__nickname__icontains=normalized_query)
-            )
+        # Счетчики по категориям кэшируются по нормализованному запросу;
+        # по ингредиентам — по всем совпадениям, а не по ограниченной выдаче
+        self.facets = category_facets(
+            queryset,
+            "search",
+            " ".join(normalized_query.split()),
+            self.fuzzy,
+            self.selected_ingredients,
+            self.match_any,
+            counts=None if ids is None else lambda: category_counts(ids),
+        )
 
         # Фильтрация по категории
-        if category_id:
-            queryset = queryset.filter(category__id=category_id)
-
-        return queryset
+        return limit_matches(queryset, ids, category_id or None)
 
     def get_context_data(self, **kwargs):
         """Добавление в контекст всех категорий, поисковой запрос
         и выбранную категорию"""
         context = super().get_context_data(**kwargs)
-        context["categories"] = Category.objects.all()
+        context["categories"] = self.facets
         context["search_query"] = self.request.GET.get("q", "")
         context["selected_category"] = self.request.GET.get("category", "")
+        context["fuzzy"] = self.fuzzy
+        context["ingredients"] = ingredient_counts()
+        context["selected_ingredients"] = self.selected_ingredients
+        context["match_any"] = self.match_any
+        annotate_recipes(self.request.user, context["recipes"])
 
         return context
 
 
-class CreateRecipe(LoginRequiredMixin, CreateView):
+class UploadFormMixin:
+    """Форма узнает причину отказа и для оборванной загрузки (app/uploads.py)"""
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        if "files" in kwargs:
+            kwargs["files"] = request_files(self.request)
+        return kwargs
+
+
+class CreateRecipe(LoginRequiredMixin, UploadFormMixin, CreateView):
     """Создание рецепта авторизованным пользователем"""
 
     model = Recipe
@@ -125,7 +288,9 @@ class CreateRecipe(LoginRequiredMixin, CreateView):
         return reverse_lazy("recipe_detail", kwargs={"pk": self.object.pk})
 
 
-class UpdateRecipe(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class UpdateRecipe(
+    LoginRequiredMixin, UserPassesTestMixin, UploadFormMixin, UpdateView
+):
     """Редактирование рецепта только его автором"""
 
     model = Recipe
@@ -178,33 +343,48 @@ class DeleteRecipe(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
 def recipe(request, pk):
     """Конкретный рецепт; авторизованные пользователи
-    видят свою оценку рецепта"""
+    видят свою оценку рецепта. Страница рендерится заново, только если
+    изменились рецепт, похожие рецепты или состояние зрителя"""
+    response = conditional_page(
+        request,
+        [recipe_scope(pk), SIMILAR],
+        lambda: render_recipe(request, pk),
+        request.META.get("HTTP_REFERER", ""),  # Ссылка "назад" на странице
+    )
+    if response.status_code == 304:
+        track_view(request, pk)  # Просмотр из кэша браузера тоже учитывается
+    return response
+
+
+def render_recipe(request, pk):
     recipe = get_object_or_404(Recipe, pk=pk)  # Безопасное извлечение объекта
 
-    user_rating = None
-    is_favorite = False
+    # Счетчик просмотров в Redis, без записи в БД
+    track_view(request, recipe.pk)
 
-    # Провека авторизациид для показа оценки
-    if request.user.is_authenticated:
-        try:
-            rating_obj = RecipeRating.objects.get(user=request.user, recipe=recipe)
-            user_rating = int(rating_obj.rating) if rating_obj else None
-        except RecipeRating.DoesNotExist:
-            pass
+    # Оценка пользователя и факт сохранения в Избранном — из Redis, без запросов к БД
+    state = user_state(request.user, [recipe.pk])[recipe.pk]
 
-        # Проверка факта сохранения в Избранном
-        is_favorite = Favorite.objects.filter(user=request.user, recipe=recipe).exists()
+    # Похожие рецепты (пересчитываются офлайн) — один запрос по индексу
+    similar_recipes = [
+        link.similar
+        for link in SimilarRecipe.objects.filter(recipe=recipe)
+        .select_related("similar")
+        .order_by("rank")[:4]
+    ]
 
     context = {
         "recipe": recipe,
-        "user_rating": user_rating,  # Оценка текущего пользователя
-        "is_favorite": is_favorite,  # Передача в шаблон
+        "user_rating": state["user_rating"],  # Оценка текущего пользователя
+        "is_favorite": state["is_favorite"],  # Передача в шаблон
+        "similar_recipes": similar_recipes,
     }
 
     return render(request, "recipe.html", context)
 
 
 @login_required
+@rate_limit("rate_recipe", "30/m")
 def rate_recipe(request, pk):
     """Обработка оценки рецепта авторизованным пользователем;
     функция создает или обновляет оценку"""
@@ -223,12 +403,14 @@ def rate_recipe(request, pk):
     rating_obj, created = RecipeRating.objects.update_or_create(
         user=request.user, recipe=recipe, defaults={"rating": rating_value}
     )
+    set_rating(request.user.pk, recipe.pk, rating_value)
 
     # Перенаправление на страницу рецепта
     return redirect("recipe_detail", pk=recipe.pk)
 
 
 @login_required
+@rate_limit("add_to_favorites", "30/m")
 def add_to_favorites(request, pk):
     """Обработка AJAX-запроса для добавления/удаления рецепта из избранного
     с проверкой на авторизованность и авторство"""
@@ -247,13 +429,15 @@ def add_to_favorites(request, pk):
 
     if not created:
         favorite.delete()  # Удаление из избранного, если ранее добавлен
+        set_favorite(request.user.pk, recipe.pk, False)
         return JsonResponse({"status": "removed"})
     else:
         # Добавлен в избранное
+        set_favorite(request.user.pk, recipe.pk, True)
         return JsonResponse({"status": "added"})
 
 
-class UserProfileView(DetailView):
+class UserProfileView(ConditionalGetMixin, DetailView):
     """Публичный профиль пользователя с возможностью
     фильтрации опубликованных рецептов по категориям"""
 
@@ -261,6 +445,9 @@ class UserProfileView(DetailView):
     template_name = "user_profile.html"
     context_object_name = "user"
 
+    def get_etag_scopes(self):
+        return [author_scope(self.kwargs["pk"]), CATEGORIES]
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
@@ -275,15 +462,19 @@ class UserProfileView(DetailView):
         else:
             context["current_category"] = None
 
-        context["recipes"] = recipes_qs
+        context["recipes"] = annotate_recipes(self.request.user, recipes_qs)
 
-        # Список всех категорий (sidbar)
-        context["categories"] = Category.objects.all()
+        # Список всех категорий с количеством рецептов автора (sidbar)
+        context["categories"] = category_facets(
+            Recipe.objects.filter(author=self.object), "profile", self.object.pk
+        )
 
         return context
 
 
-class ProfileUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class ProfileUpdateView(
+    LoginRequiredMixin, UserPassesTestMixin, UploadFormMixin, UpdateView
+):
     """Редактирования профиля в ЛК;
     доступно только владельцу аккаунта, никнейм неизменяем"""
 
@@ -312,7 +503,7 @@ class ProfileUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         """Обработка удаления аватара, если нажата кнопка 'Удалить аватар'"""
         response = super().form_valid(form)
         if self.request.POST.get("delete_avatar") == "1":
-            self.object.avatar.delete(save=False)  # удалить файл с диска
+            # Файл удалит очередь (см. app/media.py), если он больше не нужен
             self.object.avatar = None  # сохранение в базе как None
             self.object.save()
         return response
@@ -351,9 +542,11 @@ def profile_view(request, nickname):
 
 @login_required
 def delete_account(request):
-    """Удаление аккаунта через POST-запрос, AJAX не перегружает страницу"""
+    """Удаление аккаунта через POST-запрос, AJAX не перегружает страницу.
+    Аккаунт деактивируется сразу, рецепты и остальные данные удаляются в фоне"""
     if request.method == "POST" and request.user.is_authenticated:
-        request.user.delete()
+        deactivate(request.user)
+        logout(request)
         return JsonResponse({"success": True})
     return JsonResponse({"success": False}, status=400)
 
@@ -382,6 +575,7 @@ class FavoritesListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         queryset = Recipe.objects.filter(favorite__user=profile_user).order_by(
             "-favorite__created_at"
         )
+        self.facets = category_facets(queryset, "favorites", profile_user.pk)
 
         # Фильтрацию по категориям через GET-запрос
         category_id = self.request.GET.get("category")
@@ -396,7 +590,7 @@ class FavoritesListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         nickname = self.kwargs.get("nickname")
         profile_user = get_object_or_404(User, nickname=nickname)
 
-        context["categories"] = Category.objects.all()
+        context["categories"] = self.facets
         context["profile_user"] = profile_user
         return context
 
@@ -423,6 +617,7 @@ class MyRecipesListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
 
         # Все опубликованные рецепты
         queryset = Recipe.objects.filter(author=profile_user).order_by("-created_at")
+        self.facets = category_facets(queryset, "my_recipes", profile_user.pk)
 
         # Фильтрацию по категориям через GET-запрос
         category_id = self.request.GET.get("category")
@@ -437,7 +632,7 @@ class MyRecipesListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
         nickname = self.kwargs.get("nickname")
         profile_user = get_object_or_404(User, nickname=nickname)
 
-        context["categories"] = Category.objects.all()
+        context["categories"] = self.facets
         context["profile_user"] = profile_user
         return context
 
@@ -496,12 +691,9 @@ def delete_verification_data(email):
     """Удаление данных и кода после успешной верификации или истечения сроков"""
     data = cache.get(f"form:{email}")
 
-    # Удаление временного аватара
+    # Временный аватар удаляется в фоне (см. app/media.py)
     if data and "avatar_path" in data:
-        try:
-            default_storage.delete(data["avatar_path"])
-        except Exception as e:
-            print(f"Ошибка при удалении временного аватара: {e}")
+        enqueue_media([data["avatar_path"]])
 
     cache.delete(f"form:{email}")
     cache.delete(f"code:{email}")
@@ -515,20 +707,21 @@ class SignUpView(View):
         return render(request, "auth/signup.html", {"form": form})
 
     def post(self, request):
-        form = SignUpForm(request.POST, request.FILES)
+        form = SignUpForm(request.POST, request_files(request))
         if form.is_valid():
             email = form.cleaned_data["email"]
 
             # Генерация кода и сохранение данных формы в Redis
             code = save_verification_data(email, form.cleaned_data)
 
-            send_mail(
-                subject="Подтверждение регистрации",
-                message=f"Ваш код подтверждения: {code}."
-                f" Код действителен в течение 5 минут.",
-                from_email="noreply@recipesite.com",
-                recipient_list=[email],
-            )
+            with count_emails("verification"):
+                send_mail(
+                    subject="Подтверждение регистрации",
+                    message=f"Ваш код подтверждения: {code}."
+                    f" Код действителен в течение 5 минут.",
+                    from_email="noreply@recipesite.com",
+                    recipient_list=[email],
+                )
 
             messages.info(request, "Код подтверждения был отправлен на ваш email.")
             return redirect("verify_email", email=email)
@@ -551,14 +744,9 @@ class VerifyEmailView(View):
         )  # Получение кода и данных из Redis
 
         # Проверка наличия формы
+        # Временный аватар просроченной формы удаляет sweep_media (файлы tmp/
+        # старше TMP_TTL): пути из запроса верить нельзя
         if not stored_data:
-            avatar_path = request.POST.get("avatar_path")
-            if avatar_path:
-                try:
-                    default_storage.delete(avatar_path)
-                except Exception as e:
-                    print(f"Ошибка при удалении временного аватара: {e}")
-
             return JsonResponse(
                 {
                     "success": False,
@@ -597,6 +785,7 @@ class VerifyEmailView(View):
         return JsonResponse({"success": True})
 
 
+@method_decorator(rate_limit("resend_code", "5/h"), name="post")
 class ResendCodeView(View):
     """Повторная отправка кода подтверждения по истечении 5 минут"""
 
@@ -614,13 +803,14 @@ class ResendCodeView(View):
         # Генерация нового кода и обновления Redis (форма остается)
         code = save_verification_data(email, form_data["form_data"], code_expiry=300)
 
-        send_mail(
-            subject="Подтверждение регистрации",
-            message=f"Ваш код подтверждения: {code}."
-            f" Код действителен в течение 5 минут.",
-            from_email="noreply@recipesite.com",
-            recipient_list=[email],
-        )
+        with count_emails("verification"):
+            send_mail(
+                subject="Подтверждение регистрации",
+                message=f"Ваш код подтверждения: {code}."
+                f" Код действителен в течение 5 минут.",
+                from_email="noreply@recipesite.com",
+                recipient_list=[email],
+            )
 
         return JsonResponse(
             {
@@ -630,19 +820,39 @@ class ResendCodeView(View):
         )
 
 
+def autocomplete_view(request):
+    """Подсказки при вводе поискового запроса: блюда, авторы и категории.
+    Отвечает из префиксного индекса в Redis, без запросов к БД"""
+    urls = {
+        "r": lambda pk: reverse("recipe_detail", args=[pk]),
+        "u": lambda pk: reverse("user_profile", args=[pk]),
+        "c": lambda pk: f"{reverse('recipe_search')}?category={pk}",
+    }
+    kinds = {"r": "recipe", "u": "author", "c": "category"}
+
+    results = []
+    for member, label in suggest(request.GET.get("q", "")):
+        kind, pk = member.split(":")
+        results.append({"type": kinds[kind], "label": label, "url": urls[kind](pk)})
+    return JsonResponse({"results": results})
+
+
 # Вьюхи для проверки уникальности никнейма и email-а на фронте
+@rate_limit("check_nickname", "60/m", methods=("GET",))
 def check_nickname(request):
     nickname = request.GET.get("nickname", "").strip()
     exists = User.objects.filter(nickname__iexact=nickname).exists()
     return JsonResponse({"exists": exists})
 
 
+@rate_limit("check_email", "60/m", methods=("GET",))
 def check_email(request):
     email = request.GET.get("email", "").strip()
     exists = User.objects.filter(email__iexact=email).exists()
     return JsonResponse({"exists": exists})
 
 
+@method_decorator(rate_limit("password_reset", "5/h"), name="post")
 class CustomPasswordResetView(PasswordResetView):
     """Отправка ссылки на сброс пароля"""
 
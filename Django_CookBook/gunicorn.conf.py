@@ -0,0 +1,38 @@
+import glob
+import os
+
+from prometheus_client import multiprocess
+
+# Запуск: PROMETHEUS_MULTIPROC_DIR=/tmp/cookbook-metrics \
+#   gunicorn -c gunicorn.conf.py Django_CookBook.wsgi
+# Воркеры пишут метрики в общий каталог, /metrics их суммирует
+# (см. app/metrics.py)
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+# Приложение загружается и прогревается в мастере один раз (when_ready),
+# воркеры получают его готовым при fork
+preload_app = True
+
+METRICS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if METRICS_DIR:
+    # Каталог нужен уже при загрузке приложения в мастере
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+
+def on_starting(server):
+    """Очистка каталога метрик от прошлого запуска"""
+    if METRICS_DIR:
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.db")):
+            os.remove(path)
+
+
+def when_ready(server):
+    """Прогрев мастера до запуска воркеров: URL, шаблоны, тяжелые модули
+    (см. app/startup.py)"""
+    from app.startup import warm_up
+
+    warm_up()
+
+
+def child_exit(server, worker):
+    """Значения завершившегося воркера остаются в сумме счетчиков"""
+    multiprocess.mark_process_dead(worker.pid)